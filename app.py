@@ -1,9 +1,27 @@
+import sys
 
-import os, re, json, uuid, subprocess, threading, queue, time, argparse, sys, warnings
+# Modo --serve: sockets, hilos y subprocesos cooperativos (gevent), antes de importar lo demás.
+# Los procesos de transcripción (spawn) reimportan este archivo como __mp_main__: ahí no se parchea
+GEVENT_ACTIVE = False
+HUB_THREAD_ID = None
+if '--serve' in sys.argv and __name__ == '__main__':
+    try:
+        from gevent import monkey
+        import _thread
+        HUB_THREAD_ID = _thread.get_ident()  # el hub corre en el hilo principal
+        monkey.patch_all()
+        GEVENT_ACTIVE = True
+    except ImportError:
+        pass  # serve() informa que falta gevent
+
+import os, re, json, uuid, subprocess, threading, time, argparse, warnings, shutil, heapq, io, hashlib, contextvars, functools
 from datetime import datetime, timedelta
+from collections import deque, OrderedDict
+from contextlib import nullcontext
 from pathlib import Path
 from flask import Flask, render_template, request, send_file, abort, Response, jsonify, url_for
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import ClientDisconnected
 
 # Suprimir warning específico de Whisper sobre FP16/FP32
 warnings.filterwarnings("ignore", message="FP16 is not supported on CPU; using FP32 instead")
@@ -32,7 +50,11 @@ except ImportError:
     GoogleTranslator = None
 
 ALLOWED_EXTENSIONS = {'.mp4', '.mov', '.mkv', '.avi', '.wmv', '.flv', '.webm', '.m4v'}
+TARGET_FORMATS = ['mp4', 'webm', 'avi', 'mkv', 'mp3', 'srt', 'hls']
+# Formatos que --multi / 'formats' pueden combinar en una sola pasada (HLS ya es su propia escalera)
+MULTI_FORMATS = [f for f in TARGET_FORMATS if f != 'hls']
 MAX_CONTENT_LENGTH = 2 * 1024 * 1024 * 1024  # 2GB
+CACHE_FOLDER = os.environ.get('CONVERTER_CACHE_DIR', os.path.join(os.getcwd(), 'cache'))
 
 def print_whisper_info():
     """Muestra información sobre la configuración de Whisper"""
@@ -45,44 +67,228 @@ def print_whisper_info():
     else:
         print("❌ Whisper no disponible. Instala con: pip install openai-whisper")
 
-def get_audio_info(audio_path: str):
-    """Obtiene información del archivo de audio"""
+# Segundos del inicio que se leen (solo demux, sin decodificar) para medir el intervalo entre keyframes
+PROBE_KEYFRAME_SECONDS = float(os.environ.get('PROBE_KEYFRAME_SECONDS', '30'))
+MEDIA_INFO_CACHE_SIZE = int(os.environ.get('MEDIA_INFO_CACHE_SIZE', '256'))
+# A partir de aquí se avisa de que transcribir/convertir puede tardar mucho
+LARGE_FILE_MB = float(os.environ.get('LARGE_FILE_MB', '100'))
+
+class MediaInfo:
+    """
+    Descripción de un archivo multimedia sacada de un único ffprobe: formato, streams, códecs,
+    duración, bitrate, intervalo entre keyframes y disposición del audio. La crea probe_media,
+    que la memoriza por ruta/tamaño/mtime; se serializa con .data para pasarla a otro proceso.
+    Un archivo que ffprobe no pudo leer da una MediaInfo vacía (duración 0, sin streams).
+    """
+
+    def __init__(self, path: str, data: dict = None):
+        self.path = path
+        self.data = data or {}
+        fmt = self.data.get('format', {})
+        self.streams = self.data.get('streams', [])
+        self.duration = _to_float(fmt.get('duration'))
+        self.bit_rate = int(_to_float(fmt.get('bit_rate')))
+        self.size = int(_to_float(fmt.get('size')))
+        self.format_name = fmt.get('format_name')
+        # Intervalo medio entre keyframes del video (None si no se midió)
+        self.keyframe_interval = self.data.get('keyframe_interval')
+        # Las carátulas (attached_pic) aparecen como video pero no lo son
+        self.video = next((st for st in self.streams if st.get('codec_type') == 'video'
+                           and not st.get('disposition', {}).get('attached_pic')), None)
+        self.audio = next((st for st in self.streams if st.get('codec_type') == 'audio'), None)
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.data.get('format') or self.streams)
+
+    @property
+    def has_video(self) -> bool:
+        return self.video is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio is not None
+
+    @property
+    def height(self):
+        return (self.video or {}).get('height')
+
+    @property
+    def width(self):
+        return (self.video or {}).get('width')
+
+    @property
+    def fps(self) -> float:
+        num, _, den = (self.video or {}).get('avg_frame_rate', '0/0').partition('/')
+        return _to_float(num) / _to_float(den) if _to_float(den) else 0.0
+
+    @property
+    def video_codec(self):
+        return (self.video or {}).get('codec_name')
+
+    @property
+    def audio_codec(self):
+        return (self.audio or {}).get('codec_name')
+
+    @property
+    def sample_rate(self) -> int:
+        return int(_to_float((self.audio or {}).get('sample_rate')))
+
+    @property
+    def channels(self) -> int:
+        return int((self.audio or {}).get('channels') or 0)
+
+    @property
+    def channel_layout(self):
+        return (self.audio or {}).get('channel_layout')
+
+    @property
+    def size_mb(self) -> float:
+        return self.size / (1024 * 1024)
+
+    @property
+    def is_large(self) -> bool:
+        return self.size_mb > LARGE_FILE_MB
+
+    def describe(self) -> str:
+        """Resumen de una línea para los logs"""
+        parts = [f"{self.duration:.1f}s"]
+        if self.has_video:
+            parts.append(f"video {self.video_codec} {self.width}x{self.height}"
+                         + (f" {self.fps:.2f}fps" if self.fps else "")
+                         + (f" GOP {self.keyframe_interval:.1f}s" if self.keyframe_interval else ""))
+        if self.has_audio:
+            parts.append(f"audio {self.audio_codec} {self.sample_rate} Hz {self.channel_layout or f'{self.channels}ch'}")
+        if self.bit_rate:
+            parts.append(f"{self.bit_rate // 1000} kbps")
+        return " | ".join(parts)
+
+def _to_float(value) -> float:
     try:
-        import subprocess
-        cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', '-show_streams', audio_path]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        info = json.loads(result.stdout)
-        
-        # Buscar stream de audio
-        audio_stream = None
-        for stream in info.get('streams', []):
-            if stream.get('codec_type') == 'audio':
-                audio_stream = stream
-                break
-        
-        if audio_stream:
-            duration = float(info.get('format', {}).get('duration', 0))
-            bitrate = int(info.get('format', {}).get('bit_rate', 0))
-            sample_rate = int(audio_stream.get('sample_rate', 0))
-            channels = int(audio_stream.get('channels', 0))
-            
-            print(f"📊 Información del audio:")
-            print(f"   ⏱️  Duración: {duration:.1f} segundos ({duration/60:.1f} minutos)")
-            print(f"   🎛️  Bitrate: {bitrate//1000} kbps")
-            print(f"   📻 Sample rate: {sample_rate} Hz")
-            print(f"   🔊 Canales: {channels}")
-            
-            # Estimación de tiempo de procesamiento
-            if duration > 0:
-                # Whisper procesa aprox 10-20x más lento que tiempo real en CPU
-                multiplier = 15 if DEVICE == "cpu" else 5  # GPU es más rápida
-                estimated_time = duration * multiplier
-                print(f"   ⏰ Tiempo estimado: {estimated_time/60:.1f} minutos")
-            
-            return duration
-    except Exception as e:
-        print(f"⚠️  No se pudo obtener info del audio: {e}")
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def keyframe_interval(packets: list, video_index) -> float:
+    """Separación media entre keyframes a partir de los paquetes de video (flags con 'K')"""
+    times = [_to_float(p.get('pts_time')) for p in packets
+             if p.get('stream_index') == video_index and 'K' in (p.get('flags') or '') and p.get('pts_time') not in (None, 'N/A')]
+    if len(times) < 2:
         return None
+    return round((times[-1] - times[0]) / (len(times) - 1), 3)
+
+class MediaProbeCache:
+    """
+    probe_media: un ffprobe por archivo (formato, streams y los paquetes de los primeros
+    PROBE_KEYFRAME_SECONDS para el intervalo de keyframes), memorizado por ruta, tamaño y mtime
+    para que todas las decisiones de un job (porcentaje, stream copy, HLS, segmentado, avisos)
+    lean el mismo resultado. LRU limitada a MEDIA_INFO_CACHE_SIZE entradas.
+    """
+
+    def __init__(self, max_entries: int = MEDIA_INFO_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def _key(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+    def __call__(self, path: str) -> MediaInfo:
+        key = self._key(path)
+        if key is not None:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return MediaInfo(path, self._entries[key])
+        info = MediaInfo(path, self._probe(path))
+        if key is not None and info.ok:
+            self._remember(key, info.data)
+        return info
+
+    def seed(self, path: str, data: dict):
+        """Registra un resultado ya conocido (p. ej. sondeado por otro proceso y guardado en el job)"""
+        key = self._key(path)
+        if key is not None and data:
+            self._remember(key, data)
+
+    def _remember(self, key, data: dict):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _probe(self, path: str) -> dict:
+        with self._lock:
+            self.stats['misses'] += 1
+        cmd = ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams',
+               '-show_entries', 'packet=stream_index,pts_time,flags',
+               '-read_intervals', f'%+{PROBE_KEYFRAME_SECONDS:g}', path]
+        try:
+            with metrics.stage('probe'):
+                out = subprocess.check_output(cmd, stderr=subprocess.DEVNULL, text=True)
+            raw = json.loads(out or '{}')
+        except Exception:
+            return {}
+        # Los paquetes solo sirven para medir el GOP: no se guardan
+        packets = raw.pop('packets', [])
+        video = MediaInfo(path, raw).video
+        if video is not None:
+            raw['keyframe_interval'] = keyframe_interval(packets, video.get('index'))
+        return raw
+
+probe_media = MediaProbeCache()
+
+def get_audio_info(audio_path: str):
+    """Muestra información del archivo (del sondeo compartido) y una estimación del tiempo de transcripción"""
+    info = probe_media(audio_path)
+    if not info.has_audio:
+        print("⚠️  No se pudo obtener info del audio" if not info.ok else "⚠️  El archivo no tiene pista de audio")
+        return None
+
+    duration = info.duration
+    print(f"📊 Información del audio:")
+    print(f"   ⏱️  Duración: {duration:.1f} segundos ({duration/60:.1f} minutos)")
+    print(f"   🎛️  Bitrate: {info.bit_rate//1000} kbps")
+    print(f"   📻 Sample rate: {info.sample_rate} Hz")
+    print(f"   🔊 Canales: {info.channels}" + (f" ({info.channel_layout})" if info.channel_layout else ""))
+
+    # Estimación de tiempo de procesamiento
+    if duration > 0:
+        # Whisper procesa aprox 10-20x más lento que tiempo real en CPU
+        multiplier = 15 if DEVICE == "cpu" else 5  # GPU es más rápida
+        estimated_time = duration * multiplier
+        print(f"   ⏰ Tiempo estimado: {estimated_time/60:.1f} minutos")
+
+    return duration
+
+# Frecuencia de muestreo que espera Whisper
+WHISPER_SAMPLE_RATE = 16000
+
+def load_audio_pcm(media_path: str, sample_rate: int = WHISPER_SAMPLE_RATE):
+    """
+    Decodifica la pista de audio de cualquier video/audio directamente a un buffer float32
+    mono a 16 kHz en memoria (un solo decode con ffmpeg, sin MP3 intermedio en disco)
+    """
+    import numpy as np
+    cmd = ['ffmpeg', '-nostdin', '-hide_banner', '-threads', '0', '-i', media_path,
+           '-vn', '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), '-']
+    metrics.ffmpeg_started()
+    try:
+        with metrics.stage('audio_extract'):
+            out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"No se pudo decodificar el audio: {e.stderr.decode('utf-8', errors='replace').strip()[-300:]}") from e
+    finally:
+        metrics.ffmpeg_finished()
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
 
 def transcribe_with_progress(model, audio_path: str, timeout_minutes=30, **kwargs):
     """Wrapper de transcripción con progreso mejorado y timeout"""
@@ -154,25 +360,2088 @@ def transcribe_with_progress(model, audio_path: str, timeout_minutes=30, **kwarg
     else:
         raise Exception("No se obtuvo resultado de la transcripción")
 
+# Tamaño aproximado en memoria de cada modelo Whisper (MB), usado antes de cargarlo
+WHISPER_MODEL_SIZES_MB = {'tiny': 150, 'base': 300, 'small': 950, 'medium': 3000, 'large': 6000}
+
+def native_lock():
+    """Lock de hilos reales aunque gevent haya parcheado threading (para lo que corre en run_blocking)"""
+    if GEVENT_ACTIVE:
+        from gevent import monkey
+        return monkey.get_original('_thread', 'allocate_lock')()
+    return threading.Lock()
+
+class WhisperModelCache:
+    """
+    Registro de modelos Whisper compartido por todo el proceso.
+    Mantiene los modelos cargados por (tamaño, dispositivo) y expulsa los menos
+    usados recientemente cuando se supera el presupuesto de memoria.
+    Un modelo no admite dos transcripciones a la vez (transcribe instala hooks de kv-cache en
+    el propio modelo): para usarlo hay que tomarlo con use(), que lo presta a un job cada vez.
+    """
+
+    def __init__(self, budget_mb: int):
+        self.budget_mb = budget_mb
+        self._models = {}       # (model_size, device) -> (model, size_mb)
+        self._order = []        # claves de menos a más recientemente usadas
+        # Se toman también desde el threadpool nativo de run_blocking: locks nativos
+        self._lock = native_lock()
+        self._load_locks = {}   # una carga por clave aunque haya varios jobs esperando
+        self._use_locks = {}    # una transcripción por modelo a la vez
+        self._lent = {}         # clave -> jobs que lo usan o esperan con use(); no se expulsan
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'load_time': 0.0}
+
+    def _model_size_mb(self, model, model_size: str) -> float:
+        try:
+            return sum(p.numel() * p.element_size() for p in model.parameters()) / (1024 * 1024)
+        except Exception:
+            return WHISPER_MODEL_SIZES_MB.get(model_size, 1000)
+
+    def _touch(self, key):
+        if key in self._order:
+            self._order.remove(key)
+        self._order.append(key)
+
+    def _evict_for(self, needed_mb: float):
+        # Llamar con self._lock tomado. Los modelos prestados se saltan: expulsarlos no libera su
+        # memoria (el job sigue usándolo) y el próximo get() cargaría una segunda copia.
+        # Si solo quedan prestados, el exceso se corrige cuando use() los devuelve
+        used = sum(size for _, size in self._models.values())
+        evicted = False
+        for key in list(self._order):
+            if used + needed_mb <= self.budget_mb:
+                break
+            if self._lent.get(key):
+                continue
+            self._order.remove(key)
+            _, size = self._models.pop(key)
+            used -= size
+            evicted = True
+            self.stats['evictions'] += 1
+            print(f"♻️  Modelo Whisper liberado de la caché: {key[0]} ({key[1]})")
+        if evicted and torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def get(self, model_size: str, device: str = None):
+        """Devuelve el modelo pedido, cargándolo solo si no está en caché"""
+        if not WHISPER_AVAILABLE:
+            raise Exception("Whisper no disponible. Instala: pip install openai-whisper")
+        key = (model_size, device or DEVICE)
+
+        with self._lock:
+            if key in self._models:
+                self.stats['hits'] += 1
+                self._touch(key)
+                return self._models[key][0]
+            load_lock = self._load_locks.setdefault(key, native_lock())
+
+        with load_lock:
+            # Otro job pudo haberlo cargado mientras esperábamos
+            with self._lock:
+                if key in self._models:
+                    self.stats['hits'] += 1
+                    self._touch(key)
+                    return self._models[key][0]
+                self.stats['misses'] += 1
+                self._evict_for(WHISPER_MODEL_SIZES_MB.get(model_size, 1000))
+
+            start = time.time()
+            model = whisper.load_model(model_size, device=key[1])
+            elapsed = time.time() - start
+
+            metrics.observe_stage('model_load', elapsed, model=model_size)
+            trace_add('model_load', start, start + elapsed, model=model_size)
+            with self._lock:
+                self.stats['load_time'] += elapsed
+                # Ajustar con el tamaño real antes de registrarlo
+                size_mb = self._model_size_mb(model, model_size)
+                self._evict_for(size_mb)
+                self._models[key] = (model, size_mb)
+                self._touch(key)
+            print(f"📦 Modelo Whisper '{model_size}' cargado en {elapsed:.1f}s ({size_mb:.0f} MB)")
+            return model
+
+    def use(self, model_size: str, device: str = None):
+        """
+        Context manager que presta el modelo en exclusiva mientras dura el bloque; otros jobs
+        con el mismo modelo esperan a que se devuelva
+        """
+        cache = self
+        key = (model_size, device or DEVICE)
+        with self._lock:
+            use_lock = self._use_locks.setdefault(key, native_lock())
+
+        class _Use:
+            def __enter__(self):
+                with cache._lock:
+                    cache._lent[key] = cache._lent.get(key, 0) + 1
+                try:
+                    # La espera (y una posible carga) no debe bloquear el hub de gevent
+                    model = run_blocking(cache.get, model_size, key[1])
+                    run_blocking(use_lock.acquire)
+                except BaseException:
+                    self._give_back()
+                    raise
+                return model
+
+            def __exit__(self, *exc):
+                use_lock.release()
+                self._give_back()
+                return False
+
+            def _give_back(self):
+                with cache._lock:
+                    cache._lent[key] -= 1
+                    if not cache._lent[key]:
+                        del cache._lent[key]
+                    cache._evict_for(0)  # lo que no se pudo expulsar mientras estaba prestado
+
+        return _Use()
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._order.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                'loaded': [f"{size}@{dev}" for size, dev in self._order],
+                'used_mb': round(sum(size for _, size in self._models.values()), 1),
+                'budget_mb': self.budget_mb,
+            }
+
+# Presupuesto de RAM para modelos en caché (configurable por variable de entorno)
+whisper_models = WhisperModelCache(int(os.environ.get('WHISPER_CACHE_MB', '4096')))
+
+def load_whisper_model(model_size: str = "base"):
+    """Obtiene un modelo Whisper desde la caché compartida del proceso"""
+    return whisper_models.get(model_size, DEVICE)
+
+# Transcripción long-form: audio largo dividido en silencios y transcrito en varios procesos
+LONG_FORM_MIN_SECONDS = float(os.environ.get('TRANSCRIBE_LONG_FORM_MIN', '1200'))  # 20 minutos
+LONG_FORM_OVERLAP_SECONDS = 2.0
+
+def default_transcribe_workers() -> int:
+    """Procesos de transcripción por defecto: uno en GPU (siempre), varios en CPU según núcleos"""
+    if DEVICE == "cuda":
+        return 1
+    configured = int(os.environ.get('TRANSCRIBE_WORKERS', '0'))
+    if configured > 0:
+        return configured
+    return max(1, min(4, (os.cpu_count() or 1) // 4))
+
+def find_silence_cuts(audio, chunk_seconds: float, search_seconds: float = 30.0,
+                      sample_rate: int = WHISPER_SAMPLE_RATE) -> list:
+    """
+    Devuelve los índices de muestra donde cortar el audio: cerca de cada múltiplo de
+    chunk_seconds, en el tramo de menor energía (silencio) dentro de ±search_seconds
+    """
+    import numpy as np
+    frame = sample_rate // 10  # tramas de 100 ms
+    n_frames = len(audio) // frame
+    cuts = [0]
+    if n_frames == 0:
+        return [0, len(audio)]
+    energy = np.sqrt((audio[:n_frames * frame].reshape(n_frames, frame) ** 2).mean(axis=1))
+    # Suavizar ~0.5 s para preferir silencios sostenidos en vez de picos sueltos
+    energy = np.convolve(energy, np.ones(5) / 5, mode='same')
+
+    target = int(chunk_seconds * 10)
+    search = int(search_seconds * 10)
+    pos = 0
+    while n_frames - pos > target + search:
+        lo = pos + target - search
+        hi = min(n_frames, pos + target + search)
+        pos = lo + int(np.argmin(energy[lo:hi]))
+        cuts.append(pos * frame)
+    cuts.append(len(audio))
+    return cuts
+
+def _init_transcription_worker(threads: int):
+    # Repartir los núcleos entre procesos para que no compitan entre sí
+    if torch is not None:
+        torch.set_num_threads(max(1, threads))
+
+def _transcribe_chunk(task: dict) -> dict:
+    """Transcribe un fragmento en un proceso worker y devuelve sus segmentos en tiempo absoluto"""
+    with whisper_models.use(task['model_size'], task['device']) as model:
+        result = model.transcribe(task['audio'], **task['options'])
+    offset = task['offset']
+    owned_start, owned_end = task['owned']
+
+    segments = []
+    for segment in result['segments']:
+        start = segment['start'] + offset
+        end = segment['end'] + offset
+        # Cada segmento pertenece al fragmento que contiene su punto medio (descarta el solape)
+        if not (owned_start <= (start + end) / 2 < owned_end):
+            continue
+        segment = dict(segment, start=start, end=end)
+        if segment.get('words'):
+            segment['words'] = [dict(w, start=w['start'] + offset, end=w['end'] + offset) for w in segment['words']]
+        segments.append(segment)
+    return {'index': task['index'], 'language': result.get('language'), 'segments': segments}
+
+def transcribe_long_form(audio, model_size: str = "base", workers: int = None, on_progress=None, **options) -> dict:
+    """
+    Divide el audio en ventanas solapadas cortadas en silencios, las transcribe en paralelo
+    en un pool de procesos y une los segmentos con timestamps corregidos.
+    Devuelve un dict con la misma forma que model.transcribe ('text', 'segments', 'language').
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from collections import Counter
+
+    # Varios procesos con su propia copia del modelo no caben en una GPU
+    workers = 1 if DEVICE == "cuda" else (workers or default_transcribe_workers())
+    sr = WHISPER_SAMPLE_RATE
+    duration = len(audio) / sr
+    # Al menos dos fragmentos por worker para repartir bien la carga
+    chunk_seconds = max(60.0, min(600.0, duration / (workers * 2)))
+    cuts = find_silence_cuts(audio, chunk_seconds)
+    overlap = int(LONG_FORM_OVERLAP_SECONDS * sr)
+
+    tasks = []
+    for i in range(len(cuts) - 1):
+        start = max(0, cuts[i] - overlap)
+        end = min(len(audio), cuts[i + 1] + overlap)
+        tasks.append({
+            'index': i,
+            'model_size': model_size,
+            'device': DEVICE,
+            'audio': audio[start:end],
+            'offset': start / sr,
+            'owned': (cuts[i] / sr, cuts[i + 1] / sr if i + 1 < len(cuts) - 1 else float('inf')),
+            'options': options,
+        })
+
+    print(f"🧩 Transcripción long-form: {len(tasks)} fragmentos en {workers} procesos")
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    results = []
+    # spawn y no fork: este proceso tiene hilos (worker, gevent, traducción) y quizás CUDA iniciado,
+    # y un fork copiaría locks tomados por otros hilos y un contexto CUDA inutilizable
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_transcription_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(_transcribe_chunk, task) for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            results.append(future.result())
+            print(f"   🧩 Fragmento {done}/{len(tasks)} transcrito")
+            if on_progress:
+                on_progress(done, len(tasks))
+
+    results.sort(key=lambda r: r['index'])
+    segments = []
+    for r in results:
+        segments.extend(r['segments'])
+    for i, segment in enumerate(segments):
+        segment['id'] = i
+    languages = Counter(r['language'] for r in results if r['language'])
+    return {
+        'text': ''.join(s['text'] for s in segments),
+        'segments': segments,
+        'language': languages.most_common(1)[0][0] if languages else None,
+    }
+
+def use_long_form(audio, workers: int = None) -> bool:
+    """Indica si conviene el modo long-form para este audio (nunca en GPU: un solo proceso)"""
+    workers = 1 if DEVICE == "cuda" else (workers or default_transcribe_workers())
+    return workers > 1 and len(audio) / WHISPER_SAMPLE_RATE >= LONG_FORM_MIN_SECONDS
+
+class TranscriptionCache:
+    """
+    Caché en disco de resultados crudos de Whisper, indexada por el hash del audio decodificado,
+    el modelo y las opciones de decodificación. Permite regenerar SRT (o traducirlos) sin transcribir.
+    """
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def key(audio, model_size: str, **options) -> str:
+        import numpy as np
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(audio))
+        h.update(json.dumps([model_size, options], sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key: str):
+        if self.max_bytes <= 0:
+            return None
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                self.stats['misses'] += 1
+                return None
+            os.utime(path)
+            self.stats['hits'] += 1
+            return result
+
+    def put(self, key: str, result: dict):
+        if self.max_bytes <= 0:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(key)
+        with self._lock:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                # Whisper puede devolver escalares numpy; .item() los pasa a tipos nativos
+                json.dump(result, f, ensure_ascii=False, default=lambda o: o.item() if hasattr(o, 'item') else str(o))
+            os.replace(tmp_path, path)
+            self.stats['stores'] += 1
+            self.stats['evictions'] += evict_lru_files(self.folder, self.max_bytes)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+transcription_cache = TranscriptionCache(os.path.join(CACHE_FOLDER, 'transcriptions'),
+                                         int(os.environ.get('TRANSCRIPTION_CACHE_MB', '1024')) * 1024 * 1024)
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    Ejecuta trabajo de CPU largo (cargar Whisper, transcribir) en un hilo nativo cuando el
+    servidor corre con gevent, para no congelar los streams SSE del proceso. Sin gevent (o si
+    ya se está en un hilo nativo), llama a fn.
+    """
+    if not GEVENT_ACTIVE:
+        return fn(*args, **kwargs)
+    import gevent
+    from gevent import monkey
+    if monkey.get_original('_thread', 'get_ident')() != HUB_THREAD_ID:
+        return fn(*args, **kwargs)
+    # El hilo nativo no hereda los contextvars del greenlet (p. ej. la traza activa del job)
+    return gevent.get_hub().threadpool.apply(contextvars.copy_context().run, (fn, *args), kwargs)
+
+def off_hub(method):
+    """
+    Método que puede bloquear en E/S sin ceder (SQLite espera hasta 30 s por el lock de la
+    base): con gevent corre en el threadpool nativo en vez de congelar el hub del proceso.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        return run_blocking(method, *args, **kwargs)
+    return wrapper
+
+def hub_callback(fn):
+    """Adapta un callback invocado desde el hilo nativo de run_blocking para que corra en el bucle de gevent"""
+    if fn is None or not GEVENT_ACTIVE:
+        return fn
+    import gevent
+    loop = gevent.get_hub().loop
+    return lambda *args: loop.run_callback_threadsafe(fn, *args)
+
+def transcribe_audio(audio, model_size: str = "base", workers: int = None, on_progress=None,
+                     show_progress: bool = False, log=print, **options) -> dict:
+    """
+    Transcribe un buffer PCM: primero consulta la caché de transcripciones y, si no está,
+    elige entre el modo normal y el long-form en paralelo. Guarda el resultado en caché.
+    """
+    long_form = use_long_form(audio, workers)
+    cache_key = transcription_cache.key(audio, model_size, long_form=long_form, **options)
+    result = transcription_cache.get(cache_key)
+    if result is not None:
+        log("♻️  Transcripción encontrada en caché")
+        return result
+
+    if long_form:
+        log(f"🧩 Audio largo: transcribiendo fragmentos en paralelo ({model_size})...")
+        with metrics.stage('transcribe', model=model_size) as stage:
+            result = run_blocking(transcribe_long_form, audio, model_size, workers,
+                                  on_progress=hub_callback(on_progress), **options)
+    else:
+        log(f"🤖 Cargando modelo Whisper ({model_size}) en {DEVICE.upper()}...")
+        run_blocking(load_whisper_model, model_size)
+        # Prestado en exclusiva: dos transcripciones en el mismo modelo se pisan los hooks de kv-cache
+        with whisper_models.use(model_size) as model:
+            log("🎵 Iniciando transcripción...")
+            with metrics.stage('transcribe', model=model_size) as stage:
+                if show_progress:
+                    result = transcribe_with_progress(model, audio, **options)
+                else:
+                    result = run_blocking(model.transcribe, audio, **options)
+    metrics.observe_realtime('transcribe', len(audio) / WHISPER_SAMPLE_RATE, stage.elapsed, model=model_size)
+
+    transcription_cache.put(cache_key, result)
+    return result
+
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
-app.config['CONVERTED_FOLDER'] = os.path.join(os.getcwd(), 'converted')
+# Con workers en otras máquinas, estas carpetas deben estar en almacenamiento compartido
+app.config['UPLOAD_FOLDER'] = os.environ.get('CONVERTER_UPLOAD_DIR', os.path.join(os.getcwd(), 'uploads'))
+app.config['CONVERTED_FOLDER'] = os.environ.get('CONVERTER_OUTPUT_DIR', os.path.join(os.getcwd(), 'converted'))
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 app.secret_key = 'change-me'
 
 jobs = {}  # job_id -> dict
+RAW_LOG_MAX_LINES = 2000  # líneas de log crudo de ffmpeg que se conservan por job
+JOB_EVENT_BUFFER = int(os.environ.get('JOB_EVENT_BUFFER', '1000'))  # eventos de log por job
+
+class JobEvents:
+    """
+    Bus de eventos de un job: ring buffers acotados (log de la app y log crudo de ffmpeg) con
+    ids crecientes compartidos. Leer no consume, así que varios suscriptores ven lo mismo y un
+    cliente que reconecta retoma desde su Last-Event-ID. publish/notify despiertan a quienes
+    esperan en wait() (también cambios de progreso o estado, que no quedan en el buffer).
+    """
 
+    def __init__(self, job_id: str = None, start_id: int = 0,
+                 maxlen: int = JOB_EVENT_BUFFER, raw_maxlen: int = RAW_LOG_MAX_LINES):
+        self.job_id = job_id  # con id, cada evento se guarda también en JobStore
+        self._events = deque(maxlen=maxlen)
+        self._raw = deque(maxlen=raw_maxlen)
+        self._last_id = start_id
+        self._version = 0
+        self._cond = threading.Condition()
 
-def list_ffmpeg_encoders() -> str:
-    try:
-        out = subprocess.check_output(['ffmpeg','-hide_banner','-encoders'], stderr=subprocess.STDOUT, text=True)
-        return out
-    except Exception:
-        return ""
+    def publish(self, event: str, data: str, raw: bool = False) -> int:
+        with self._cond:
+            self._last_id += 1
+            event_id = self._last_id
+            (self._raw if raw else self._events).append((event_id, event, data))
+            self._version += 1
+            self._cond.notify_all()
+        if self.job_id:
+            job_store.append_event(self.job_id, event_id, event, data, raw)
+        return event_id
+
+    def put_nowait(self, line: str):
+        """Publica una línea de log (misma firma que la cola anterior, sirve como callback log=)"""
+        self.publish('log', line)
+
+    def notify(self):
+        with self._cond:
+            self._version += 1
+            self._cond.notify_all()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def since(self, last_id: int, include_raw: bool = False) -> list:
+        """Eventos con id > last_id, en orden; los que ya salieron del buffer se pierden"""
+        with self._cond:
+            events = [e for e in self._events if e[0] > last_id]
+            if include_raw:
+                events += [e for e in self._raw if e[0] > last_id]
+        return sorted(events) if include_raw else events
+
+    def wait(self, version: int, timeout: float) -> int:
+        """Bloquea hasta que haya algo nuevo respecto a version (o timeout); retorna la versión actual"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+def update_job(job: dict, **fields):
+    """Actualiza campos del job y despierta a los suscriptores; los cambios de estado quedan como evento"""
+    if fields.get('status') in ('done', 'error'):
+        fields.setdefault('finished', time.time())
+        if job.get('status') != fields['status'] and 'spec' in job:
+            metrics.inc('converter_jobs_total', format=job['spec']['target_format'], outcome=fields['status'])
+    job.update(fields)
+    if 'id' in job:
+        # Los cambios de solo progreso se escriben como mucho cada STORE_POLL_SECONDS
+        now = time.time()
+        if 'status' in fields or set(fields) - {'progress', 'stats'}:
+            job_store.update(job['id'], {**fields, 'progress': job['progress'], 'stats': job['stats']})
+            job['stored'] = now
+        elif now - job.get('stored', 0.0) >= STORE_POLL_SECONDS:
+            job_store.update(job['id'], fields)
+            job['stored'] = now
+    if 'status' in fields:
+        job['log'].publish('status', json.dumps({
+            'status': job['status'],
+            'progress': job['progress'],
+            'error': job['error'],
+        }))
+    else:
+        job['log'].notify()
+
+JOBS_DB_PATH = os.environ.get('JOBS_DB', os.path.join(CACHE_FOLDER, 'jobs.sqlite3'))
+STORE_POLL_SECONDS = float(os.environ.get('STORE_POLL_SECONDS', '0.25'))
+STORE_EVENT_BATCH = int(os.environ.get('STORE_EVENT_BATCH', '100'))
+
+class JobStore:
+    """
+    Estado de los jobs en SQLite (modo WAL), compartido por todos los procesos del servidor:
+    campos del job, spec y eventos del bus. El proceso que ejecuta un job lo escribe; los demás
+    lo leen para servir /progress, /download o recibir el PUT de una subida en streaming.
+    Los eventos se recortan por job a los mismos límites que los ring buffers en memoria.
+    También es la cola durable: los workers reclaman jobs 'queued' con un lease que renuevan
+    mientras corren; si un worker muere, el lease vence y otro retoma el job.
+    Con gevent todo acceso a la base corre fuera del hub (off_hub), y los eventos se escriben
+    por lotes: como mucho cada STORE_POLL_SECONDS, o antes si cambia el job.
+    """
+    FIELDS = ('status', 'resource', 'priority', 'duration', 'progress', 'stats', 'error', 'output_path',
+              'download_name', 'created', 'started', 'finished', 'downloaded', 'spec')
+    JSON_FIELDS = {'stats', 'spec'}
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = None
+        # Con gevent a la base solo se entra desde hilos nativos: el lock también es nativo
+        self._lock = native_lock()
+        self._appended = {}  # job_id -> eventos insertados desde el último recorte
+        self._pending = []  # eventos publicados aún sin escribir
+        self._pending_lock = native_lock()
+        self._flusher_pid = None
+
+    def _db(self):
+        # Llamar con self._lock tomado
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT, resource TEXT, priority INTEGER, duration REAL,"
+                " progress REAL, stats TEXT, error TEXT, output_path TEXT, download_name TEXT,"
+                " created REAL, started REAL, finished REAL, downloaded REAL, spec TEXT, updated REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+            # Columnas de la cola (bases creadas antes de que existieran los workers)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, decl in (('lease_owner', 'TEXT'), ('lease_until', 'REAL'), ('attempts', 'INTEGER NOT NULL DEFAULT 0'),
+                                 ('trace', 'TEXT')):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {decl}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, event_id INTEGER NOT NULL,"
+                " event TEXT NOT NULL, data TEXT NOT NULL, raw INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS events_job ON events (job_id, event_id)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS metrics (owner TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL)")
+            self._conn.commit()
+        return self._conn
+
+    def _encode(self, field: str, value):
+        return json.dumps(value) if field in self.JSON_FIELDS and value is not None else value
+
+    @off_hub
+    def save(self, job_id: str, job: dict):
+        """
+        Guarda todos los campos persistentes del job. Si ya existe, el lease y los intentos se
+        conservan (un worker puede tenerlo reclamado) y la traza también, si no trae una.
+        """
+        values = [self._encode(f, job.get(f)) for f in self.FIELDS]
+        trace = json.dumps(job['trace'].to_dict()) if job.get('trace') else None
+        with self._lock:
+            db = self._db()
+            self._write_pending(db)
+            db.execute(
+                f"INSERT INTO jobs (id, {', '.join(self.FIELDS)}, trace, updated) "
+                f"VALUES (?, {', '.join('?' * len(self.FIELDS))}, ?, ?) "
+                f"ON CONFLICT (id) DO UPDATE SET {', '.join(f'{f} = excluded.{f}' for f in self.FIELDS)}, "
+                f"trace = COALESCE(excluded.trace, jobs.trace), updated = excluded.updated",
+                [job_id, *values, trace, time.time()],
+            )
+            db.commit()
+
+    @off_hub
+    def save_trace(self, job_id: str, trace: dict):
+        # Fuera de FIELDS: la traza puede ser grande y load() se llama en cada vuelta de /progress
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE jobs SET trace = ? WHERE id = ?", (json.dumps(trace), job_id))
+            db.commit()
+
+    @off_hub
+    def load_trace(self, job_id: str):
+        with self._lock:
+            row = self._db().execute("SELECT trace FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    @off_hub
+    def update(self, job_id: str, fields: dict):
+        fields = {f: v for f, v in fields.items() if f in self.FIELDS}
+        if not fields:
+            return
+        with self._lock:
+            db = self._db()
+            # Los eventos pendientes van antes: quien vea el estado nuevo ya ve el log que lo precede
+            self._write_pending(db)
+            db.execute(
+                f"UPDATE jobs SET {', '.join(f'{f} = ?' for f in fields)}, updated = ? WHERE id = ?",
+                [*(self._encode(f, v) for f, v in fields.items()), time.time(), job_id],
+            )
+            db.commit()
+
+    @off_hub
+    def load(self, job_id: str):
+        """Job tal como lo ve otro proceso: los campos guardados y un bus de solo lectura"""
+        with self._lock:
+            cur = self._db().execute(f"SELECT {', '.join(self.FIELDS)} FROM jobs WHERE id = ?", (job_id,))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        job = {f: (json.loads(v) if f in self.JSON_FIELDS and v is not None else v) for f, v in zip(self.FIELDS, row)}
+        job['id'] = job_id
+        job['log'] = StoredJobEvents(job_id)
+        return job
+
+    @off_hub
+    def all(self) -> list:
+        """Resumen de todos los jobs (para retención y estadísticas)"""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, status, created, finished, downloaded, output_path, spec FROM jobs"
+            ).fetchall()
+        return [{
+            'id': job_id, 'status': status, 'created': created, 'finished': finished, 'downloaded': downloaded,
+            'output_path': output_path, 'input_path': json.loads(spec or '{}').get('input_path'),
+        } for job_id, status, created, finished, downloaded, output_path, spec in rows]
+
+    @off_hub
+    def delete(self, job_id: str):
+        with self._lock:
+            db = self._db()
+            self._write_pending(db)
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            db.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
+            db.commit()
+            self._appended.pop(job_id, None)
+
+    def append_event(self, job_id: str, event_id: int, event: str, data: str, raw: bool = False):
+        """Encola el evento; se escribe con el siguiente lote (un commit por lote, no por línea)"""
+        with self._pending_lock:
+            self._pending.append((job_id, event_id, event, data, int(raw)))
+            due = len(self._pending) >= STORE_EVENT_BATCH
+        if due:
+            self.flush_events()
+        else:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        # Hilo por proceso (el de antes del fork no se hereda) que escribe los lotes pendientes
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, daemon=True, name='store-events').start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(STORE_POLL_SECONDS)
+            if self._pending:
+                try:
+                    self.flush_events()
+                except Exception as e:
+                    print(f"⚠️  No se pudieron guardar eventos de jobs: {e}")
+
+    @off_hub
+    def flush_events(self):
+        with self._lock:
+            db = self._db()
+            if self._write_pending(db):
+                db.commit()
+
+    def _write_pending(self, db) -> bool:
+        # Llamar con self._lock tomado; el commit queda a cargo de quien llama
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return False
+        db.executemany("INSERT INTO events (job_id, event_id, event, data, raw) VALUES (?, ?, ?, ?, ?)", pending)
+        # Recorte periódico para que la tabla no crezca más que los ring buffers
+        for row in pending:
+            self._appended[row[0]] = self._appended.get(row[0], 0) + 1
+        for job_id in {row[0] for row in pending}:
+            if self._appended[job_id] >= 200:
+                self._appended[job_id] = 0
+                for is_raw, keep in ((0, JOB_EVENT_BUFFER), (1, RAW_LOG_MAX_LINES)):
+                    db.execute(
+                        "DELETE FROM events WHERE job_id = ? AND raw = ? AND event_id <= ("
+                        " SELECT event_id FROM events WHERE job_id = ? AND raw = ?"
+                        " ORDER BY event_id DESC LIMIT 1 OFFSET ?)",
+                        (job_id, is_raw, job_id, is_raw, keep),
+                    )
+        return True
+
+    @off_hub
+    def events_since(self, job_id: str, last_id: int, include_raw: bool = False) -> list:
+        with self._lock:
+            db = self._db()
+            if self._write_pending(db):
+                db.commit()
+            return db.execute(
+                "SELECT event_id, event, data FROM events WHERE job_id = ? AND event_id > ?"
+                + ("" if include_raw else " AND raw = 0") + " ORDER BY event_id",
+                (job_id, last_id),
+            ).fetchall()
+
+    @off_hub
+    def last_event_id(self, job_id: str) -> int:
+        with self._lock:
+            db = self._db()
+            if self._write_pending(db):
+                db.commit()
+            row = db.execute("SELECT MAX(event_id) FROM events WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] or 0
+
+    @off_hub
+    def change_marker(self) -> tuple:
+        """Valor que cambia cuando cualquier proceso escribe un evento o actualiza un job"""
+        with self._lock:
+            return self._db().execute("SELECT (SELECT MAX(seq) FROM events), (SELECT MAX(updated) FROM jobs)").fetchone()
+
+    @off_hub
+    def count(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    @off_hub
+    def claim(self, owner: str, resources: list, lease_seconds: float, max_attempts: int):
+        """
+        Reclama el siguiente job (prioridad, luego antigüedad) de alguno de los recursos dados que
+        esté en cola o cuyo lease haya vencido. Retorna su id o None. Los que ya agotaron los
+        intentos (el worker murió max_attempts veces con ellos) se marcan como error.
+        """
+        if not resources:
+            return None
+        now = time.time()
+        marks = ','.join('?' * len(resources))
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = db.execute(
+                        f"SELECT id, attempts FROM jobs WHERE status IN ('queued', 'running') AND resource IN ({marks})"
+                        " AND (lease_until IS NULL OR lease_until < ?) ORDER BY priority, created LIMIT 1",
+                        [*resources, now],
+                    ).fetchone()
+                    if row is None:
+                        db.commit()
+                        return None
+                    job_id, attempts = row
+                    if attempts >= max_attempts:
+                        db.execute(
+                            "UPDATE jobs SET status = 'error', error = ?, finished = ?, lease_owner = NULL,"
+                            " lease_until = NULL, updated = ? WHERE id = ?",
+                            (f"Se agotaron los reintentos ({attempts} intentos)", now, now, job_id),
+                        )
+                        continue
+                    # Un job 'running' con el lease vencido perdió a su worker: vuelve a la cola
+                    db.execute(
+                        "UPDATE jobs SET status = 'queued', lease_owner = ?, lease_until = ?, attempts = attempts + 1,"
+                        " updated = ? WHERE id = ?",
+                        (owner, now + lease_seconds, now, job_id),
+                    )
+                    db.commit()
+                    return job_id
+            except Exception:
+                db.rollback()
+                raise
+
+    @off_hub
+    def renew(self, owner: str, job_ids: list, lease_seconds: float) -> int:
+        """Extiende los leases de los jobs que este worker sigue ejecutando; retorna cuántos conserva"""
+        if not job_ids:
+            return 0
+        with self._lock:
+            db = self._db()
+            cur = db.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE lease_owner = ? AND id IN ({','.join('?' * len(job_ids))})",
+                [time.time() + lease_seconds, owner, *job_ids],
+            )
+            db.commit()
+            return cur.rowcount
+
+    @off_hub
+    def lease(self, job_id: str, owner: str, lease_seconds: float):
+        """Toma el lease de un job concreto sin pasar por la cola (lo ejecuta quien lo recibe)"""
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE jobs SET lease_owner = ?, lease_until = ? WHERE id = ?",
+                       (owner, time.time() + lease_seconds, job_id))
+            db.commit()
+
+    @off_hub
+    def release(self, job_id: str, owner: str):
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE jobs SET lease_owner = NULL, lease_until = NULL WHERE id = ? AND lease_owner = ?",
+                       (job_id, owner))
+            db.commit()
+
+    @off_hub
+    def queue_position(self, job_id: str) -> int:
+        """Posición (1-based) entre los jobs en cola del mismo recurso, 0 si ya no está en cola"""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT resource, priority, created FROM jobs WHERE id = ? AND status = 'queued'"
+                             " AND lease_owner IS NULL", (job_id,)).fetchone()
+            if row is None:
+                return 0
+            resource, priority, created = row
+            return db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND lease_owner IS NULL AND resource = ?"
+                " AND (priority < ? OR (priority = ? AND created <= ?))",
+                (resource, priority, priority, created),
+            ).fetchone()[0]
+
+    @off_hub
+    def save_metrics(self, owner: str, data: dict):
+        """Guarda el estado de métricas de un proceso (una fila por proceso)"""
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO metrics (owner, data, updated) VALUES (?, ?, ?)",
+                       (owner, json.dumps(data), time.time()))
+            db.commit()
+
+    @off_hub
+    def load_metrics(self) -> list:
+        """[(owner, updated, data)] de todos los procesos que han publicado métricas"""
+        with self._lock:
+            rows = self._db().execute("SELECT owner, updated, data FROM metrics").fetchall()
+        return [(owner, updated, json.loads(data)) for owner, updated, data in rows]
+
+    @off_hub
+    def queue_stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            by_status = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = db.execute("SELECT COUNT(DISTINCT lease_owner) FROM jobs WHERE lease_until >= ?", (now,)).fetchone()[0]
+        return {'by_status': by_status, 'queued': by_status.get('queued', 0), 'active_workers': workers}
+
+job_store = JobStore(JOBS_DB_PATH)
+
+# Métricas: buckets de duración (segundos) y ventana de observaciones para los cuantiles
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '5'))
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+METRICS_WINDOW = 500
+METRICS_QUANTILES = (0.5, 0.9, 0.99)
+
+class Metrics:
+    """
+    Métricas del proceso al estilo Prometheus, sin dependencias: contadores, histogramas de
+    duración por etapa y resúmenes (cuantiles sobre las últimas METRICS_WINDOW observaciones).
+    En modo web/worker cada proceso publica su estado en JobStore cada METRICS_FLUSH_SECONDS
+    y /metrics agrega el de todos; en el CLI se vuelca a un archivo con --metrics.
+    """
+    FAMILIES = {
+        'converter_stage_duration_seconds': ('histogram', 'Duración de cada etapa (upload, probe, encode, audio_extract, model_load, transcribe, translate, queue_wait)'),
+        'converter_realtime_factor': ('summary', 'Segundos de media procesados por segundo de reloj'),
+        'converter_jobs_total': ('counter', 'Conversiones terminadas por formato y resultado'),
+        'converter_jobs': ('gauge', 'Jobs en la cola compartida por estado'),
+        'converter_ffmpeg_processes': ('gauge', 'Procesos ffmpeg en ejecución'),
+        'converter_whisper_models_loaded': ('gauge', 'Modelos Whisper cargados en memoria'),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self.store = None
+        self.owner = None
+        self._pid = os.getpid()
+        self._flusher_pid = None
+
+    def _reset(self):
+        self.counters = {}    # (nombre, labels) -> valor
+        self.histograms = {}  # (nombre, labels) -> conteos por bucket (+Inf al final), suma
+        self.summaries = {}   # (nombre, labels) -> deque de observaciones recientes, suma, total
+        self.ffmpeg_running = 0
+
+    def _check_process(self):
+        # Tras un fork (--serve) el hijo empieza de cero: lo heredado ya lo publica el padre
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+                    self._pid = os.getpid()
+        if self.store is not None and self._flusher_pid != os.getpid():
+            import socket
+            self._flusher_pid = os.getpid()
+            self.owner = f"{socket.gethostname()}-{os.getpid()}"
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    @staticmethod
+    def _labels(labels: dict) -> tuple:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def share(self, store: 'JobStore'):
+        """Publica las métricas de este proceso (y de sus hijos tras fork) en el store compartido"""
+        self.store = store
+        self._check_process()
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        self._check_process()
+        key = (name, self._labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe_stage(self, stage: str, seconds: float, format: str = '', model: str = ''):
+        """Registra la duración de una etapa en el histograma"""
+        self._check_process()
+        key = ('converter_stage_duration_seconds', self._labels({'stage': stage, 'format': format, 'model': model}))
+        with self._lock:
+            entry = self.histograms.setdefault(key, [[0] * (len(METRICS_BUCKETS) + 1), 0.0])
+            index = next((i for i, bound in enumerate(METRICS_BUCKETS) if seconds <= bound), len(METRICS_BUCKETS))
+            entry[0][index] += 1
+            entry[1] += seconds
+
+    def observe_realtime(self, stage: str, media_seconds: float, seconds: float, format: str = '', model: str = ''):
+        """Factor de tiempo real (media procesada / tiempo de reloj); sin duración conocida no se registra"""
+        if not media_seconds or seconds <= 0:
+            return
+        self._check_process()
+        key = ('converter_realtime_factor', self._labels({'stage': stage, 'format': format, 'model': model}))
+        value = media_seconds / seconds
+        with self._lock:
+            entry = self.summaries.setdefault(key, [deque(maxlen=METRICS_WINDOW), 0.0, 0])
+            entry[0].append(value)
+            entry[1] += value
+            entry[2] += 1
+
+    def stage(self, stage: str, format: str = '', model: str = ''):
+        """
+        Context manager que mide una etapa (y abre su span en la traza activa); .elapsed queda
+        disponible al salir y solo se registra en el histograma si no falló
+        """
+        metrics = self
+
+        class _Stage:
+            elapsed = 0.0
+
+            def __enter__(self):
+                # Cada etapa medida es también un span de la traza activa (si la hay)
+                self.span = trace_span(stage, format=format, model=model)
+                self.span.__enter__()
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, exc_type, *exc):
+                self.elapsed = time.perf_counter() - self.start
+                self.span.__exit__(exc_type, *exc)
+                if exc_type is None:
+                    metrics.observe_stage(stage, self.elapsed, format, model)
+                return False
+
+        return _Stage()
+
+    def ffmpeg_started(self):
+        self._check_process()
+        with self._lock:
+            self.ffmpeg_running += 1
+
+    def ffmpeg_finished(self):
+        with self._lock:
+            self.ffmpeg_running -= 1
+
+    def snapshot(self) -> dict:
+        """Estado serializable del proceso (lo que se publica en JobStore)"""
+        self._check_process()
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(counts), total] for (name, labels), (counts, total) in self.histograms.items()],
+                'summaries': [[name, labels, list(values), total, count]
+                              for (name, labels), (values, total, count) in self.summaries.items()],
+                'gauges': {
+                    'converter_ffmpeg_processes': self.ffmpeg_running,
+                    'converter_whisper_models_loaded': len(whisper_models.get_stats()['loaded']),
+                },
+            }
+
+    def flush(self):
+        if self.store is not None and self.owner:
+            self.store.save_metrics(self.owner, self.snapshot())
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            if os.getpid() != pid:
+                return  # copia heredada por fork; el hijo arranca su propio hilo
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  Error al publicar métricas: {e}")
+
+    def collect(self) -> list:
+        """Snapshots a agregar: el propio en vivo más los publicados por los demás procesos"""
+        snapshots = [self.snapshot()]
+        if self.store is not None:
+            stale = time.time() - 3 * METRICS_FLUSH_SECONDS
+            for owner, updated, data in self.store.load_metrics():
+                if owner == self.owner:
+                    continue
+                # Un proceso que dejó de publicar conserva sus totales, no sus gauges
+                if updated < stale:
+                    data['gauges'] = {}
+                snapshots.append(data)
+        return snapshots
+
+    @staticmethod
+    def _format_labels(labels, **extra) -> str:
+        pairs = [(k, v) for k, v in labels if v != ''] + list(extra.items())
+        if not pairs:
+            return ''
+        escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self, snapshots: list = None, extra_gauges: dict = None) -> str:
+        """Formato de exposición de texto de Prometheus con los snapshots agregados"""
+        snapshots = self.collect() if snapshots is None else snapshots
+        counters, histograms, summaries, gauges = {}, {}, {}, {}
+        for snap in snapshots:
+            for name, labels, value in snap.get('counters', []):
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, counts, total in snap.get('histograms', []):
+                key = (name, tuple(map(tuple, labels)))
+                entry = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+            for name, labels, values, total, count in snap.get('summaries', []):
+                key = (name, tuple(map(tuple, labels)))
+                entry = summaries.setdefault(key, [[], 0.0, 0])
+                entry[0].extend(values)
+                entry[1] += total
+                entry[2] += count
+            for name, value in snap.get('gauges', {}).items():
+                key = (name, ())
+                gauges[key] = gauges.get(key, 0) + value
+        for (name, labels), value in (extra_gauges or {}).items():
+            gauges[(name, labels)] = value
+
+        lines = []
+        for family, (kind, help_text) in self.FAMILIES.items():
+            lines += [f"# HELP {family} {help_text}", f"# TYPE {family} {kind}"]
+            if kind == 'histogram':
+                for (name, labels), (counts, total) in sorted(histograms.items()):
+                    if name != family:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*METRICS_BUCKETS, '+Inf'), counts):
+                        cumulative += count
+                        lines.append(f"{family}_bucket{self._format_labels(labels, le=bound)} {cumulative}")
+                    lines.append(f"{family}_sum{self._format_labels(labels)} {total:.6f}")
+                    lines.append(f"{family}_count{self._format_labels(labels)} {cumulative}")
+            elif kind == 'summary':
+                for (name, labels), (values, total, count) in sorted(summaries.items()):
+                    if name != family:
+                        continue
+                    ordered = sorted(values)
+                    for q in METRICS_QUANTILES:
+                        value = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+                        lines.append(f"{family}{self._format_labels(labels, quantile=q)} {value:.4f}")
+                    lines.append(f"{family}_sum{self._format_labels(labels)} {total:.4f}")
+                    lines.append(f"{family}_count{self._format_labels(labels)} {count}")
+            else:
+                source = counters if kind == 'counter' else gauges
+                for (name, labels), value in sorted(source.items()):
+                    if name == family:
+                        lines.append(f"{family}{self._format_labels(labels)} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str):
+        """Escribe las métricas de este proceso en un archivo (CLI: --metrics)"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.render([self.snapshot()]))
+
+metrics = Metrics()
+
+# Traza del job en curso (por hilo/greenlet): las etapas instrumentadas añaden sus spans aquí
+_current_trace = contextvars.ContextVar('job_trace', default=None)
+TRACE_PROFILE_TOP = int(os.environ.get('TRACE_PROFILE_TOP', '40'))
+
+class JobTrace:
+    """
+    Árbol de etapas de un job, exportable al formato de eventos de trazas de Chrome
+    (chrome://tracing, Perfetto). Cada span es un evento completo ('X') con inicio y duración
+    en µs, su hilo y su padre; los spans anidados en el mismo hilo forman el árbol. Opcionalmente
+    incluye un perfil de cProfile de la parte Python (solo del hilo que ejecuta el job).
+    Se serializa como {'events': [...], 'threads': {...}, 'profile': [...]} para guardarlo en JobStore.
+    """
+
+    def __init__(self, data: dict = None):
+        data = data or {}
+        self.events = list(data.get('events', []))
+        self.threads = dict(data.get('threads', {}))
+        self.profile_stats = data.get('profile')
+        self._lock = threading.RLock()
+        self._stacks = {}  # tid -> ids de los spans abiertos
+
+    def _tid(self) -> int:
+        tid = threading.get_ident()
+        key = f"{os.getpid()}:{tid}"
+        if key not in self.threads:
+            self.threads[key] = threading.current_thread().name
+        return tid
+
+    def add(self, name: str, start: float, end: float, parent: int = None, **args):
+        """
+        Span con tiempos ya medidos (time.time()); cuelga del span abierto en el hilo actual o,
+        si el hilo no tiene ninguno (p. ej. un pool), del indicado en parent
+        """
+        tid = self._tid()
+        with self._lock:
+            stack = self._stacks.get(tid)
+            self.events.append({
+                'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                'ts': int(start * 1e6), 'dur': max(0, int((end - start) * 1e6)),
+                'args': {**{k: v for k, v in args.items() if v not in (None, '')},
+                         'id': len(self.events), 'parent': stack[-1] if stack else parent},
+            })
+            return len(self.events) - 1
+
+    def current(self):
+        """Id del span abierto en el hilo actual (para colgar de él los spans de otros hilos)"""
+        with self._lock:
+            stack = self._stacks.get(threading.get_ident())
+            return stack[-1] if stack else None
+
+    def span(self, name: str, parent: int = None, **args):
+        """Context manager que abre un span; los spans que se abran dentro en el mismo hilo son sus hijos"""
+        trace = self
+
+        class _Span:
+            def __enter__(self):
+                self.start = time.time()
+                tid = trace._tid()
+                with trace._lock:
+                    # Se reserva el id al abrir para que los hijos lo tengan como padre
+                    self.index = trace.add(name, self.start, self.start, parent=parent, **args)
+                    trace._stacks.setdefault(tid, []).append(self.index)
+                self.tid = tid
+                return self
+
+            def __exit__(self, exc_type, exc, tb):
+                with trace._lock:
+                    trace._stacks[self.tid].pop()
+                    event = trace.events[self.index]
+                    event['dur'] = max(0, int((time.time() - self.start) * 1e6))
+                    if exc_type is not None:
+                        event['args']['error'] = str(exc)
+                return False
+
+        return _Span()
+
+    def activate(self):
+        """Hace de esta la traza actual del hilo (metrics.stage y trace_span la usan)"""
+        trace = self
+
+        class _Active:
+            def __enter__(self):
+                self.token = _current_trace.set(trace)
+                return trace
+
+            def __exit__(self, *exc):
+                _current_trace.reset(self.token)
+                return False
+
+        return _Active()
+
+    def profile(self, enabled: bool = True):
+        """cProfile del hilo actual mientras dure el bloque; guarda las funciones más costosas"""
+        trace = self
+
+        class _Profile:
+            def __enter__(self):
+                self.profiler = None
+                if enabled:
+                    import cProfile
+                    self.profiler = cProfile.Profile()
+                    self.profiler.enable()
+
+            def __exit__(self, *exc):
+                if self.profiler:
+                    self.profiler.disable()
+                    trace.profile_stats = trace._summarize(self.profiler)
+                return False
+
+        return _Profile()
+
+    @staticmethod
+    def _summarize(profiler) -> list:
+        import pstats
+        stats = pstats.Stats(profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TRACE_PROFILE_TOP]
+        return [{
+            'function': f"{func}  ({os.path.basename(filename)}:{line})",
+            'calls': calls, 'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6),
+        } for (filename, line, func), (_, calls, tottime, cumtime, _) in rows]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {'events': list(self.events), 'threads': dict(self.threads), 'profile': self.profile_stats}
+
+    def to_chrome(self, **metadata) -> dict:
+        """Documento JSON de trace events (formato objeto) con nombres de hilo y el perfil aparte"""
+        data = self.to_dict()
+        names = [{'name': 'thread_name', 'ph': 'M', 'pid': int(key.split(':')[0]), 'tid': int(key.split(':')[1]),
+                  'args': {'name': name}} for key, name in data['threads'].items()]
+        return {
+            'traceEvents': names + data['events'],
+            'displayTimeUnit': 'ms',
+            'otherData': {**metadata, **({'profile': data['profile']} if data['profile'] else {})},
+        }
+
+    def write(self, path: str, **metadata):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome(**metadata), f, ensure_ascii=False)
+
+def trace_span(name: str, **args):
+    """Span en la traza activa del hilo, o nada si no hay ninguna"""
+    trace = _current_trace.get()
+    if trace is None:
+        return nullcontext()
+    return trace.span(name, **args)
+
+def trace_add(name: str, start: float, end: float, **args):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, start, end, **args)
+
+def start_cli_trace(path: str, name: str, profile: bool = False, **args):
+    """
+    CLI --trace: activa una traza para el resto de la corrida y la escribe en path al salir
+    (el CLI termina siempre con sys.exit, así que se cierra desde atexit)
+    """
+    import atexit
+    trace = JobTrace()
+    _current_trace.set(trace)
+    profiler, root = trace.profile(profile), trace.span(name, **args)
+    profiler.__enter__()
+    root.__enter__()
+
+    def finish():
+        root.__exit__(None, None, None)
+        profiler.__exit__(None, None, None)
+        try:
+            trace.write(path, command=name, **args)
+            print(f"🧭 Traza escrita en {path} (abrir en chrome://tracing o ui.perfetto.dev)")
+        except OSError as e:
+            print(f"⚠️  No se pudo escribir la traza: {e}")
+    atexit.register(finish)
+    return trace
+
+class StoreWatcher:
+    """
+    Un único sondeo por proceso de JobStore.change_marker(); los streams SSE de jobs que corren
+    en otro proceso esperan su notificación en vez de consultar la base cada uno por su cuenta.
+    """
+
+    def __init__(self, store: JobStore, interval: float = STORE_POLL_SECONDS):
+        self.store = store
+        self.interval = interval
+        self.version = 0
+        self._marker = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _loop(self):
+        while True:
+            try:
+                marker = self.store.change_marker()
+            except Exception:
+                marker = self._marker
+            if marker != self._marker:
+                with self._cond:
+                    self._marker = marker
+                    self.version += 1
+                    self._cond.notify_all()
+            time.sleep(self.interval)
+
+    def wait(self, version: int, timeout: float) -> int:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True, name='store-watcher')
+            self._thread.start()
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+store_watcher = StoreWatcher(job_store)
+
+class StoredJobEvents:
+    """Bus de solo lectura de un job de otro proceso, con la misma interfaz que JobEvents"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    @property
+    def version(self) -> int:
+        return store_watcher.version
+
+    def since(self, last_id: int, include_raw: bool = False) -> list:
+        return job_store.events_since(self.job_id, last_id, include_raw)
+
+    def wait(self, version: int, timeout: float) -> int:
+        return store_watcher.wait(version, timeout)
+
+    def notify(self):
+        # Los suscriptores se enteran de los cambios escritos en JobStore por StoreWatcher
+        pass
+
+def get_job(job_id: str):
+    """El job si corre en este proceso; si no, su estado compartido en JobStore (o None)"""
+    return jobs.get(job_id) or job_store.load(job_id)
+
+def adopt_job(job_id: str):
+    """
+    Trae a este proceso un job creado en otro (p. ej. POST /jobs y PUT /upload atendidos por
+    procesos distintos) para poder ejecutarlo aquí; el bus sigue con los ids ya publicados.
+    """
+    if job_id in jobs:
+        return jobs[job_id]
+    job = job_store.load(job_id)
+    if job is None:
+        return None
+    job['log'] = JobEvents(job_id, start_id=job_store.last_event_id(job_id))
+    jobs[job_id] = job
+    return job
+
+class SchedulerFull(Exception):
+    """Se lanza cuando la cola de trabajos pendientes está llena"""
+
+SHARED_SLOT_POLL_SECONDS = float(os.environ.get('SHARED_SLOT_POLL_SECONDS', '0.25'))
+
+class SharedSlots:
+    """
+    Cupo de slots común a todos los procesos de --serve: cada slot es un archivo con flock
+    exclusivo, así N procesos no multiplican por N las sesiones NVENC ni los modelos Whisper.
+    Si un proceso muere, el kernel suelta sus locks y los slots quedan libres.
+    """
+
+    def __init__(self, folder: str, slots: dict):
+        self.folder = folder
+        self.slots = dict(slots)
+        os.makedirs(folder, exist_ok=True)
+
+    def try_acquire(self, resource: str):
+        """Toma un slot libre del recurso sin esperar; retorna el archivo que lo retiene o None"""
+        import fcntl
+        for i in range(self.slots[resource]):
+            handle = open(os.path.join(self.folder, f"{resource}-{i}.lock"), 'a')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except OSError:
+                handle.close()
+        return None
+
+    def release(self, handle):
+        import fcntl
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+    def available(self, resource: str) -> bool:
+        handle = self.try_acquire(resource)
+        if handle is None:
+            return False
+        self.release(handle)
+        return True
+
+class JobScheduler:
+    """
+    Planificador de trabajos con cola de prioridad y un cupo de slots por clase de recurso
+    (encodes en CPU, sesiones NVENC, transcripciones Whisper y traducción).
+    Menor número de prioridad = se ejecuta antes; a igual prioridad, orden de llegada.
+    """
+
+    def __init__(self, slots: dict, max_queued: int):
+        self.slots = dict(slots)
+        self.max_queued = max_queued
+        self._running = {resource: 0 for resource in self.slots}
+        self._pending = []  # heap de (prioridad, secuencia, job_id, recurso, fn)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.shared = None  # SharedSlots cuando varios procesos comparten el cupo
+
+    def share(self, shared: SharedSlots):
+        """Cuenta los slots entre todos los procesos (--serve) en vez de por proceso"""
+        with self._cond:
+            self.shared = shared
+
+    def _acquire(self, resource: str):
+        # Llamar con self._cond tomado. Retorna la ficha del slot o None si no hay uno libre
+        if self._running[resource] >= self.slots[resource]:
+            return None
+        token = self.shared.try_acquire(resource) if self.shared else True
+        if token is None:
+            return None
+        self._running[resource] += 1
+        return token
+
+    def _release(self, resource: str, token):
+        # Llamar con self._cond tomado
+        self._running[resource] -= 1
+        if token is not True:
+            self.shared.release(token)
+        self._dispatch()
+        self._cond.notify_all()
+
+    def submit(self, job_id: str, resource: str, fn, priority: int = 5):
+        """Encola fn para ejecutarse cuando haya un slot libre de la clase 'resource'"""
+        with self._cond:
+            if len(self._pending) >= self.max_queued:
+                raise SchedulerFull(f"Cola llena ({self.max_queued} trabajos en espera)")
+            self._seq += 1
+            heapq.heappush(self._pending, (priority, self._seq, job_id, resource, fn))
+            self._dispatch()
+
+    def _dispatch(self):
+        # Llamar con self._cond tomado. Arranca todo lo que tenga slot libre, respetando prioridad por recurso
+        waiting = []
+        while self._pending:
+            entry = heapq.heappop(self._pending)
+            token = self._acquire(entry[3])
+            if token is not None:
+                threading.Thread(target=self._run, args=(entry, token), daemon=True).start()
+            else:
+                waiting.append(entry)
+        for entry in waiting:
+            heapq.heappush(self._pending, entry)
+
+    def _run(self, entry, token):
+        _, _, job_id, resource, fn = entry
+        try:
+            fn()
+        finally:
+            with self._cond:
+                self._release(resource, token)
+
+    def free_resources(self) -> list:
+        """Recursos con algún slot libre, contando lo que ya espera en la cola local"""
+        with self._cond:
+            # Lo que esperaba un slot que liberó otro proceso no recibe aviso: se reintenta aquí
+            self._dispatch()
+            waiting = {}
+            for entry in self._pending:
+                waiting[entry[3]] = waiting.get(entry[3], 0) + 1
+            free = [r for r in self.slots if self._running[r] + waiting.get(r, 0) < self.slots[r]]
+            if self.shared:
+                free = [r for r in free if self.shared.available(r)]
+            return free
+
+    def queue_position(self, job_id: str) -> int:
+        """Posición (1-based) del job entre los que esperan el mismo recurso, 0 si ya no está en cola"""
+        with self._cond:
+            entry = next((e for e in self._pending if e[2] == job_id), None)
+            if entry is None:
+                return 0
+            return sum(1 for e in self._pending if e[3] == entry[3] and e[:2] <= entry[:2])
+
+    def slot(self, resource: str):
+        """Context manager para que una etapa dentro de un job ocupe un slot (ej. traducción)"""
+        scheduler = self
+
+        class _Slot:
+            def __enter__(self):
+                with scheduler._cond:
+                    while True:
+                        self.token = scheduler._acquire(resource)
+                        if self.token is not None:
+                            break
+                        # Otro proceso libera sus slots sin avisar a esta condición: se reintenta cada tanto
+                        scheduler._cond.wait(SHARED_SLOT_POLL_SECONDS if scheduler.shared else None)
+
+            def __exit__(self, *exc):
+                with scheduler._cond:
+                    scheduler._release(resource, self.token)
+                return False
+
+        return _Slot()
+
+    def extra_slots(self, resource: str, wanted: int):
+        """
+        Context manager para que un job que reparte su trabajo (encode segmentado) tome, sin
+        esperar, hasta 'wanted' slots libres más del recurso; entrega cuántos consiguió.
+        """
+        scheduler = self
+
+        class _Extra:
+            def __enter__(self):
+                self.tokens = []
+                with scheduler._cond:
+                    while len(self.tokens) < wanted:
+                        token = scheduler._acquire(resource)
+                        if token is None:
+                            break
+                        self.tokens.append(token)
+                return len(self.tokens)
+
+            def __exit__(self, *exc):
+                with scheduler._cond:
+                    for token in self.tokens:
+                        scheduler._release(resource, token)
+                return False
+
+        return _Extra()
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            return {
+                'slots': dict(self.slots),
+                'running': dict(self._running),
+                'queued': len(self._pending),
+                'max_queued': self.max_queued,
+            }
+
+scheduler = JobScheduler(
+    slots={
+        'cpu': int(os.environ.get('SCHED_CPU_SLOTS', '2')),
+        'nvenc': int(os.environ.get('SCHED_NVENC_SLOTS', '2')),
+        'whisper': int(os.environ.get('SCHED_WHISPER_SLOTS', '1')),
+        'translate': int(os.environ.get('SCHED_TRANSLATE_SLOTS', '4')),
+    },
+    max_queued=int(os.environ.get('SCHED_MAX_QUEUED', '50')),
+)
+
+WORKER_POLL_SECONDS = float(os.environ.get('WORKER_POLL_SECONDS', '1.0'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+
+class JobWorker:
+    """
+    Consume la cola durable de JobStore: reclama jobs con un lease solo para los recursos en los
+    que el planificador local tiene un slot libre, los ejecuta con run_conversion y renueva los
+    leases mientras corren. Puede ir embebido en el servidor web o en procesos `--worker`
+    aparte (en cualquier máquina que comparta la base y las carpetas de archivos).
+    """
+
+    def __init__(self, store: JobStore, scheduler: JobScheduler, name: str = None,
+                 poll_seconds: float = WORKER_POLL_SECONDS, lease_seconds: float = JOB_LEASE_SECONDS):
+        import socket
+        self.store = store
+        self.scheduler = scheduler
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.active = set()
+        self.completed = 0
+        self._wake = threading.Event()
+        self._threads = []
+        self._renewer = None
+        self._renewer_lock = threading.Lock()
+
+    def wake(self):
+        """Despierta el bucle (un job se acaba de encolar en este mismo proceso)"""
+        self._wake.set()
+
+    def poll_once(self) -> bool:
+        """Reclama y lanza un job si hay alguno que se pueda empezar ya; retorna si lo hubo"""
+        job_id = self.store.claim(self.name, self.scheduler.free_resources(), self.lease_seconds, JOB_MAX_ATTEMPTS)
+        if job_id is None:
+            return False
+        jobs.pop(job_id, None)  # una copia local anterior estaría desactualizada
+        job = adopt_job(job_id)
+        if not os.path.exists(job['spec']['input_path']):
+            # Reintento de un job cuyo worker murió después de borrar (o antes de recibir) la entrada
+            update_job(job, status='error', error="El archivo de entrada ya no existe; no se puede reintentar")
+            self.store.release(job_id, self.name)
+            jobs.pop(job_id, None)
+            return True
+        self.active.add(job_id)
+        job['log'].put_nowait(f"🛠️  Worker {self.name} tomó el job")
+        self.scheduler.submit(job_id, job['resource'], lambda: self._run(job_id), job['priority'])
+        return True
+
+    def hold(self, job_id: str):
+        """
+        Context manager para un job que se ejecuta fuera de la cola (PUT /upload en streaming):
+        mantiene su lease renovado para que ningún worker lo reclame mientras corre aquí
+        """
+        worker = self
+
+        class _Hold:
+            def __enter__(self):
+                worker.store.lease(job_id, worker.name, worker.lease_seconds)
+                worker.active.add(job_id)
+                worker._start_renewer()
+
+            def __exit__(self, *exc):
+                worker.active.discard(job_id)
+                worker.store.release(job_id, worker.name)
+                return False
+
+        return _Hold()
+
+    def _run(self, job_id: str):
+        try:
+            run_conversion(job_id)
+        finally:
+            self.active.discard(job_id)
+            self.store.release(job_id, self.name)
+            # Terminado, el estado vive en JobStore; la copia local ya no hace falta
+            jobs.pop(job_id, None)
+            self.completed += 1
+
+    def _poll_loop(self):
+        while True:
+            try:
+                while self.poll_once():
+                    pass
+            except Exception as e:
+                print(f"⚠️  Error al reclamar jobs: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _renew_loop(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            active = list(self.active)
+            try:
+                kept = self.store.renew(self.name, active, self.lease_seconds)
+                if kept < len(active):
+                    print(f"⚠️  {len(active) - kept} job(s) perdieron su lease (otro worker los retomará)")
+            except Exception as e:
+                print(f"⚠️  Error al renovar leases: {e}")
+
+    def _start_renewer(self):
+        # Un proceso web con --no-worker no reclama jobs, pero sí renueva los que ejecuta él mismo
+        with self._renewer_lock:
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_loop, daemon=True)
+                self._renewer.start()
+
+    def start(self):
+        """Arranca el worker en hilos de fondo (una sola vez)"""
+        if not self._threads:
+            self._start_renewer()
+            thread = threading.Thread(target=self._poll_loop, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def run_forever(self):
+        self.start()
+        while True:
+            time.sleep(3600)
+
+    def get_stats(self) -> dict:
+        return {'name': self.name, 'running': len(self.active), 'completed': self.completed,
+                'started': bool(self._threads)}
+
+job_worker = JobWorker(job_store, scheduler)
+
+
+def _parse_ffmpeg_list(out: str) -> set:
+    """Extrae los nombres de la salida de -encoders/-decoders/-filters/-muxers"""
+    names = set()
+    started = False
+    for line in out.splitlines():
+        stripped = line.strip()
+        # -filters no tiene separador: sus líneas son "TSC nombre  V->V  descripción"
+        m = re.match(r'^[T.][S.][C.]\s+(\S+)\s+\S*->\S*', stripped)
+        if m:
+            names.add(m.group(1))
+            continue
+        if not started:
+            started = stripped.startswith('--')
+            continue
+        parts = stripped.split()
+        if len(parts) >= 2:
+            names.update(parts[1].split(','))
+    return names
+
+class FFmpegCapabilities:
+    """
+    Registro de capacidades de ffmpeg (encoders, decoders, hwaccels, filtros y muxers).
+    Se sondea una sola vez por proceso y se persiste en disco, indexado por la ruta,
+    mtime y versión del binario, para no lanzar ffmpeg en cada petición.
+    """
+
+    KINDS = ('encoders', 'decoders', 'filters', 'muxers')
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self._caps = None
+        self._lock = threading.Lock()
+
+    def _binary_key(self):
+        path = shutil.which('ffmpeg')
+        if not path:
+            return None
+        try:
+            out = subprocess.check_output([path, '-hide_banner', '-version'], stderr=subprocess.STDOUT, text=True)
+            version = out.splitlines()[0] if out else ''
+        except Exception:
+            return None
+        return {'path': path, 'mtime': os.path.getmtime(path), 'version': version}
+
+    def _probe(self, binary: dict) -> dict:
+        caps = {'binary': binary}
+        for kind in self.KINDS:
+            try:
+                out = subprocess.check_output([binary['path'], '-hide_banner', f'-{kind}'], stderr=subprocess.STDOUT, text=True)
+                caps[kind] = sorted(_parse_ffmpeg_list(out))
+            except Exception:
+                caps[kind] = []
+        try:
+            out = subprocess.check_output([binary['path'], '-hide_banner', '-hwaccels'], stderr=subprocess.STDOUT, text=True)
+            caps['hwaccels'] = [l.strip() for l in out.splitlines()[1:] if l.strip()]
+        except Exception:
+            caps['hwaccels'] = []
+        return caps
+
+    def _load_from_disk(self, binary: dict):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            return cached if cached.get('binary') == binary else None
+        except Exception:
+            return None
+
+    def _save_to_disk(self, caps: dict):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(caps, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"⚠️  No se pudo guardar la caché de capacidades de ffmpeg: {e}")
+
+    def load(self, refresh: bool = False) -> dict:
+        """Carga las capacidades (desde disco si el binario no cambió) y las mantiene en memoria"""
+        with self._lock:
+            if self._caps is not None and not refresh:
+                return self._caps
+            binary = self._binary_key()
+            if binary is None:
+                # Sin ffmpeg no se persiste nada; se reintentará en la próxima carga explícita
+                self._caps = {'binary': None, 'hwaccels': [], **{k: [] for k in self.KINDS}}
+                return self._caps
+            caps = None if refresh else self._load_from_disk(binary)
+            if caps is None:
+                caps = self._probe(binary)
+                self._save_to_disk(caps)
+            # Sets para consultas rápidas
+            self._caps = {k: (set(v) if isinstance(v, list) else v) for k, v in caps.items()}
+            return self._caps
+
+    def has(self, kind: str, name: str) -> bool:
+        return name in self.load().get(kind, ())
+
+    def summary(self) -> dict:
+        caps = self.load()
+        return {
+            'binary': caps.get('binary'),
+            'hwaccels': sorted(caps.get('hwaccels', ())),
+            **{kind: len(caps.get(kind, ())) for kind in self.KINDS},
+        }
+
+ffmpeg_caps = FFmpegCapabilities(os.path.join(CACHE_FOLDER, 'ffmpeg_capabilities.json'))
 
 def has_encoder(name: str) -> bool:
-    encs = list_ffmpeg_encoders()
-    return (name in encs) if encs else False
+    return ffmpeg_caps.has('encoders', name)
+
+# Campos que ffmpeg escribe en el canal -progress; cada bloque termina en progress=continue|end
+PROGRESS_KEY_RE = re.compile(r'^(frame|fps|stream_\d+_\d+_q|bitrate|total_size|out_time_us|out_time_ms|out_time'
+                             r'|dup_frames|drop_frames|speed|progress)=(.*)$')
+PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL', '0.5'))  # segundos entre actualizaciones
+PROGRESS_STATS_FIELDS = ('out_time', 'frame', 'fps', 'speed', 'bitrate', 'total_size', 'eta')
+
+def _progress_number(value: str, suffix: str = ''):
+    """Convierte un valor del canal de progreso ('1.5x', '812.3kbits/s', 'N/A') a float o None"""
+    value = (value or '').strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+class FFmpegProgress:
+    """
+    Interpreta la salida de `ffmpeg -progress`: bloques de líneas key=value que terminan en
+    progress=continue|end. Cada bloque completo se convierte en una instantánea con campos
+    tipados (segundos, fps, velocidad, kbit/s, bytes) más porcentaje y ETA si hay duración.
+    on_update recibe las instantáneas como mucho cada min_interval segundos (el final siempre).
+    """
+
+    def __init__(self, duration: float = 0.0, on_update=None, min_interval: float = PROGRESS_INTERVAL):
+        self.duration = duration or 0.0
+        self.on_update = on_update
+        self.min_interval = min_interval
+        self.snapshot = None
+        self._block = {}
+        self._last_emit = 0.0
+
+    def feed(self, line: str) -> bool:
+        """Procesa una línea; retorna False si no pertenece al canal de progreso"""
+        m = PROGRESS_KEY_RE.match(line.strip())
+        if not m:
+            return False
+        key, value = m.groups()
+        if key != 'progress':
+            self._block[key] = value
+            return True
+
+        self.snapshot = self._parse(self._block, finished=(value.strip() == 'end'))
+        self._block = {}
+        now = time.monotonic()
+        if self.on_update and (self.snapshot['finished'] or now - self._last_emit >= self.min_interval):
+            self._last_emit = now
+            self.on_update(self.snapshot)
+        return True
+
+    def _parse(self, block: dict, finished: bool) -> dict:
+        # out_time_ms también está en microsegundos (nombre histórico de ffmpeg)
+        out_us = _progress_number(block.get('out_time_us', block.get('out_time_ms')))
+        out_time = max(0.0, out_us / 1e6) if out_us is not None else None
+        speed = _progress_number(block.get('speed'), 'x')
+        frame = _progress_number(block.get('frame'))
+        total_size = _progress_number(block.get('total_size'))
+
+        percent = eta = None
+        if self.duration > 0 and out_time is not None:
+            percent = max(0.0, min(100.0, out_time / self.duration * 100.0))
+            if speed:
+                eta = max(0.0, (self.duration - out_time) / speed)
+        if finished:
+            percent = 100.0 if self.duration > 0 else percent
+            eta = 0.0
+
+        return {
+            'out_time': out_time,
+            'frame': int(frame) if frame is not None else None,
+            'fps': _progress_number(block.get('fps')),
+            'speed': speed,
+            'bitrate': _progress_number(block.get('bitrate'), 'kbits/s'),
+            'total_size': int(total_size) if total_size is not None else None,
+            'percent': percent,
+            'eta': eta,
+            'finished': finished,
+        }
+
+class FFmpegRun:
+    """
+    Lanza ffmpeg con el progreso estructurado en un pipe aparte (-progress pipe:1 -nostats) y
+    reparte desde hilos lectores las instantáneas a on_progress y las líneas de log a on_log.
+    Si stdout se necesita para datos (capture_stdout), el progreso viaja por stderr y se separa
+    del log por su formato key=value. Con stdout_path, un hilo más vuelca ese stdout a un archivo
+    que solo crece (salida progresiva); wait() no retorna hasta que esté escrito por completo.
+    """
+
+    def __init__(self, cmd: list, duration: float = 0.0, on_progress=None, on_log=None,
+                 stdin=None, capture_stdout: bool = False, min_interval: float = PROGRESS_INTERVAL,
+                 stdout_path: str = None):
+        self.parser = FFmpegProgress(duration, on_progress, min_interval)
+        self.on_log = on_log
+        self.last_lines = []
+        capture_stdout = capture_stdout or stdout_path is not None
+        self.capture_stdout = capture_stdout
+
+        cmd = [cmd[0], '-progress', 'pipe:2' if capture_stdout else 'pipe:1', '-nostats', *cmd[1:]]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL if stdin is None else stdin,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        metrics.ffmpeg_started()
+        self._counted = True
+        self.stdin = self.proc.stdin
+        self.stdout = self.proc.stdout if capture_stdout and stdout_path is None else None
+
+        self._readers = [threading.Thread(target=self._read_log, args=(self.proc.stderr,), daemon=True)]
+        if not capture_stdout:
+            self._readers.append(threading.Thread(target=self._read_progress, args=(self.proc.stdout,), daemon=True))
+        elif stdout_path is not None:
+            self._readers.append(threading.Thread(target=self._copy_output, args=(self.proc.stdout, stdout_path), daemon=True))
+        for reader in self._readers:
+            reader.start()
+
+    @staticmethod
+    def _lines(stream):
+        return io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+
+    def _read_progress(self, stream):
+        for line in self._lines(stream):
+            self.parser.feed(line)
+
+    @staticmethod
+    def _copy_output(stream, path: str):
+        # read1 devuelve lo que ffmpeg ya emitió, sin esperar a llenar el bloque:
+        # cada fragmento llega al disco en cuanto el muxer lo cierra
+        with open(path, 'wb') as f:
+            while True:
+                chunk = stream.read1(PROGRESSIVE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                f.write(chunk)
+                f.flush()
+
+    def _read_log(self, stream):
+        for line in self._lines(stream):
+            if self.capture_stdout and self.parser.feed(line):
+                continue
+            line = line.rstrip()
+            if not line:
+                continue
+            self.last_lines = (self.last_lines + [line])[-5:]
+            if self.on_log:
+                self.on_log(line)
+
+    @property
+    def last_line(self) -> str:
+        return self.last_lines[-1] if self.last_lines else ''
+
+    def wait(self) -> int:
+        ret = self.proc.wait()
+        if self._counted:
+            self._counted = False
+            metrics.ffmpeg_finished()
+        for reader in self._readers:
+            reader.join()
+        return ret
+
+    def abort(self) -> int:
+        """Corta un ffmpeg que no va a recibir más entrada (p. ej. el cliente se desconectó) y lo recoge"""
+        if self.stdin and not self.stdin.closed:
+            try:
+                self.stdin.close()
+            except OSError:
+                pass
+        if self.proc.poll() is None:
+            self.proc.kill()
+        return self.wait()
+
+def format_eta(seconds) -> str:
+    """Formatea segundos restantes como mm:ss (o hh:mm:ss)"""
+    if seconds is None:
+        return '--:--'
+    seconds = int(round(seconds))
+    hh, rem = divmod(seconds, 3600)
+    mm, ss = divmod(rem, 60)
+    return f"{hh:d}:{mm:02d}:{ss:02d}" if hh else f"{mm:02d}:{ss:02d}"
+
+def format_progress(snapshot: dict) -> str:
+    """Línea de progreso para la terminal: porcentaje (o tiempo procesado), fps, velocidad y ETA"""
+    if snapshot['percent'] is not None:
+        parts = [f"Progreso: {snapshot['percent']:.1f}%"]
+    else:
+        parts = [f"Procesado: {format_eta(snapshot['out_time'])}"]
+    if snapshot['fps']:
+        parts.append(f"{snapshot['fps']:.0f} fps")
+    if snapshot['speed']:
+        parts.append(f"{snapshot['speed']:.2f}x")
+    if snapshot['eta'] is not None:
+        parts.append(f"ETA {format_eta(snapshot['eta'])}")
+    return " | ".join(parts)
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+def save_stream_hashed(stream, path: str, head: bytes = b'') -> str:
+    """Guarda un stream en disco calculando su SHA-256 en la misma pasada"""
+    h = hashlib.sha256()
+    with open(path, 'wb') as out:
+        if head:
+            h.update(head)
+            out.write(head)
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_BYTES), b''):
+            h.update(chunk)
+            out.write(chunk)
+    return h.hexdigest()
+
+def evict_lru_files(folder: str, max_bytes: int) -> int:
+    """Borra los archivos menos usados (por mtime) hasta que la carpeta quepa en max_bytes"""
+    entries = []
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            evicted += 1
+        except OSError:
+            pass
+    return evicted
+
+class OutputCache:
+    """
+    Caché de resultados direccionada por contenido: la clave combina el hash de la entrada con
+    los argumentos de codec resueltos. Limitada en tamaño, expulsa por LRU (mtime de cada archivo).
+    """
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def key(input_hash: str, target_format: str, codec_args: list, **extra) -> str:
+        payload = json.dumps([input_hash, target_format, list(codec_args), extra], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.folder, f"{key}{ext}")
+
+    @staticmethod
+    def _link_or_copy(src: str, dest: str):
+        try:
+            if os.path.exists(dest):
+                os.remove(dest)
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+
+    def fetch(self, key: str, dest: str) -> bool:
+        """Si la clave está en caché, enlaza el resultado en dest y retorna True"""
+        if self.max_bytes <= 0:
+            return False
+        path = self._path(key, Path(dest).suffix)
+        with self._lock:
+            if not os.path.exists(path):
+                self.stats['misses'] += 1
+                return False
+            os.utime(path)  # marca de uso reciente para el LRU
+            self._link_or_copy(path, dest)
+            self.stats['hits'] += 1
+            return True
+
+    def store(self, key: str, src: str):
+        if self.max_bytes <= 0 or os.path.getsize(src) > self.max_bytes:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        with self._lock:
+            self._link_or_copy(src, self._path(key, Path(src).suffix))
+            self.stats['stores'] += 1
+            self._evict()
+
+    def _evict(self):
+        # Llamar con self._lock tomado
+        self.stats['evictions'] += evict_lru_files(self.folder, self.max_bytes)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            used = 0
+            if os.path.isdir(self.folder):
+                used = sum(os.path.getsize(os.path.join(self.folder, n)) for n in os.listdir(self.folder))
+            return {**self.stats, 'used_mb': round(used / (1024 * 1024), 1), 'max_mb': self.max_bytes // (1024 * 1024)}
+
+output_cache = OutputCache(os.path.join(CACHE_FOLDER, 'outputs'), int(os.environ.get('OUTPUT_CACHE_MB', '10240')) * 1024 * 1024)
+
+def output_cache_key(spec: dict, copy_plan: str = None, segmented: bool = False) -> str:
+    """
+    Clave de OutputCache de un job: los argumentos pedidos (antes del plan de stream copy) más
+    lo que cambia el resultado. Una subida en streaming solo guarda (su hash se conoce al final)
+    y sin copia ni segmentado; /convert la encuentra cuando pide lo mismo: mismas opciones, sin
+    plan de stream copy aplicable y sin codificación segmentada.
+    """
+    return output_cache.key(spec['input_hash'], spec['target_format'], spec['codec_args'], copy=copy_plan,
+                            progressive=spec.get('progressive', False), segmented=segmented)
 
 def seconds_to_srt_time(seconds: float) -> str:
     """
@@ -184,7 +2453,7 @@ def seconds_to_srt_time(seconds: float) -> str:
     millisecs = int((seconds % 1) * 1000)
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{millisecs:03d}"
 
-def transcribe_audio_to_srt(audio_path: str, output_srt_path: str, model_size: str = "base") -> bool:
+def transcribe_audio_to_srt(audio_path: str, output_srt_path: str, model_size: str = "base", workers: int = None) -> bool:
     """
     Transcribe audio usando Whisper y genera archivo SRT con timestamps
     """
@@ -196,30 +2465,30 @@ def transcribe_audio_to_srt(audio_path: str, output_srt_path: str, model_size: s
         print(f"❌ ERROR: Archivo de audio no encontrado: {audio_path}")
         return False
     
-    # Verificar tamaño del archivo
-    file_size = os.path.getsize(audio_path) / (1024 * 1024)  # MB
-    print(f"📁 Tamaño del archivo: {file_size:.1f} MB")
+    # Verificar tamaño del archivo (el sondeo queda memorizado para el resto del proceso)
+    info = probe_media(audio_path)
+    print(f"📁 Tamaño del archivo: {os.path.getsize(audio_path) / (1024 * 1024):.1f} MB")
     
-    if file_size > 100:  # Archivo muy grande
+    if info.is_large:  # Archivo muy grande
         print("⚠️  ARCHIVO GRANDE detectado. Esto puede tomar mucho tiempo.")
         print("💡 Sugerencia: Usa modelo 'tiny' o 'base' para archivos grandes")
         if model_size in ['large', 'medium']:
             print(f"⚠️  Modelo '{model_size}' puede ser muy lento para este archivo")
     
     try:
-        print(f"🤖 Cargando modelo Whisper ({model_size}) en {DEVICE.upper()}...")
-        model = whisper.load_model(model_size, device=DEVICE)
-        
         # Mostrar información del archivo
         duration = get_audio_info(audio_path)
         
-        print(f"🎵 Iniciando transcripción...")
-        result = transcribe_with_progress(model, audio_path, word_timestamps=True, fp16=(DEVICE == "cuda"))
+        print(f"🎚️  Decodificando audio a PCM 16 kHz en memoria...")
+        audio = load_audio_pcm(audio_path)
+        
+        result = transcribe_audio(audio, model_size, workers, show_progress=True,
+                                  word_timestamps=True, fp16=(DEVICE == "cuda"))
         
         print(f"📄 Generando archivo SRT: {output_srt_path}")
         
         # Crear directorio de salida si no existe
-        os.makedirs(os.path.dirname(output_srt_path), exist_ok=True)
+        os.makedirs(os.path.dirname(output_srt_path) or '.', exist_ok=True)
         
         with open(output_srt_path, 'w', encoding='utf-8') as f:
             subtitle_index = 1
@@ -242,55 +2511,241 @@ def transcribe_audio_to_srt(audio_path: str, output_srt_path: str, model_size: s
         print(f"❌ ERROR durante la transcripción: {e}")
         return False
 
-def translate_text(text: str, target_language: str, source_language: str = 'auto') -> str:
+# Mapeo de nombres de idioma comunes a códigos del traductor
+LANGUAGE_MAP = {
+    'spanish': 'es', 'español': 'es', 'es': 'es',
+    'english': 'en', 'inglés': 'en', 'ingles': 'en', 'en': 'en',
+    'french': 'fr', 'francés': 'fr', 'frances': 'fr', 'fr': 'fr',
+    'german': 'de', 'alemán': 'de', 'aleman': 'de', 'de': 'de',
+    'italian': 'it', 'italiano': 'it', 'it': 'it',
+    'portuguese': 'pt', 'portugués': 'pt', 'portugues': 'pt', 'pt': 'pt',
+    'russian': 'ru', 'ruso': 'ru', 'ru': 'ru',
+    'japanese': 'ja', 'japonés': 'ja', 'japones': 'ja', 'ja': 'ja',
+    'korean': 'ko', 'coreano': 'ko', 'ko': 'ko',
+    'chinese': 'zh-CN', 'chino': 'zh-CN', 'zh': 'zh-CN',
+    'dutch': 'nl', 'holandés': 'nl', 'holandes': 'nl', 'nl': 'nl',
+    'arabic': 'ar', 'árabe': 'ar', 'arabe': 'ar', 'ar': 'ar',
+    'hindi': 'hi', 'hi': 'hi',
+}
+
+# Traducción por lotes: varios segmentos por petición, separados por salto de línea
+TRANSLATE_BATCH_CHARS = int(os.environ.get('TRANSLATE_BATCH_CHARS', '4000'))
+TRANSLATE_WORKERS = int(os.environ.get('TRANSLATE_WORKERS', '4'))
+TRANSLATE_RETRIES = 3
+TRANSLATE_SEPARATOR = "\n"
+
+def language_code(language: str) -> str:
+    if not language or language == 'auto':
+        return 'auto'
+    return LANGUAGE_MAP.get(language.lower(), language.lower())
+
+# Uno por hilo: GoogleTranslator.translate() escribe el texto en el estado de la instancia
+# (_url_params) antes de enviarlo, así que dos hilos con la misma instancia se cruzan los textos
+_translators = threading.local()
+
+def get_translator(source_language: str, target_language: str):
+    """Traductor reutilizable por par de idiomas dentro del hilo actual (evita reconstruirlo en cada llamada)"""
+    key = (language_code(source_language), language_code(target_language))
+    cache = _translators.__dict__.setdefault('by_pair', {})
+    if key not in cache:
+        cache[key] = GoogleTranslator(source=key[0], target=key[1])
+    return cache[key]
+
+class TranslationMemory:
     """
-    Traduce texto usando Google Translator
+    Memoria de traducción persistente (SQLite) indexada por (idioma origen, idioma destino,
+    texto normalizado). Se consulta antes de cualquier llamada al traductor y se llena después,
+    así las líneas repetidas (intros, avisos, "[Música]") se traducen una sola vez.
+    Al superar max_entries se expulsan las entradas usadas hace más tiempo.
     """
-    if not TRANSLATOR_AVAILABLE:
-        print("❌ ERROR: deep-translator no está instalado. Instala con: pip install deep-translator")
-        return text
-    
-    try:
-        # Mapeo de códigos de idioma comunes
-        language_map = {
-            'spanish': 'es', 'español': 'es', 'es': 'es',
-            'english': 'en', 'inglés': 'en', 'ingles': 'en', 'en': 'en',
-            'french': 'fr', 'francés': 'fr', 'frances': 'fr', 'fr': 'fr',
-            'german': 'de', 'alemán': 'de', 'aleman': 'de', 'de': 'de',
-            'italian': 'it', 'italiano': 'it', 'it': 'it',
-            'portuguese': 'pt', 'portugués': 'pt', 'portugues': 'pt', 'pt': 'pt',
-            'russian': 'ru', 'ruso': 'ru', 'ru': 'ru',
-            'japanese': 'ja', 'japonés': 'ja', 'japones': 'ja', 'ja': 'ja',
-            'korean': 'ko', 'coreano': 'ko', 'ko': 'ko',
-            'chinese': 'zh', 'chino': 'zh', 'zh': 'zh',
-            'dutch': 'nl', 'holandés': 'nl', 'holandes': 'nl', 'nl': 'nl',
-            'arabic': 'ar', 'árabe': 'ar', 'arabe': 'ar', 'ar': 'ar'
-        }
-        
-        # Convertir idioma objetivo a código
-        target_lang_code = language_map.get(target_language.lower(), target_language.lower())
-        source_lang_code = language_map.get(source_language.lower(), source_language.lower()) if source_language != 'auto' else 'auto'
-        
-        # Crear traductor
-        translator = GoogleTranslator(source=source_lang_code, target=target_lang_code)
-        
-        # Traducir texto en chunks para evitar límites
-        max_length = 4000  # Límite conservador
-        if len(text) <= max_length:
+
+    def __init__(self, db_path: str, max_entries: int):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+        self.stats = {'lookups': 0, 'hits': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(text.split())
+
+    def _db(self):
+        # Llamar con self._lock tomado
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS memory ("
+                " source TEXT NOT NULL, target TEXT NOT NULL, text TEXT NOT NULL,"
+                " translation TEXT NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (source, target, text))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS memory_last_used ON memory (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def lookup_many(self, texts, source: str, target: str) -> dict:
+        """Devuelve {texto_normalizado: traducción} para los textos que ya están en memoria"""
+        if self.max_entries <= 0:
+            return {}
+        keys = list({self.normalize(t) for t in texts if t})
+        found = {}
+        with self._lock:
+            db = self._db()
+            # SQLite limita el número de parámetros por consulta
+            for i in range(0, len(keys), 500):
+                part = keys[i:i+500]
+                marks = ','.join('?' * len(part))
+                rows = db.execute(
+                    f"SELECT text, translation FROM memory WHERE source = ? AND target = ? AND text IN ({marks})",
+                    [source, target, *part],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                db.executemany(
+                    "UPDATE memory SET last_used = ? WHERE source = ? AND target = ? AND text = ?",
+                    [(time.time(), source, target, k) for k in found],
+                )
+                db.commit()
+            self.stats['lookups'] += len(keys)
+            self.stats['hits'] += len(found)
+        return found
+
+    def store_many(self, pairs: dict, source: str, target: str):
+        """Guarda {texto: traducción} y aplica el límite de tamaño"""
+        if self.max_entries <= 0 or not pairs:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "INSERT OR REPLACE INTO memory (source, target, text, translation, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(source, target, self.normalize(t), tr, now) for t, tr in pairs.items()],
+            )
+            self.stats['stores'] += len(pairs)
+            excess = db.execute("SELECT COUNT(*) FROM memory").fetchone()[0] - self.max_entries
+            if excess > 0:
+                db.execute("DELETE FROM memory WHERE rowid IN (SELECT rowid FROM memory ORDER BY last_used LIMIT ?)", (excess,))
+                self.stats['evictions'] += excess
+            db.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats['lookups']
+            return {**self.stats, 'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0}
+
+translation_memory = TranslationMemory(os.path.join(CACHE_FOLDER, 'translation_memory.sqlite3'),
+                                       int(os.environ.get('TRANSLATION_MEMORY_ENTRIES', '200000')))
+
+def build_translation_batches(texts: list, max_chars: int = TRANSLATE_BATCH_CHARS) -> list:
+    """Agrupa índices de textos no vacíos en lotes cuyo texto unido no supera max_chars"""
+    batches, current, size = [], [], 0
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        extra = len(text) + len(TRANSLATE_SEPARATOR)
+        if current and size + extra > max_chars:
+            batches.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += extra
+    if current:
+        batches.append(current)
+    return batches
+
+def _translate_with_retry(translator, text: str, retries: int = TRANSLATE_RETRIES) -> str:
+    delay = 0.5
+    for attempt in range(retries):
+        try:
             return translator.translate(text)
-        else:
-            # Dividir texto en chunks más pequeños
-            chunks = [text[i:i+max_length] for i in range(0, len(text), max_length)]
-            translated_chunks = []
-            for chunk in chunks:
-                translated_chunks.append(translator.translate(chunk))
-            return ' '.join(translated_chunks)
-            
-    except Exception as e:
-        print(f"⚠️  Error al traducir: {e}")
-        return text  # Retornar texto original si hay error
+        except Exception:
+            if attempt == retries - 1:
+                raise
+            time.sleep(delay)
+            delay *= 2
 
-def transcribe_and_translate_to_srt(audio_path: str, output_srt_path: str, target_language: str, model_size: str = "base") -> bool:
+def translate_segments(texts: list, target_language: str, source_language: str = 'auto',
+                       translator=None, workers: int = TRANSLATE_WORKERS,
+                       max_chars: int = TRANSLATE_BATCH_CHARS, on_progress=None,
+                       memory: TranslationMemory = None) -> list:
+    """
+    Traduce una lista de textos (uno por segmento) empaquetándolos en lotes, con varios lotes
+    en paralelo y reintentos con backoff. El resultado tiene la misma longitud y orden que texts.
+    Las líneas ya presentes en la memoria de traducción (o repetidas en el mismo job) no se
+    envían al traductor. Si un lote vuelve con distinto número de líneas se traduce segmento a
+    segmento; si un segmento falla del todo se conserva el texto original.
+    translator: objeto con .translate(texto), seguro entre hilos; por defecto un GoogleTranslator
+    del par de idiomas por hilo del pool, que además usa la memoria de traducción global si no
+    se indica otra.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    shared_translator = translator
+    if shared_translator is None:
+        if not TRANSLATOR_AVAILABLE:
+            raise Exception("Traductor no disponible. Instala: pip install deep-translator")
+        memory = memory or translation_memory
+    source_code, target_code = language_code(source_language), language_code(target_language)
+
+    # Un segmento por línea: los saltos internos romperían el mapeo de vuelta
+    clean = [TranslationMemory.normalize(t) for t in texts]
+    known = memory.lookup_many(clean, source_code, target_code) if memory else {}
+
+    # Solo se traduce una vez cada texto distinto que no esté en memoria
+    unique = [t for t in dict.fromkeys(clean) if t and t not in known]
+    batches = build_translation_batches(unique, max_chars)
+
+    # Los hilos del pool no heredan la traza activa: se les pasa junto con el span padre
+    trace = _current_trace.get()
+
+    def run_batch(indices, parent=None):
+        """Retorna ({texto: traducción}, textos que fallaron)"""
+        with trace.span('translate_batch', parent=parent, lines=len(indices)) if trace else nullcontext():
+            return _run_batch(indices)
+
+    def _run_batch(indices):
+        translator = shared_translator or get_translator(source_language, target_language)
+        joined = TRANSLATE_SEPARATOR.join(unique[i] for i in indices)
+        try:
+            lines = (_translate_with_retry(translator, joined) or '').split(TRANSLATE_SEPARATOR)
+        except Exception:
+            lines = []
+        if len(lines) == len(indices):
+            pairs = [(unique[i], line.strip()) for i, line in zip(indices, lines)]
+            return {text: line for text, line in pairs if line}, [text for text, line in pairs if not line]
+        # El traductor alteró la separación: traducir uno a uno para no desalinear
+        result, failed = {}, []
+        for i in indices:
+            try:
+                line = (_translate_with_retry(translator, unique[i]) or '').strip()
+            except Exception:
+                line = ''
+            if line:
+                result[unique[i]] = line
+            else:
+                failed.append(unique[i])
+        return result, failed
+
+    fresh = {}
+    with metrics.stage('translate'), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        parent = trace.current() if trace else None
+        futures = [pool.submit(run_batch, batch, parent) for batch in batches]
+        for done, future in enumerate(as_completed(futures), 1):
+            # Lo que falló (result no lo trae) se queda con el texto original y no entra en la memoria
+            result, _ = future.result()
+            fresh.update(result)
+            if on_progress:
+                on_progress(done, len(batches))
+
+    if memory:
+        # Una "traducción" idéntica al original suele ser un fallo del traductor: no se memoriza
+        memory.store_many({text: line for text, line in fresh.items() if line != text}, source_code, target_code)
+    known.update(fresh)
+    return [known.get(t, t) for t in clean]
+
+def transcribe_and_translate_to_srt(audio_path: str, output_srt_path: str, target_language: str, model_size: str = "base", workers: int = None) -> bool:
     """
     Transcribe audio usando Whisper y genera dos archivos SRT: original y traducido
     """
@@ -306,25 +2761,25 @@ def transcribe_and_translate_to_srt(audio_path: str, output_srt_path: str, targe
         print(f"❌ ERROR: Archivo de audio no encontrado: {audio_path}")
         return False
     
-    # Verificar tamaño del archivo
-    file_size = os.path.getsize(audio_path) / (1024 * 1024)  # MB
-    print(f"📁 Tamaño del archivo: {file_size:.1f} MB")
+    # Verificar tamaño del archivo (el sondeo queda memorizado para el resto del proceso)
+    info = probe_media(audio_path)
+    print(f"📁 Tamaño del archivo: {os.path.getsize(audio_path) / (1024 * 1024):.1f} MB")
     
-    if file_size > 100:  # Archivo muy grande
+    if info.is_large:  # Archivo muy grande
         print("⚠️  ARCHIVO GRANDE detectado. Esto puede tomar mucho tiempo.")
         print("💡 Sugerencia: Usa modelo 'tiny' o 'base' para archivos grandes")
         if model_size in ['large', 'medium']:
             print(f"⚠️  Modelo '{model_size}' puede ser muy lento para este archivo")
     
     try:
-        print(f"🤖 Cargando modelo Whisper ({model_size}) en {DEVICE.upper()}...")
-        model = whisper.load_model(model_size, device=DEVICE)
-        
         # Mostrar información del archivo
         duration = get_audio_info(audio_path)
         
-        print(f"🎵 Iniciando transcripción...")
-        result = transcribe_with_progress(model, audio_path, word_timestamps=True, fp16=(DEVICE == "cuda"))
+        print(f"🎚️  Decodificando audio a PCM 16 kHz en memoria...")
+        audio = load_audio_pcm(audio_path)
+        
+        result = transcribe_audio(audio, model_size, workers, show_progress=True,
+                                  word_timestamps=True, fp16=(DEVICE == "cuda"))
         
         # Crear rutas para ambos archivos SRT
         original_srt_path = output_srt_path
@@ -334,7 +2789,7 @@ def transcribe_and_translate_to_srt(audio_path: str, output_srt_path: str, targe
         print(f"🌍 Generando archivo SRT traducido: {translated_srt_path}")
         
         # Crear directorio de salida si no existe
-        os.makedirs(os.path.dirname(output_srt_path), exist_ok=True)
+        os.makedirs(os.path.dirname(output_srt_path) or '.', exist_ok=True)
         
         # Generar archivo SRT original
         with open(original_srt_path, 'w', encoding='utf-8') as f_orig:
@@ -355,26 +2810,10 @@ def transcribe_and_translate_to_srt(audio_path: str, output_srt_path: str, targe
         
         # Generar archivo SRT traducido
         print(f"🌍 Traduciendo subtítulos a {target_language}...")
-        with open(translated_srt_path, 'w', encoding='utf-8') as f_trans:
-            subtitle_index = 1
-            
-            for segment in result['segments']:
-                start_time = seconds_to_srt_time(segment['start'])
-                end_time = seconds_to_srt_time(segment['end'])
-                original_text = segment['text'].strip()
-                
-                # Traducir el texto
-                translated_text = translate_text(original_text, target_language)
-                
-                f_trans.write(f"{subtitle_index}\n")
-                f_trans.write(f"{start_time} --> {end_time}\n")
-                f_trans.write(f"{translated_text}\n\n")
-                
-                subtitle_index += 1
-                
-                # Mostrar progreso cada 10 subtítulos
-                if subtitle_index % 10 == 0:
-                    print(f"🔄 Traduciendo... {subtitle_index} subtítulos procesados")
+        translate_and_generate_srt(
+            result, translated_srt_path, target_language,
+            on_progress=lambda done, total: print(f"🔄 Traduciendo... lote {done}/{total}"),
+        )
         
         print(f"✅ Archivo SRT traducido generado: {translated_srt_path}")
         print(f"🎉 Proceso completado: 2 archivos SRT creados")
@@ -430,7 +2869,200 @@ def get_codec_args(target_format: str, use_gpu: bool = False) -> tuple:
     
     return codec_args, chosen_encoder if use_gpu or target_format == 'mp3' else None
 
-def convert_video_cli(input_path: str, output_path: str, target_format: str, use_gpu: bool = False) -> bool:
+# Salida progresiva: ffmpeg escribe a un pipe (sin volver atrás a reescribir cabeceras) y el
+# archivo solo crece, así /download puede servirlo mientras el encode sigue en marcha
+PROGRESSIVE_FORMATS = {'mp4', 'mkv'}
+PROGRESSIVE_CHUNK_BYTES = 256 * 1024
+PROGRESSIVE_POLL_SECONDS = float(os.environ.get('PROGRESSIVE_POLL_SECONDS', '0.5'))
+
+def progressive_args(target_format: str) -> list:
+    """Argumentos de muxer para una salida fragmentada que se puede leer mientras crece"""
+    if target_format == 'mp4':
+        # 'moov' vacío al inicio y un fragmento (moof+mdat) autocontenido por keyframe
+        return ['-movflags', '+frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4']
+    # Matroska en un pipe se escribe por clusters, sin cues ni duración al final
+    return ['-f', 'matroska']
+
+# Codificación segmentada: el video se corta en keyframes y los segmentos se codifican en paralelo
+SEGMENTED_MIN_SECONDS = float(os.environ.get('SEGMENTED_MIN_SECONDS', '120'))
+SEGMENTED_FORMATS = {'mp4', 'webm', 'avi', 'mkv'}
+AUDIO_CODEC_FLAGS = {'-c:a', '-b:a', '-q:a', '-ar', '-ac'}
+
+def default_segment_workers() -> int:
+    configured = int(os.environ.get('SEGMENT_WORKERS', '0'))
+    if configured > 0:
+        return configured
+    return max(2, min(8, (os.cpu_count() or 1) // 4))
+
+def can_segment(target_format: str, duration: float, codec_args: list = None) -> bool:
+    """El modo segmentado solo compensa en formatos de video, entradas largas y si el video se recodifica"""
+    if codec_args and copies_video(codec_args):
+        return False
+    return target_format in SEGMENTED_FORMATS and duration >= SEGMENTED_MIN_SECONDS
+
+def split_codec_args(codec_args: list) -> tuple:
+    """Separa los argumentos de get_codec_args en (video_args, audio_args)"""
+    video_args, audio_args = [], []
+    i = 0
+    while i < len(codec_args):
+        flag = codec_args[i]
+        if flag in ('-vn', '-an'):  # opciones sin valor
+            video_args.append(flag)
+            i += 1
+            continue
+        if flag == '-map':  # el mapeo de streams lo arma cada comando (ver plan_stream_copy)
+            i += 2
+            continue
+        pair = codec_args[i:i+2]
+        (audio_args if flag in AUDIO_CODEC_FLAGS else video_args).extend(pair)
+        i += 2
+    return video_args, audio_args
+
+# Códecs que cada contenedor destino admite tal cual, sin recodificar (stream copy / remux)
+STREAM_COPY_COMPAT = {
+    'mp4': {'video': {'h264', 'hevc', 'av1'}, 'audio': {'aac', 'mp3'}},
+    'mkv': {'video': {'h264', 'hevc', 'av1', 'vp9', 'vp8', 'mpeg4'}, 'audio': {'aac', 'mp3', 'opus', 'vorbis', 'flac', 'ac3'}},
+    'webm': {'video': {'vp8', 'vp9', 'av1'}, 'audio': {'opus', 'vorbis'}},
+    'avi': {'video': {'mpeg4'}, 'audio': {'mp3'}},
+    'mp3': {'video': set(), 'audio': {'mp3'}},
+}
+
+def copies_video(codec_args: list) -> bool:
+    return split_codec_args(codec_args)[0][:2] == ['-c:v', 'copy']
+
+def plan_stream_copy(input_path: str, target_format: str, codec_args: list) -> tuple:
+    """
+    Compara los códecs de la entrada con los que admite el contenedor destino y decide por
+    stream si se copia (-c copy) o se recodifica con los argumentos de get_codec_args.
+    Retorna (codec_args, resumen); el resumen es None si no se puede copiar nada.
+    """
+    compat = STREAM_COPY_COMPAT.get(target_format)
+    if not compat:
+        return codec_args, None
+    info = probe_media(input_path)
+    video, audio = info.video, info.audio
+    video_args, audio_args = split_codec_args(codec_args)
+
+    copy_video = video is not None and video.get('codec_name') in compat['video']
+    copy_audio = audio is not None and audio.get('codec_name') in compat['audio']
+    if not copy_video and not copy_audio:
+        return codec_args, None
+
+    if copy_video:
+        video_args = ['-c:v', 'copy']
+        if target_format == 'mp4' and video.get('codec_name') == 'hevc':
+            video_args += ['-tag:v', 'hvc1']  # etiqueta que esperan los reproductores de Apple
+    if copy_audio:
+        audio_args = ['-c:a', 'copy']
+
+    # El plan vale para estos streams concretos; el mapeo por defecto de ffmpeg puede elegir otros
+    # (el video de mayor resolución, el audio con más canales), así que se mapean explícitamente
+    maps = []
+    parts = []
+    if video is not None and target_format != 'mp3':
+        maps += ['-map', f"0:{video.get('index', 'v:0')}"]
+        parts.append(f"video {video.get('codec_name')}: {'copia' if copy_video else 'recodifica'}")
+    if audio is not None:
+        maps += ['-map', f"0:{audio.get('index', 'a:0')}"]
+        parts.append(f"audio {audio.get('codec_name')}: {'copia' if copy_audio else 'recodifica'}")
+    return maps + video_args + audio_args, " | ".join(parts)
+
+def segmented_encode(input_path: str, output_path: str, codec_args: list, duration: float,
+                     workers: int = None, on_progress=None, log=print) -> int:
+    """
+    Codifica un video largo en paralelo: corta la pista de video en keyframes (sin recodificar),
+    codifica los segmentos a la vez con los mismos argumentos de get_codec_args, codifica el
+    audio en una sola pasada (evita huecos en las uniones) y une todo con el demuxer concat.
+    Igual que el camino normal, conserva una pista de video y una de audio.
+    Retorna 0 si todo fue bien, 1 en caso contrario (como el código de salida de ffmpeg).
+    """
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = workers or default_segment_workers()
+    video_args, audio_args = split_codec_args(codec_args)
+    ext = Path(output_path).suffix
+    info = probe_media(input_path)
+    # Los cortes caen en keyframes: con GOPs largos, segmentos más cortos solo salen desiguales
+    segment_time = max(30.0, duration / (workers * 2), 2 * (info.keyframe_interval or 0.0))
+    work_dir = tempfile.mkdtemp(prefix='segenc-', dir=os.path.dirname(os.path.abspath(output_path)))
+
+    try:
+        # Paso 1: cortar en keyframes con stream copy
+        log(f"✂️  Dividiendo el video en segmentos de ~{segment_time:.0f}s (cortes en keyframes)...")
+        # El video que se sondeó, no una carátula (attached_pic) que ffmpeg cuente como 0:v:0
+        video_map = f"0:{(info.video or {}).get('index', 'v:0')}"
+        split_cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-y', '-i', input_path, '-map', video_map, '-an', '-c', 'copy',
+                     '-f', 'segment', '-segment_time', f'{segment_time:.3f}', '-reset_timestamps', '1',
+                     os.path.join(work_dir, 'src_%04d.mkv')]
+        subprocess.run(split_cmd, check=True, capture_output=True)
+        sources = sorted(p for p in os.listdir(work_dir) if p.startswith('src_'))
+        with_audio = info.has_audio
+        log(f"🧩 {len(sources)} segmentos, {workers} encodes en paralelo{' + audio' if with_audio else ''}")
+
+        # Paso 2: codificar segmentos (y audio) en paralelo, agregando el progreso
+        done_seconds = {}
+        lock = threading.Lock()
+
+        def run_ffmpeg(key, cmd, tracks_progress):
+            def update(snapshot):
+                if snapshot['out_time'] is None or duration <= 0:
+                    return
+                with lock:
+                    done_seconds[key] = snapshot['out_time']
+                    pct = max(0.0, min(100.0, sum(done_seconds.values()) / duration * 100.0))
+                if on_progress:
+                    on_progress(pct)
+
+            run = FFmpegRun(cmd, on_progress=update if tracks_progress else None)
+            ret = run.wait()
+            if ret != 0:
+                raise RuntimeError(f"ffmpeg salió con código {ret} en {key}: {run.last_line}")
+
+        encoded = []
+        with ThreadPoolExecutor(max_workers=workers + (1 if with_audio else 0)) as pool:
+            futures = []
+            for name in sources:
+                enc_path = os.path.join(work_dir, name.replace('src_', 'enc_').replace('.mkv', ext))
+                encoded.append(enc_path)
+                cmd = ['ffmpeg', '-hide_banner', '-y', '-i', os.path.join(work_dir, name), *video_args, '-an', enc_path]
+                futures.append(pool.submit(run_ffmpeg, name, cmd, True))
+            if with_audio:
+                audio_path = os.path.join(work_dir, f'audio{ext}')
+                cmd = ['ffmpeg', '-hide_banner', '-y', '-i', input_path, '-map', f"0:{info.audio.get('index', 'a:0')}",
+                       '-vn', *audio_args, audio_path]
+                futures.append(pool.submit(run_ffmpeg, 'audio', cmd, False))
+            for future in futures:
+                future.result()
+
+        # Paso 3: unir segmentos con el demuxer concat (sin recodificar)
+        log("🔗 Uniendo segmentos...")
+        list_path = os.path.join(work_dir, 'concat.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for enc_path in encoded:
+                escaped = enc_path.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        concat_cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-y', '-f', 'concat', '-safe', '0', '-i', list_path]
+        if with_audio:
+            concat_cmd += ['-i', audio_path, '-map', '0:v', '-map', '1:a']
+        concat_cmd += ['-c', 'copy', output_path]
+        subprocess.run(concat_cmd, check=True, capture_output=True)
+        if on_progress:
+            on_progress(100.0)
+        return 0
+
+    except subprocess.CalledProcessError as e:
+        stderr = (e.stderr or b'').decode('utf-8', errors='replace').strip().splitlines()
+        log(f"✗ Error en codificación segmentada: {stderr[-1] if stderr else e}")
+        return 1
+    except Exception as e:
+        log(f"✗ Error en codificación segmentada: {e}")
+        return 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def convert_video_cli(input_path: str, output_path: str, target_format: str, use_gpu: bool = False,
+                      segmented: bool = False, allow_copy: bool = True) -> bool:
     """
     Convierte un video usando ffmpeg en modo CLI
     Retorna True si la conversión fue exitosa, False en caso contrario
@@ -449,15 +3081,27 @@ def convert_video_cli(input_path: str, output_path: str, target_format: str, use
     # Obtener argumentos de codec
     codec_args, chosen_encoder = get_codec_args(target_format, use_gpu)
     
-    # Obtener duración para mostrar progreso
-    duration = ffprobe_duration(input_path)
+    # Copiar los streams que ya son compatibles con el contenedor destino
+    copy_plan = None
+    if allow_copy:
+        codec_args, copy_plan = plan_stream_copy(input_path, target_format, codec_args)
+    
+    # Obtener duración para mostrar progreso (mismo sondeo que usó plan_stream_copy)
+    info = probe_media(input_path)
+    duration = info.duration
     
     print(f"Convirtiendo: {input_path}")
+    if info.ok:
+        print(f"Entrada: {info.describe()}")
     print(f"Destino: {output_path}")
     print(f"Formato: .{target_format}")
     print(f"GPU: {'Sí' if use_gpu else 'No'}")
-    if chosen_encoder:
+    if chosen_encoder and not copies_video(codec_args):
         print(f"Encoder: {chosen_encoder}")
+    if copy_plan:
+        print(f"Stream copy: {copy_plan}")
+    if segmented:
+        print(f"Segmentado: {'Sí' if can_segment(target_format, duration, codec_args) else 'No (requiere video largo que se recodifique)'}")
     print("-" * 50)
     
     # Ejecutar ffmpeg
@@ -467,33 +3111,36 @@ def convert_video_cli(input_path: str, output_path: str, target_format: str, use
     start_time = time.time()
     
     try:
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
-        time_re = re.compile(r'time=(\d+):(\d+):(\d+(\.\d+)?)')
-        
-        for line in proc.stderr:
-            print(line.rstrip())
-            # Mostrar progreso si tenemos duración
-            if duration > 0:
-                m = time_re.search(line)
-                if m:
-                    hh, mm, ss = int(m.group(1)), int(m.group(2)), float(m.group(3))
-                    cur = hh*3600 + mm*60 + ss
-                    pct = max(0.0, min(100.0, (cur/duration)*100.0))
-                    print(f"\rProgreso: {pct:.1f}%", end="", flush=True)
-        
-        ret = proc.wait()
+        if segmented and can_segment(target_format, duration, codec_args):
+            ret = segmented_encode(
+                input_path, output_path, codec_args, duration,
+                on_progress=lambda pct: print(f"\rProgreso: {pct:.1f}%", end="", flush=True),
+                log=lambda msg: print(f"\n{msg}"),
+            )
+        else:
+            # El progreso llega por su propio pipe; el log de ffmpeg se imprime tal cual
+            run = FFmpegRun(
+                cmd, duration,
+                on_progress=lambda snap: print(f"\r{format_progress(snap)}", end="", flush=True),
+                on_log=print,
+            )
+            ret = run.wait()
         print()  # Nueva línea después del progreso
         
         # Calcular tiempo transcurrido
         end_time = time.time()
         elapsed_time = end_time - start_time
+        trace_add('encode', start_time, end_time, format=target_format, exit_code=ret)
         
         # Formatear tiempo en formato legible
         minutes = int(elapsed_time // 60)
         seconds = elapsed_time % 60
         time_str = f"{minutes:02d}:{seconds:05.2f}" if minutes > 0 else f"{seconds:.2f}s"
         
+        metrics.inc('converter_jobs_total', format=target_format, outcome='done' if ret == 0 else 'error')
         if ret == 0:
+            metrics.observe_stage('encode', elapsed_time, format=target_format)
+            metrics.observe_realtime('encode', duration, elapsed_time, format=target_format)
             print(f"✓ Conversión completada exitosamente: {output_path}")
             print(f"⏱️  Tiempo transcurrido: {time_str}")
             return True
@@ -503,24 +3150,190 @@ def convert_video_cli(input_path: str, output_path: str, target_format: str, use
             return False
             
     except Exception as e:
+        metrics.inc('converter_jobs_total', format=target_format, outcome='error')
         print(f"✗ Error durante la conversión: {e}")
         return False
 
+def convert_multi(input_path: str, output_base: str, targets: list, use_gpu: bool = False, allow_copy: bool = True,
+                  whisper_model: str = 'base', translate_language: str = '', log=print, on_progress=None) -> list:
+    """
+    Convierte una entrada a varios formatos con una sola invocación de ffmpeg (la entrada se
+    decodifica una vez y alimenta a todos los encoders). Si se pide 'srt', la misma invocación
+    saca además el audio en PCM 16 kHz por stdout, que va directo a la transcripción.
+    output_base es la ruta de salida sin extensión. Retorna la lista de archivos generados.
+    """
+    info = probe_media(input_path)
+    duration = info.duration
+    encode_targets = [t for t in targets if t != 'srt']
+    want_pcm = 'srt' in targets
+    if want_pcm and info.ok and not info.has_audio:
+        # -map 0:a:0 sin pista de audio haría fallar la invocación entera, no solo el SRT
+        if not encode_targets:
+            raise RuntimeError("La entrada no tiene pista de audio para generar subtítulos")
+        log("⚠️  La entrada no tiene pista de audio: se omiten los subtítulos")
+        want_pcm = False
+    produced = []
+
+    cmd = ['ffmpeg', '-hide_banner', '-y', '-i', input_path]
+    for target in encode_targets:
+        codec_args, chosen_encoder = get_codec_args(target, use_gpu and target != 'mp3')
+        plan = None
+        if allow_copy:
+            codec_args, plan = plan_stream_copy(input_path, target, codec_args)
+        path = f"{output_base}.{target}"
+        cmd += [*codec_args, path]
+        produced.append(path)
+        encoder = 'copia' if copies_video(codec_args) else (chosen_encoder or 'CPU')
+        log(f"Destino: .{target}  | Encoder: {encoder}" + (f"  | Stream copy: {plan}" if plan else ""))
+    if want_pcm:
+        cmd += ['-map', '0:a:0', '-vn', '-ac', '1', '-ar', str(WHISPER_SAMPLE_RATE),
+                '-acodec', 'pcm_s16le', '-f', 's16le', 'pipe:1']
+        log("🎧 Audio PCM para transcripción en la misma pasada")
+
+    # La transcripción (si la hay) ocupa el último tramo de la barra de progreso
+    encode_share = 70.0 if want_pcm else 100.0
+
+    def update(snapshot):
+        if snapshot['percent'] is not None and on_progress:
+            on_progress(snapshot['percent'] * encode_share / 100.0)
+
+    # Con PCM, stdout lleva el audio y el progreso viaja por stderr
+    run = FFmpegRun(cmd, duration, on_progress=update, capture_stdout=want_pcm)
+    pcm = run.stdout.read() if want_pcm else b''
+    ret = run.wait()
+    if ret != 0:
+        raise RuntimeError(f"ffmpeg salió con código {ret}: {run.last_line}")
+    if on_progress:
+        on_progress(encode_share)
+
+    if want_pcm:
+        import numpy as np
+        audio = np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+        result = transcribe_audio(audio, whisper_model, log=log, fp16=(DEVICE == "cuda"))
+        srt_path = f"{output_base}.srt"
+        generate_srt_from_result(result, srt_path)
+        produced.append(srt_path)
+        if translate_language:
+            translated_path = f"{output_base}_{translate_language}.srt"
+            with scheduler.slot('translate'):
+                translate_and_generate_srt(result, translated_path, translate_language)
+            produced.append(translated_path)
+        log("✅ Subtítulos generados")
+        if on_progress:
+            on_progress(100.0)
+
+    return produced
+
+# HLS: escalera de calidades (alto:kbps de video) codificada en una sola pasada de ffmpeg
+HLS_LADDER = os.environ.get('HLS_LADDER', '1080:5000,720:2800,480:1400,360:800')
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', '6'))
+HLS_AUDIO_BITRATE = os.environ.get('HLS_AUDIO_BITRATE', '128k')
+
+def parse_ladder(text: str) -> list:
+    """'1080:5000,720:2800' -> [(1080, 5000), (720, 2800)], de mayor a menor resolución"""
+    rungs = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        height, _, kbps = item.partition(':')
+        try:
+            rung = (int(height), int(kbps))
+        except ValueError:
+            raise ValueError(f"Escalón HLS inválido: '{item}' (usa alto:kbps, ej. 720:2800)")
+        if rung[0] < 144 or rung[0] % 2 or rung[1] <= 0:
+            raise ValueError(f"Escalón HLS inválido: '{item}' (alto par >= 144 y kbps > 0)")
+        rungs.append(rung)
+    if not rungs:
+        raise ValueError("La escalera HLS está vacía")
+    return sorted(set(rungs), reverse=True)
+
+def fit_ladder(ladder: list, source_height: int) -> list:
+    """Descarta los escalones por encima de la resolución de origen (nunca se reescala hacia arriba)"""
+    if not source_height:
+        return ladder
+    fitted = [rung for rung in ladder if rung[0] <= source_height]
+    return fitted or [(source_height - source_height % 2, ladder[-1][1])]
+
+def hls_encoder(use_gpu: bool) -> str:
+    return 'h264_nvenc' if use_gpu and has_encoder('h264_nvenc') else 'libx264'
+
+def hls_encode(input_path: str, out_dir: str, ladder: list, use_gpu: bool = False, log=print, on_progress=None) -> list:
+    """
+    Genera HLS con varias calidades en una sola invocación de ffmpeg: la entrada se decodifica
+    una vez, split reparte el video a un scale por escalón y todos los encoders corren en el mismo
+    grafo; el audio se codifica una sola vez como rendición compartida. Los keyframes se fuerzan
+    en cada corte de segmento para que el reproductor pueda cambiar de calidad en cualquiera.
+    Escribe master.m3u8, una playlist por calidad y sus segmentos en out_dir; retorna los archivos.
+    """
+    info = probe_media(input_path)
+    duration = info.duration
+    if info.streams and not info.has_video:
+        raise RuntimeError("La entrada no tiene video; HLS necesita una pista de video")
+    with_audio = info.has_audio
+    ladder = fit_ladder(ladder, info.height)
+    encoder = hls_encoder(use_gpu)
+    os.makedirs(out_dir, exist_ok=True)
+
+    n = len(ladder)
+    graph = (f"[0:v]split={n}" + ''.join(f"[s{i}]" for i in range(n)) + ';' +
+             ';'.join(f"[s{i}]scale=-2:{height}[v{i}]" for i, (height, _) in enumerate(ladder)))
+    cmd = ['ffmpeg', '-hide_banner', '-y', '-i', input_path, '-filter_complex', graph]
+    for i, (height, kbps) in enumerate(ladder):
+        cmd += ['-map', f'[v{i}]', f'-c:v:{i}', encoder, f'-b:v:{i}', f'{kbps}k',
+                f'-maxrate:v:{i}', f'{int(kbps * 1.07)}k', f'-bufsize:v:{i}', f'{kbps * 2}k']
+    cmd += ['-preset', 'p5' if encoder == 'h264_nvenc' else 'veryfast', '-pix_fmt', 'yuv420p',
+            '-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})']
+    if encoder == 'libx264':
+        cmd += ['-sc_threshold', '0']
+    variants = [f"v:{i},name:{height}p" for i, (height, _) in enumerate(ladder)]
+    if with_audio:
+        cmd += ['-map', '0:a:0', '-c:a', 'aac', '-b:a', HLS_AUDIO_BITRATE, '-ac', '2']
+        variants = ['a:0,agroup:audio,name:audio'] + [f"{v},agroup:audio" for v in variants]
+    cmd += ['-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+            '-hls_flags', 'independent_segments',
+            '-hls_segment_filename', os.path.join(out_dir, '%v_%05d.ts'),
+            '-master_pl_name', 'master.m3u8', '-var_stream_map', ' '.join(variants),
+            os.path.join(out_dir, '%v.m3u8')]
+
+    log(f"📺 HLS: {', '.join(f'{h}p@{k}k' for h, k in ladder)}  | Encoder: {encoder}" +
+        ("  | Audio: AAC compartido" if with_audio else "  | Sin audio"))
+
+    def update(snapshot):
+        if snapshot['percent'] is not None and on_progress:
+            on_progress(snapshot['percent'])
+
+    run = FFmpegRun(cmd, duration, on_progress=update)
+    ret = run.wait()
+    if ret != 0:
+        raise RuntimeError(f"ffmpeg salió con código {ret}: {run.last_line}")
+    if on_progress:
+        on_progress(100.0)
+    return sorted(os.path.join(out_dir, name) for name in os.listdir(out_dir))
+
 
 def allowed_file(filename: str) -> bool:
     return Path(filename).suffix.lower() in ALLOWED_EXTENSIONS
 
-def ffprobe_duration(path: str) -> float:
-    # Return duration in seconds (float) using ffprobe, or 0 if unknown.
-    try:
-        cmd = ['ffprobe','-v','error','-show_entries','format=duration','-of','default=noprint_wrappers=1:nokey=1', path]
-        out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, text=True).strip()
-        return float(out) if out else 0.0
-    except Exception:
-        return 0.0
+def progress_payload(job: dict) -> dict:
+    """
+    Datos del evento 'progress': porcentaje y métricas de ffmpeg (fps, velocidad = factor de
+    tiempo real, ETA). Si ffmpeg no da ETA (sin duración, segmentado), se estima con el tiempo
+    transcurrido y el porcentaje.
+    """
+    payload = {'progress': round(job['progress'], 1)}
+    payload.update(job['stats'] or {})
+    pct = job['progress']
+    if payload.get('eta') is None and job['started'] and 0.0 < pct < 100.0:
+        payload['eta'] = (time.time() - job['started']) * (100.0 - pct) / pct
+    if payload.get('eta') is not None:
+        payload['eta'] = round(payload['eta'], 1)
+    return payload
 
-def sse_format(event: str = None, data: str = "") -> str:
+def sse_format(event: str = None, data: str = "", id: int = None) -> str:
     chunks = []
+    if id is not None:
+        chunks.append(f"id: {id}")
     if event:
         chunks.append(f"event: {event}")
     # split multi-line data
@@ -540,25 +3353,19 @@ def generate_srt_from_result(whisper_result, output_path: str):
             f.write(f"{start_time} --> {end_time}\n")
             f.write(f"{text}\n\n")
 
-def translate_and_generate_srt(whisper_result, output_path: str, target_language: str):
-    """Traduce el resultado de Whisper y genera SRT traducido"""
+def translate_and_generate_srt(whisper_result, output_path: str, target_language: str, on_progress=None):
+    """Traduce el resultado de Whisper (por lotes y en paralelo) y genera SRT traducido"""
     if not TRANSLATOR_AVAILABLE:
         raise Exception("Traductor no disponible. Instala: pip install deep-translator")
     
-    translator = GoogleTranslator(target=target_language)
+    segments = whisper_result['segments']
+    translated = translate_segments([s['text'].strip() for s in segments], target_language, on_progress=on_progress)
     
     with open(output_path, 'w', encoding='utf-8') as f:
-        for i, segment in enumerate(whisper_result['segments'], 1):
+        for i, (segment, translated_text) in enumerate(zip(segments, translated), 1):
             start_time = seconds_to_srt_time(segment['start'])
             end_time = seconds_to_srt_time(segment['end'])
             
-            # Traducir el texto
-            original_text = segment['text'].strip()
-            try:
-                translated_text = translator.translate(original_text)
-            except Exception:
-                translated_text = original_text  # Fallback al texto original
-            
             f.write(f"{i}\n")
             f.write(f"{start_time} --> {end_time}\n")
             f.write(f"{translated_text}\n\n")
@@ -569,214 +3376,1188 @@ def index():
 
 @app.route("/convert", methods=["POST"])
 def convert():
+    # El cuerpo multipart se recibe al acceder a request.files: la subida cuenta desde aquí
+    upload_start = time.perf_counter()
     if 'file' not in request.files:
         abort(400, "No se envió archivo.")
     f = request.files['file']
+    if f.filename == '':
+        abort(400, "Nombre de archivo vacío.")
+    options = parse_job_options(f.filename)
+
+    job_id = create_job(f.filename, **options)
+    input_path = jobs[job_id]['spec']['input_path']
+    jobs[job_id]['spec']['input_hash'] = save_stream_hashed(f.stream, input_path)
+    elapsed = time.perf_counter() - upload_start
+    metrics.observe_stage('upload', elapsed, format=options['target_format'])
+    trace = jobs[job_id]['trace']
+    trace.add('upload', time.time() - elapsed, time.time(), format=options['target_format'])
+
+    # Un solo sondeo: duración para el porcentaje y el resto viaja en el spec al worker
+    with trace.activate():
+        remember_media(jobs[job_id], probe_media(input_path))
+    submit_job(job_id)
+
+    return jsonify({'job_id': job_id, 'download_url': url_for('download', job_id=job_id, _external=False)})
+
+def parse_job_options(filename: str) -> dict:
+    """Valida los campos del formulario comunes a /convert y /jobs"""
     target_format = request.form.get('format', '').lower().strip()
+    # Varios formatos a la vez ('formats' repetido): un solo job que decodifica la entrada una vez
+    targets = list(dict.fromkeys(t.lower().strip() for t in request.form.getlist('formats') if t.strip()))
+    if len(targets) == 1:
+        target_format, targets = targets[0], []
+    elif targets:
+        if any(t not in MULTI_FORMATS for t in targets):
+            abort(400, "Formato objetivo inválido.")
+        target_format = 'multi'
     use_gpu = request.form.get('gpu', 'off') == 'on'
+    segmented = request.form.get('segmented', 'off') == 'on'
+    progressive = request.form.get('progressive', 'off') == 'on' and target_format in PROGRESSIVE_FORMATS
+    allow_copy = request.form.get('reencode', 'off') != 'on'
+    profile = request.form.get('profile', 'off') == 'on'
+    try:
+        priority = max(0, min(9, int(request.form.get('priority', 5))))
+    except ValueError:
+        priority = 5
 
-    if target_format not in {'mp4','webm','avi','mkv','mp3','srt'}:
+    if target_format not in TARGET_FORMATS and target_format != 'multi':
         abort(400, "Formato objetivo inválido.")
-    if f.filename == '':
-        abort(400, "Nombre de archivo vacío.")
-    if not allowed_file(f.filename):
+    if not allowed_file(filename):
         abort(400, "Tipo de archivo no permitido.")
+    if (target_format == 'srt' or 'srt' in targets) and not WHISPER_AVAILABLE:
+        abort(400, "Whisper no está disponible. Instala: pip install openai-whisper")
+    ladder = request.form.get('ladder', '').strip() if target_format == 'hls' else ''
+    if ladder:
+        try:
+            parse_ladder(ladder)
+        except ValueError as e:
+            abort(400, str(e))
+
+    return {
+        'target_format': target_format,
+        'targets': targets,
+        'use_gpu': use_gpu,
+        'segmented': segmented,
+        'progressive': progressive,
+        'allow_copy': allow_copy,
+        'priority': priority,
+        'whisper_model': request.form.get('whisper_model', 'base'),
+        'translate_language': request.form.get('translate_language', '').strip(),
+        'ladder': ladder,
+        'profile': profile,
+    }
 
-    orig_name = secure_filename(f.filename)
+def job_resource(target_format: str, chosen_encoder) -> str:
+    """Clase de recurso que ocupará el job en el planificador"""
+    if target_format == 'srt':
+        return 'whisper'
+    if chosen_encoder and chosen_encoder.endswith('_nvenc'):
+        return 'nvenc'
+    return 'cpu'
+
+def create_job(filename: str, target_format: str, use_gpu: bool = False, priority: int = 5,
+               whisper_model: str = 'base', translate_language: str = '', segmented: bool = False,
+               allow_copy: bool = True, targets: list = None, progressive: bool = False,
+               ladder: str = '', profile: bool = False) -> str:
+    """Registra un job nuevo con sus rutas de entrada/salida y devuelve su id"""
+    orig_name = secure_filename(filename)
     ts = datetime.now().strftime("%Y%m%d-%H%M%S")
     input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{ts}-{orig_name}")
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['CONVERTED_FOLDER'], exist_ok=True)
-    f.save(input_path)
 
     base_name = Path(orig_name).stem
     
+    # Varios formatos (o el paquete HLS: playlists + segmentos): todo va en un ZIP
+    if target_format in ('multi', 'hls'):
+        out_name = f"{base_name}-{ts}.zip"
     # Manejar formato SRT (subtítulos)
-    if target_format == 'srt':
-        if not WHISPER_AVAILABLE:
-            abort(400, "Whisper no está disponible. Instala: pip install openai-whisper")
-        
-        whisper_model = request.form.get('whisper_model', 'base')
-        translate_language = request.form.get('translate_language', '').strip()
-        
+    elif target_format == 'srt':
         # Para SRT, el output puede ser múltiple si hay traducción
         if translate_language:
             out_name = f"{base_name}-{ts}.zip"  # ZIP con ambos SRT
-            output_path = os.path.join(app.config['CONVERTED_FOLDER'], out_name)
         else:
             out_name = f"{base_name}-{ts}.srt"
-            output_path = os.path.join(app.config['CONVERTED_FOLDER'], out_name)
     else:
         out_name = f"{base_name}-{ts}.{target_format}"
-        output_path = os.path.join(app.config['CONVERTED_FOLDER'], out_name)
+    output_path = os.path.join(app.config['CONVERTED_FOLDER'], out_name)
 
     # Obtener argumentos de codec (solo para formatos de video/audio)
-    if target_format != 'srt':
+    if target_format == 'multi':
+        # Cada destino resuelve sus argumentos en convert_multi; aquí solo importa el recurso
+        codec_args = []
+        chosen_encoder = next((get_codec_args(t, use_gpu)[1] for t in targets if t not in ('srt', 'mp3')), None)
+    elif target_format == 'hls':
+        codec_args = []
+        chosen_encoder = 'h264_nvenc' if hls_encoder(use_gpu) == 'h264_nvenc' else None
+    elif target_format != 'srt':
         codec_args, chosen_encoder = get_codec_args(target_format, use_gpu)
     else:
         codec_args, chosen_encoder = [], None
 
-    # Precalcular duración para porcentaje
-    duration = ffprobe_duration(input_path)
-
     job_id = uuid.uuid4().hex
+    # 'uploading' hasta que submit_job lo encole: claim() no debe tomarlo sin el archivo completo
     jobs[job_id] = {
-        'status': 'running',
-        'duration': duration,
+        'id': job_id,
+        'status': 'uploading',
+        'resource': job_resource('srt' if 'srt' in (targets or []) else target_format, chosen_encoder),
+        'priority': priority,
+        'duration': 0.0,
         'progress': 0.0,
-        'log': queue.Queue(),
+        'stats': None,
+        'created': time.time(),
+        'started': None,
+        'finished': None,
+        'downloaded': None,
+        'log': JobEvents(job_id),
         'output_path': output_path,
         'download_name': out_name,
-        'error': None
+        'error': None,
+        'trace': JobTrace(),
+        'spec': {
+            'input_path': input_path,
+            'output_path': output_path,
+            'base_name': base_name,
+            'target_format': target_format,
+            'targets': targets or [],
+            'use_gpu': use_gpu,
+            'segmented': segmented,
+            'progressive': progressive,
+            'allow_copy': allow_copy,
+            'codec_args': codec_args,
+            'chosen_encoder': chosen_encoder,
+            'input_hash': None,
+            'whisper_model': whisper_model,
+            'translate_language': translate_language,
+            'ladder': ladder or HLS_LADDER,
+            'profile': profile,
+        },
     }
+    job_store.save(job_id, jobs[job_id])
+    return job_id
 
-    # Ejecutar conversión en hilo aparte
-    def run_conversion():
-        try:
-            if target_format == 'srt':
-                # Procesamiento de subtítulos con IA
-                whisper_model = request.form.get('whisper_model', 'base')
-                translate_language = request.form.get('translate_language', '').strip()
-                
-                jobs[job_id]['log'].put_nowait(f"🤖 Iniciando transcripción con IA...")
-                jobs[job_id]['log'].put_nowait(f"Modelo Whisper: {whisper_model}")
-                if translate_language:
-                    jobs[job_id]['log'].put_nowait(f"Traducción a: {translate_language}")
-                
-                # Paso 1: Extraer audio MP3
-                jobs[job_id]['log'].put_nowait("📂 Extrayendo audio...")
-                jobs[job_id]['progress'] = 10.0
-                
-                mp3_path = input_path.replace(Path(input_path).suffix, '.mp3')
-                mp3_cmd = ['ffmpeg', '-hide_banner', '-y', '-i', input_path, '-q:a', '0', '-map', 'a', mp3_path]
-                subprocess.run(mp3_cmd, check=True, capture_output=True)
-                
-                # Paso 2: Transcribir con Whisper
-                jobs[job_id]['log'].put_nowait(f"🎧 Transcribiendo audio con IA en {DEVICE.upper()}...")
-                jobs[job_id]['progress'] = 30.0
-                
-                model = whisper.load_model(whisper_model, device=DEVICE)
-                result = model.transcribe(mp3_path, fp16=(DEVICE == "cuda"))
-                
-                jobs[job_id]['progress'] = 70.0
+def remember_media(job: dict, info: MediaInfo):
+    """Guarda en el job la duración y el sondeo completo, para que el worker no vuelva a sondear"""
+    job['duration'] = info.duration
+    job['spec']['media'] = info.data
+    if info.ok:
+        job['log'].put_nowait(f"🔎 {info.describe()}")
+
+def submit_job(job_id: str):
+    """
+    Deja el job en la cola durable (JobStore) para que lo reclame un worker, embebido o
+    `--worker`; si la cola está llena lo descarta y responde 503
+    """
+    # Lo ejecuta (y lo vuelve a cargar) el worker que lo reclame, quizá en otro proceso
+    job = jobs.pop(job_id)
+    if job_store.queue_stats()['queued'] >= scheduler.max_queued:
+        job_store.delete(job_id)
+        try: os.remove(job['spec']['input_path'])
+        except Exception: pass
+        abort(503, f"Cola llena ({scheduler.max_queued} trabajos en espera)")
+    job['status'] = 'queued'
+    job_store.save(job_id, job)  # duración y hash de entrada ya calculados
+    job_worker.wake()
+
+def job_ffmpeg_callbacks(job_id: str, track_percent: bool = True) -> tuple:
+    """
+    Callbacks de FFmpegRun para un job: el progreso actualiza porcentaje y métricas (fps,
+    velocidad, ETA) y el log crudo de ffmpeg va al buffer aparte del bus de eventos.
+    """
+    job = jobs[job_id]
+
+    def on_progress(snapshot):
+        fields = {'stats': {k: snapshot[k] for k in PROGRESS_STATS_FIELDS}}
+        if track_percent and snapshot['percent'] is not None:
+            fields['progress'] = snapshot['percent']
+        update_job(job, **fields)
+
+    def on_log(line):
+        job['log'].publish('ffmpeg', line, raw=True)
+
+    return on_progress, on_log
+
+def report_ffmpeg_failure(job: dict, run: 'FFmpegRun', ret: int):
+    """Marca el job como fallido y copia al log principal las últimas líneas de ffmpeg"""
+    for line in run.last_lines:
+        job['log'].put_nowait(line)
+    update_job(job, status='error',
+               error=f"ffmpeg salió con código {ret}: {run.last_line}" if run.last_line else f"ffmpeg salió con código {ret}")
+
+def run_conversion(job_id: str):
+    """
+    Ejecuta la conversión (o transcripción) de un job ya registrado. Sus etapas quedan en la
+    traza del job (GET /jobs/<id>/trace), con el perfil de cProfile si el job lo pidió.
+    """
+    job = jobs[job_id]
+    # El job pudo crearse en otro proceso: se continúa la traza guardada (subida, probe)
+    trace = job.get('trace') or JobTrace(job_store.load_trace(job_id))
+    job['trace'] = trace
+    try:
+        with trace.activate(), trace.profile(job['spec'].get('profile', False)):
+            with trace.span('job', format=job['spec']['target_format'], resource=job['resource']):
+                _run_conversion(job_id)
+    finally:
+        if job.get('started'):
+            trace.add('queued', job['created'], job['started'])
+        job_store.save_trace(job_id, trace.to_dict())
+
+def _run_conversion(job_id: str):
+    job = jobs[job_id]
+    spec = job['spec']
+    # El sondeo hecho al recibir el archivo (quizá en otro proceso) sirve para todo el job
+    probe_media.seed(spec['input_path'], spec.get('media'))
+    input_path = spec['input_path']
+    output_path = spec['output_path']
+    base_name = spec['base_name']
+    target_format = spec['target_format']
+    whisper_model = spec['whisper_model']
+    translate_language = spec['translate_language']
+
+    update_job(job, status='running', started=time.time())
+    metrics.observe_stage('queue_wait', job['started'] - job['created'], format=target_format)
+    try:
+        if target_format == 'multi':
+            import zipfile
+            job['log'].put_nowait(f"📦 Varios formatos en un solo decode: {', '.join(spec['targets'])}")
+            work_dir = output_path[:-len('.zip')] + '-parts'
+            os.makedirs(work_dir, exist_ok=True)
+            try:
+                with metrics.stage('encode', format='multi') as stage:
+                    produced = convert_multi(
+                        input_path, os.path.join(work_dir, base_name), spec['targets'], spec['use_gpu'],
+                        spec['allow_copy'], whisper_model, translate_language,
+                        log=job['log'].put_nowait, on_progress=lambda pct: update_job(job, progress=pct),
+                    )
+                metrics.observe_realtime('encode', job['duration'], stage.elapsed, format='multi')
+                with trace_span('zip', files=len(produced)), zipfile.ZipFile(output_path, 'w') as zipf:
+                    for path in produced:
+                        zipf.write(path, os.path.basename(path))
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            job['log'].put_nowait(f"✅ Creado ZIP con {len(produced)} archivos")
+            update_job(job, progress=100.0)
+            
+        elif target_format == 'hls':
+            import zipfile
+            work_dir = output_path[:-len('.zip')] + '-hls'
+            try:
+                with metrics.stage('encode', format='hls') as stage:
+                    produced = hls_encode(
+                        input_path, work_dir, parse_ladder(spec['ladder']), spec['use_gpu'],
+                        log=job['log'].put_nowait, on_progress=lambda pct: update_job(job, progress=pct),
+                    )
+                metrics.observe_realtime('encode', job['duration'], stage.elapsed, format='hls')
+                # Segmentos ya comprimidos: ZIP sin deflate
+                with trace_span('zip', files=len(produced)), zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED) as zipf:
+                    for path in produced:
+                        zipf.write(path, os.path.basename(path))
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            job['log'].put_nowait(f"✅ Paquete HLS con {len(produced)} archivos (abrir master.m3u8)")
+            
+        elif target_format == 'srt':
+            # Procesamiento de subtítulos con IA
+            job['log'].put_nowait(f"🤖 Iniciando transcripción con IA...")
+            job['log'].put_nowait(f"Modelo Whisper: {whisper_model}")
+            if translate_language:
+                job['log'].put_nowait(f"Traducción a: {translate_language}")
+            
+            # Paso 1: Decodificar audio a PCM 16 kHz en memoria
+            job['log'].put_nowait("📂 Extrayendo audio...")
+            update_job(job, progress=10.0)
+            
+            audio = load_audio_pcm(input_path)
+            
+            # Paso 2: Transcribir con Whisper
+            job['log'].put_nowait(f"🎧 Transcribiendo audio con IA en {DEVICE.upper()}...")
+            update_job(job, progress=30.0)
+            
+            def on_chunk(done, total):
+                job['log'].put_nowait(f"🧩 Fragmento {done}/{total} transcrito")
+                update_job(job, progress=30.0 + 40.0 * done / total)
+            result = transcribe_audio(audio, whisper_model, on_progress=on_chunk,
+                                      log=job['log'].put_nowait, fp16=(DEVICE == "cuda"))
+            
+            update_job(job, progress=70.0)
+            
+            # Paso 3: Generar SRT
+            if translate_language:
+                job['log'].put_nowait("🌍 Generando subtítulos con traducción...")
+                import zipfile
                 
-                # Paso 3: Generar SRT
-                if translate_language:
-                    jobs[job_id]['log'].put_nowait("🌍 Generando subtítulos con traducción...")
-                    import zipfile
-                    
-                    # Generar SRT original
-                    original_srt = output_path.replace('.zip', '_original.srt')
+                # Generar SRT original
+                original_srt = output_path.replace('.zip', '_original.srt')
+                with trace_span('write_srt'):
                     generate_srt_from_result(result, original_srt)
-                    
-                    # Traducir y generar SRT traducido
-                    translated_srt = output_path.replace('.zip', f'_{translate_language}.srt')
-                    translate_and_generate_srt(result, translated_srt, translate_language)
-                    
-                    # Crear ZIP con ambos SRT
-                    with zipfile.ZipFile(output_path, 'w') as zipf:
-                        zipf.write(original_srt, f"{base_name}_original.srt")
-                        zipf.write(translated_srt, f"{base_name}_{translate_language}.srt")
-                    
-                    # Limpiar archivos temporales
-                    os.remove(original_srt)
-                    os.remove(translated_srt)
-                    
-                    jobs[job_id]['log'].put_nowait(f"✅ Creado ZIP con SRT original + {translate_language}")
-                else:
-                    jobs[job_id]['log'].put_nowait("📝 Generando archivo SRT...")
-                    generate_srt_from_result(result, output_path)
-                    jobs[job_id]['log'].put_nowait("✅ Subtítulos generados exitosamente")
                 
-                # Limpiar MP3 temporal
-                os.remove(mp3_path)
-                jobs[job_id]['progress'] = 100.0
+                # Traducir y generar SRT traducido
+                translated_srt = output_path.replace('.zip', f'_{translate_language}.srt')
+                with scheduler.slot('translate'):
+                    translate_and_generate_srt(
+                        result, translated_srt, translate_language,
+                        on_progress=lambda done, total: job['log'].put_nowait(f"🌍 Traduciendo... lote {done}/{total}"),
+                    )
                 
-            else:
-                # Conversión de video/audio con ffmpeg
-                jobs[job_id]['log'].put_nowait(f"Destino: .{target_format}  | GPU: {'Sí' if use_gpu else 'No'}  | Encoder: {chosen_encoder or 'CPU'}")
-                
-                cmd = ['ffmpeg','-hide_banner','-y','-i', input_path, *codec_args, output_path]
-                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
-                time_re = re.compile(r'time=(\d+):(\d+):(\d+(\.\d+)?)')
+                # Crear ZIP con ambos SRT
+                with trace_span('zip', files=2), zipfile.ZipFile(output_path, 'w') as zipf:
+                    zipf.write(original_srt, f"{base_name}_original.srt")
+                    zipf.write(translated_srt, f"{base_name}_{translate_language}.srt")
                 
-                for line in proc.stderr:
-                    # Encolar línea
-                    try: jobs[job_id]['log'].put_nowait(line.rstrip())
-                    except queue.Full: pass
-                    # Extraer tiempo
-                    m = time_re.search(line)
-                    if m and duration > 0:
-                        hh, mm, ss = int(m.group(1)), int(m.group(2)), float(m.group(3))
-                        cur = hh*3600 + mm*60 + ss
-                        pct = max(0.0, min(100.0, (cur/duration)*100.0))
-                        jobs[job_id]['progress'] = pct
+                # Limpiar archivos temporales
+                os.remove(original_srt)
+                os.remove(translated_srt)
                 
-                ret = proc.wait()
-                if ret == 0:
-                    jobs[job_id]['progress'] = 100.0
-                else:
-                    jobs[job_id]['status'] = 'error'
-                    jobs[job_id]['error'] = f"ffmpeg salió con código {ret}"
-                    return
+                job['log'].put_nowait(f"✅ Creado ZIP con SRT original + {translate_language}")
+            else:
+                job['log'].put_nowait("📝 Generando archivo SRT...")
+                with trace_span('write_srt'):
+                    generate_srt_from_result(result, output_path)
+                job['log'].put_nowait("✅ Subtítulos generados exitosamente")
+            
+            update_job(job, progress=100.0)
             
-            # Limpieza del archivo subido
-            try: os.remove(input_path)
-            except Exception: pass
+        else:
+            # Conversión de video/audio con ffmpeg
+            codec_args = spec['codec_args']
+            copy_plan = None
+            if spec['allow_copy']:
+                codec_args, copy_plan = plan_stream_copy(input_path, target_format, codec_args)
+            encoder = 'copia' if copies_video(codec_args) else (spec['chosen_encoder'] or 'CPU')
+            job['log'].put_nowait(f"Destino: .{target_format}  | GPU: {'Sí' if spec['use_gpu'] else 'No'}  | Encoder: {encoder}")
+            if copy_plan:
+                job['log'].put_nowait(f"⚡ Stream copy: {copy_plan}")
             
-            jobs[job_id]['status'] = 'done'
+            progressive = spec.get('progressive', False)
+            if progressive:
+                # Los segmentos se concatenan al final; la salida progresiva necesita un solo muxer
+                codec_args = [*codec_args, *progressive_args(target_format)]
+                job['log'].put_nowait("📶 Salida fragmentada: se puede descargar mientras se convierte")
+            use_segmented = not progressive and spec['segmented'] and can_segment(target_format, job['duration'], codec_args)
+            cache_key = None
+            if spec['input_hash']:
+                cache_key = output_cache_key(spec, copy_plan, segmented=use_segmented)
             
-        except Exception as e:
-            jobs[job_id]['status'] = 'error'
-            jobs[job_id]['error'] = str(e)
-            try: jobs[job_id]['log'].put_nowait(f"❌ Error: {str(e)}")
-            except: pass
+            encode_start = time.perf_counter()
+            # El span cubre también los encodes fallidos (que no cuentan en las métricas)
+            with trace_span('encode', format=target_format, segmented=use_segmented or None):
+                cache_hit = bool(cache_key) and output_cache.fetch(cache_key, output_path)
+                if cache_hit:
+                    job['log'].put_nowait("♻️  Resultado encontrado en caché; no es necesario convertir")
+                    ret = 0
+                elif use_segmented:
+                    # El job ya ocupa un slot; cada encode en paralelo de más ocupa otro, y si no
+                    # hay libres se codifica con menos workers en vez de pasarse del cupo
+                    wanted = scheduler.slots['nvenc'] if job['resource'] == 'nvenc' else default_segment_workers()
+                    with scheduler.extra_slots(job['resource'], wanted - 1) as extra:
+                        ret = segmented_encode(
+                            input_path, output_path, codec_args, job['duration'],
+                            workers=1 + extra,
+                            on_progress=lambda pct: update_job(job, progress=pct),
+                            log=job['log'].put_nowait,
+                        )
+                elif progressive:
+                    cmd = ['ffmpeg','-hide_banner','-y','-i', input_path, *codec_args, 'pipe:1']
+                    run = FFmpegRun(cmd, job['duration'], *job_ffmpeg_callbacks(job_id), stdout_path=output_path)
+                    ret = run.wait()
+                    if ret != 0:
+                        report_ffmpeg_failure(job, run, ret)
+                        return
+                else:
+                    cmd = ['ffmpeg','-hide_banner','-y','-i', input_path, *codec_args, output_path]
+                    run = FFmpegRun(cmd, job['duration'], *job_ffmpeg_callbacks(job_id))
+                    ret = run.wait()
+                    if ret != 0:
+                        report_ffmpeg_failure(job, run, ret)
+                        return
+            if ret == 0:
+                if not cache_hit:
+                    elapsed = time.perf_counter() - encode_start
+                    metrics.observe_stage('encode', elapsed, format=target_format)
+                    metrics.observe_realtime('encode', job['duration'], elapsed, format=target_format)
+                update_job(job, progress=100.0)
+                if cache_key and not cache_hit:
+                    output_cache.store(cache_key, output_path)
+            else:
+                update_job(job, status='error', error=f"ffmpeg salió con código {ret}")
+                return
+        
+        update_job(job, status='done')
+        
+    except Exception as e:
+        job['log'].put_nowait(f"❌ Error: {str(e)}")
+        update_job(job, status='error', error=str(e))
+    finally:
+        # Limpieza del archivo subido (también si la conversión falló)
+        try: os.remove(input_path)
+        except Exception: pass
 
-    threading.Thread(target=run_conversion, daemon=True).start()
+# Contenedores que ffmpeg puede leer secuencialmente desde un pipe
+STREAMABLE_EXTENSIONS = {'.mkv', '.webm', '.flv', '.avi'}
+# MP4/MOV solo se pueden leer desde un pipe si el átomo 'moov' va antes que 'mdat' (faststart)
+MP4_EXTENSIONS = {'.mp4', '.mov', '.m4v'}
+STREAM_HEAD_BYTES = 256 * 1024
+STREAM_CHUNK_BYTES = 1024 * 1024
 
-    return jsonify({'job_id': job_id, 'download_url': url_for('download', job_id=job_id, _external=False)})
+def mp4_moov_first(head: bytes) -> bool:
+    """Recorre los átomos de primer nivel del inicio del archivo y dice si 'moov' precede a 'mdat'"""
+    pos = 0
+    while pos + 8 <= len(head):
+        size = int.from_bytes(head[pos:pos+4], 'big')
+        box = head[pos+4:pos+8]
+        if box == b'moov':
+            return True
+        if box == b'mdat':
+            return False
+        if size == 1:  # tamaño de 64 bits
+            if pos + 16 > len(head):
+                return False
+            size = int.from_bytes(head[pos+8:pos+16], 'big')
+        if size < 8:
+            return False
+        pos += size
+    return False
+
+def can_stream_input(filename: str, head: bytes) -> bool:
+    ext = Path(filename).suffix.lower()
+    if ext in STREAMABLE_EXTENSIONS:
+        return True
+    if ext in MP4_EXTENSIONS:
+        return mp4_moov_first(head)
+    return False
+
+@app.route('/jobs', methods=['POST'])
+def create_stream_job():
+    """Crea un job cuyo archivo se enviará después con PUT /upload/<job_id> (modo streaming)"""
+    filename = request.form.get('filename', '')
+    if filename == '':
+        abort(400, "Nombre de archivo vacío.")
+    options = parse_job_options(filename)
+    if options['target_format'] in ('srt', 'multi', 'hls'):
+        abort(400, "El modo streaming no aplica para SRT, HLS ni para varios formatos; usa /convert.")
+
+    job_id = create_job(filename, **options)
+    # Lo adopta el proceso que reciba el PUT (puede ser otro en modo --serve)
+    del jobs[job_id]
+    return jsonify({
+        'job_id': job_id,
+        'upload_url': url_for('upload_stream', job_id=job_id, _external=False),
+        'download_url': url_for('download', job_id=job_id, _external=False),
+    })
+
+@app.route('/upload/<job_id>', methods=['PUT'])
+def upload_stream(job_id):
+    """
+    Recibe el cuerpo de la petición y lo pasa directamente al stdin de ffmpeg mientras llega,
+    de modo que el encode se solapa con la subida. Si el contenedor necesita seek, se guarda
+    en disco y se sigue el camino normal del planificador.
+    """
+    job = adopt_job(job_id)
+    if not job:
+        abort(404, 'Job no encontrado')
+    if job['status'] != 'uploading':
+        abort(409, 'El job ya recibió su archivo')
+    spec = job['spec']
+    trace = job['trace'] = job.get('trace') or JobTrace(job_store.load_trace(job_id))
+    total = request.content_length or 0
+    stream = request.stream
+    head = stream.read(STREAM_HEAD_BYTES)
+
+    if not can_stream_input(spec['input_path'], head):
+        job['log'].put_nowait("💾 El formato requiere acceso aleatorio; guardando en disco antes de convertir...")
+        with trace.activate():
+            with metrics.stage('upload', format=spec['target_format']):
+                spec['input_hash'] = save_stream_hashed(stream, spec['input_path'], head)
+            remember_media(job, probe_media(spec['input_path']))
+        submit_job(job_id)
+        return jsonify({'job_id': job_id, 'streamed': False})
+
+    # Corre en este proceso; el lease evita que un worker lo reclame de la cola mientras tanto,
+    # hasta que el estado final ya está guardado
+    with job_worker.hold(job_id), trace.activate(), trace.profile(spec.get('profile', False)):
+        update_job(job, status='queued')
+        try:
+            with scheduler.slot(job['resource']), trace.span('job', format=spec['target_format'], resource=job['resource'], streamed=True):
+                update_job(job, status='running', started=time.time())
+                job['log'].put_nowait(f"⚡ Modo streaming: convirtiendo mientras se sube el archivo")
+                job['log'].put_nowait(f"Destino: .{spec['target_format']}  | GPU: {'Sí' if spec['use_gpu'] else 'No'}  | Encoder: {spec['chosen_encoder'] or 'CPU'}")
+
+                codec_args = spec['codec_args']
+                if spec.get('progressive'):
+                    codec_args = [*codec_args, *progressive_args(spec['target_format'])]
+                    job['log'].put_nowait("📶 Salida fragmentada: se puede descargar mientras se convierte")
+                    cmd = ['ffmpeg', '-hide_banner', '-y', '-i', 'pipe:0', *codec_args, 'pipe:1']
+                    output = {'stdout_path': spec['output_path']}
+                else:
+                    cmd = ['ffmpeg', '-hide_banner', '-y', '-i', 'pipe:0', *codec_args, spec['output_path']]
+                    output = {}
+                # Sin duración no hay porcentaje de ffmpeg, pero sí fps y velocidad
+                encode_start = time.perf_counter()
+                run = FFmpegRun(cmd, 0.0, *job_ffmpeg_callbacks(job_id, track_percent=False), stdin=subprocess.PIPE, **output)
+
+                # Sin duración conocida, el progreso se estima con los bytes recibidos
+                input_hash = hashlib.sha256()
+                received = 0
+                chunk = head
+                fed = False
+                try:
+                    while chunk:
+                        run.stdin.write(chunk)
+                        input_hash.update(chunk)
+                        received += len(chunk)
+                        if total > 0:
+                            update_job(job, progress=min(99.0, received / total * 100.0))
+                        chunk = stream.read(STREAM_CHUNK_BYTES)
+                    run.stdin.close()
+                    fed = True
+                except (BrokenPipeError, OSError):
+                    # ffmpeg terminó antes de tiempo; el código de salida indica el motivo
+                    fed = True
+                finally:
+                    # Otra excepción (p. ej. ClientDisconnected al leer la subida): sin esto ffmpeg
+                    # quedaría bloqueado en stdin después de liberar el slot
+                    if not fed:
+                        run.abort()
+                ret = run.wait()
+                # En streaming la etapa incluye la subida: ffmpeg codifica a medida que llega
+                elapsed = time.perf_counter() - encode_start
+                trace_add('upload+encode', time.time() - elapsed, time.time(), format=spec['target_format'], bytes=received)
+                if ret == 0:
+                    metrics.observe_stage('encode', elapsed, format=spec['target_format'])
+
+            if ret == 0:
+                update_job(job, progress=100.0, status='done')
+                # Ya recibido el archivo completo, el resultado sirve para futuras peticiones iguales
+                if received == total:
+                    spec['input_hash'] = input_hash.hexdigest()
+                    output_cache.store(output_cache_key(spec), spec['output_path'])
+            else:
+                report_ffmpeg_failure(job, run, ret)
+        except ClientDisconnected:
+            job['log'].put_nowait("❌ El cliente cortó la subida antes de terminar")
+            update_job(job, status='error', error="La subida se interrumpió")
+        except Exception as e:
+            job['log'].put_nowait(f"❌ Error: {str(e)}")
+            update_job(job, status='error', error=str(e))
+    if job.get('started'):
+        trace.add('queued', job['created'], job['started'])
+    job_store.save_trace(job_id, trace.to_dict())
+    return jsonify({'job_id': job_id, 'streamed': True, 'status': job['status']})
 
 @app.route('/progress/<job_id>')
 def progress(job_id):
-    if job_id not in jobs:
+    if get_job(job_id) is None:
         return abort(404, 'Job no encontrado')
+    # El log crudo de ffmpeg es opcional: /progress/<id>?raw=1 lo emite como eventos 'ffmpeg'
+    include_raw = request.args.get('raw') == '1'
+    # Un cliente que reconecta retoma tras el último evento recibido (el navegador envía Last-Event-ID)
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_id = 0
 
-    def stream():
+    def stream(last_id):
+        job = get_job(job_id)
         # Primer ping de estado
         yield sse_format(event="status", data=json.dumps({
-            'status': jobs[job_id]['status'],
-            'progress': jobs[job_id]['progress']
+            'status': job['status'],
+            'progress': job['progress']
         }))
-        # Emitir logs a medida que llegan
+        last_state, last_sent = None, 0.0
         while True:
-            if jobs[job_id]['status'] in ('done','error'):
-                # drenar pendientes
-                while not jobs[job_id]['log'].empty():
-                    yield sse_format(event="log", data=jobs[job_id]['log'].get())
+            # Si el job corre en otro proceso, cada vuelta relee su estado compartido
+            job = get_job(job_id) or job
+            bus = job['log']
+            version = bus.version
+            for event_id, event, data in bus.since(last_id, include_raw):
+                yield sse_format(event=event, data=data, id=event_id)
+                last_id = event_id
+            if job['status'] in ('done','error'):
                 yield sse_format(event="status", data=json.dumps({
-                    'status': jobs[job_id]['status'],
-                    'progress': jobs[job_id]['progress'],
-                    'error': jobs[job_id]['error']
+                    'status': job['status'],
+                    'progress': job['progress'],
+                    'error': job['error']
                 }))
                 break
-            try:
-                line = jobs[job_id]['log'].get(timeout=0.5)
-                yield sse_format(event="log", data=line)
-                yield sse_format(event="progress", data=str(jobs[job_id]['progress']))
-            except queue.Empty:
-                # heartbeat
-                yield sse_format(event="progress", data=str(jobs[job_id]['progress']))
+
+            if job['status'] == 'queued':
+                # La posición en la cola no genera eventos; se informa con un heartbeat
+                yield sse_format(event="queue", data=json.dumps({
+                    'position': job_store.queue_position(job_id),
+                    'resource': job['resource']
+                }))
+                bus.wait(version, 2.0)
+                continue
+
+            # Progreso limitado a uno cada PROGRESS_INTERVAL; sin cambios, heartbeat cada 15s
+            state = (job['progress'], job['stats'])
+            now = time.monotonic()
+            if state != last_state and now - last_sent >= PROGRESS_INTERVAL or now - last_sent >= 15.0:
+                yield sse_format(event="progress", data=json.dumps(progress_payload(job)))
+                last_state, last_sent = state, now
+                timeout = 15.0
+            else:
+                # Hay un cambio pendiente por el límite de frecuencia: despertar cuando toque enviarlo
+                timeout = max(0.05, last_sent + (PROGRESS_INTERVAL if state != last_state else 15.0) - now)
+            bus.wait(version, timeout)
+
+    return Response(stream(last_id), mimetype='text/event-stream')
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'whisper_models': whisper_models.get_stats(),
+        'ffmpeg': ffmpeg_caps.summary(),
+        'scheduler': scheduler.get_stats(),
+        'queue': job_store.queue_stats(),
+        'worker': job_worker.get_stats(),
+        'output_cache': output_cache.get_stats(),
+        'transcription_cache': transcription_cache.get_stats(),
+        'translation_memory': translation_memory.get_stats(),
+        'retention': retention.get_stats(),
+    })
+
+def stream_growing_file(job_id: str, path: str):
+    """
+    Generador para /download de un job progresivo que aún corre: emite el archivo según crece
+    y termina cuando el job queda 'done' y se ha leído hasta el final. Si el job falla, corta
+    la conexión sin el chunk final para que el cliente no tome por buena una descarga truncada.
+    """
+    f = None
+    try:
+        while True:
+            chunk = f.read(PROGRESSIVE_CHUNK_BYTES) if f else b''
+            if chunk:
+                yield chunk
+                continue
+            # Sin datos nuevos: el estado se consulta antes de la última lectura, así lo que
+            # ffmpeg escribió antes de terminar no se pierde
+            job = get_job(job_id)
+            status = job['status'] if job else 'error'
+            if f is None and os.path.exists(path):
+                f = open(path, 'rb')
                 continue
+            if status == 'done':
+                while f and (chunk := f.read(PROGRESSIVE_CHUNK_BYTES)):
+                    yield chunk
+                return
+            if status == 'error':
+                raise IOError(f"El job {job_id} falló durante la descarga progresiva")
+            time.sleep(PROGRESSIVE_POLL_SECONDS)
+    finally:
+        if f:
+            f.close()
 
-    return Response(stream(), mimetype='text/event-stream')
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas de todos los procesos (web y workers) en formato de texto de Prometheus"""
+    queue = job_store.queue_stats()['by_status']
+    gauges = {('converter_jobs', (('status', status),)): queue.get(status, 0) for status in ACTIVE_STATUSES}
+    return Response(metrics.render(extra_gauges=gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs/<job_id>/trace')
+def job_trace(job_id):
+    """
+    Traza del job en formato de trace events de Chrome (abrir en chrome://tracing o Perfetto).
+    Si el job corre en este proceso incluye los spans aún abiertos; si no, la última guardada.
+    """
+    job = get_job(job_id)
+    if job is None:
+        abort(404, 'Job no encontrado')
+    trace = job.get('trace') or JobTrace(job_store.load_trace(job_id))
+    body = json.dumps(trace.to_chrome(job_id=job_id, status=job['status'], format=job['spec']['target_format']),
+                      ensure_ascii=False)
+    return Response(body, mimetype='application/json',
+                    headers={'Content-Disposition': f'attachment; filename=trace-{job_id}.json'})
+
+def mark_downloaded(job: dict):
+    """
+    Registra la descarga escribiendo solo esa columna: el job puede ser una copia leída de
+    JobStore, y update_job reescribiría su progreso y estado sobre los del proceso que lo ejecuta
+    """
+    job['downloaded'] = time.time()
+    job_store.update(job['id'], {'downloaded': job['downloaded']})
 
 @app.route('/download/<job_id>')
 def download(job_id):
-    job = jobs.get(job_id)
+    job = get_job(job_id)
+    if job and job['status'] == 'running' and job['spec'].get('progressive'):
+        # Sin Content-Length: se envía con chunked transfer mientras ffmpeg sigue escribiendo
+        mark_downloaded(job)
+        mimetype = 'video/mp4' if job['spec']['target_format'] == 'mp4' else 'video/x-matroska'
+        return Response(stream_growing_file(job_id, job['output_path']), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{job["download_name"]}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no',  # que un proxy (nginx) no acumule la respuesta
+        })
     if not job or job['status'] != 'done':
         return abort(404, 'No disponible aún')
+    mark_downloaded(job)
     return send_file(job['output_path'], as_attachment=True, download_name=job['download_name'])
 
+# Retención: tiempo que se conserva un job terminado (y sus archivos) según su estado
+JOB_TTL_SECONDS = {
+    'done': float(os.environ.get('JOB_TTL_DONE', str(24 * 3600))),
+    'error': float(os.environ.get('JOB_TTL_ERROR', '3600')),
+    'uploading': float(os.environ.get('JOB_TTL_UPLOADING', str(2 * 3600))),  # subidas abandonadas
+}
+RETENTION_SWEEP_SECONDS = float(os.environ.get('RETENTION_SWEEP_SECONDS', '300'))
+UPLOADS_QUOTA_MB = int(os.environ.get('UPLOADS_QUOTA_MB', '20480'))
+OUTPUTS_QUOTA_MB = int(os.environ.get('OUTPUTS_QUOTA_MB', '20480'))
+# Por encima de este límite también se desalojan resultados que nadie descargó todavía
+OUTPUTS_HARD_QUOTA_MB = int(os.environ.get('OUTPUTS_HARD_QUOTA_MB', str(OUTPUTS_QUOTA_MB * 2)))
+ACTIVE_STATUSES = ('uploading', 'queued', 'running')
+
+class RetentionManager:
+    """
+    Limpia jobs y archivos para que una instancia de larga duración no crezca sin límite:
+    - jobs vencidos según el TTL de su estado (se borran su entrada y sus archivos)
+    - archivos huérfanos en uploads/ y converted/ (de reinicios anteriores) más viejos que el TTL de 'done'
+    - cuotas de disco: en converted/ se desalojan los resultados ya descargados (LRU por última
+      descarga); los que nadie descargó solo si se supera el límite duro, empezando por los más
+      antiguos. En uploads/ nunca se tocan entradas de jobs activos
+    """
+
+    def __init__(self, ttls: dict, uploads_quota_mb: int, outputs_quota_mb: int, outputs_hard_quota_mb: int = None,
+                 interval: float = RETENTION_SWEEP_SECONDS):
+        self.ttls = ttls
+        self.uploads_quota = uploads_quota_mb * 1024 * 1024
+        self.outputs_quota = outputs_quota_mb * 1024 * 1024
+        self.outputs_hard_quota = max(outputs_hard_quota_mb or 0, outputs_quota_mb) * 1024 * 1024
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.sweeps = 0
+        self.jobs_removed = 0
+        self.files_removed = 0
+        self.bytes_reclaimed = 0
+        self.last_sweep = None
+
+    def _remove_file(self, path: str) -> int:
+        """Borra un archivo y devuelve los bytes liberados (0 si no existía)"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        self.files_removed += 1
+        self.bytes_reclaimed += size
+        return size
+
+    def _remove_job(self, job: dict) -> int:
+        jobs.pop(job['id'], None)
+        job_store.delete(job['id'])
+        self.jobs_removed += 1
+        return self._remove_file(job['input_path']) + self._remove_file(job['output_path'])
+
+    @staticmethod
+    def _folder_files(folder: str) -> list:
+        """(mtime, tamaño, ruta) de los archivos de primer nivel de una carpeta"""
+        entries = []
+        if not os.path.isdir(folder):
+            return entries
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def sweep(self) -> int:
+        """Una pasada completa; retorna los bytes recuperados"""
+        with self.lock:
+            now = time.time()
+            reclaimed = 0
+            # Jobs de todos los procesos (JobStore), no solo los de este
+            all_jobs = job_store.all()
+
+            # 1. Jobs vencidos por TTL
+            for job in list(all_jobs):
+                ttl = self.ttls.get(job['status'])
+                if ttl is not None and now - (job['finished'] or job['created']) > ttl:
+                    reclaimed += self._remove_job(job)
+                    all_jobs.remove(job)
+
+            # 2. Archivos que ningún job referencia (p. ej. de antes de un reinicio)
+            known = set()
+            for job in all_jobs:
+                known.update((job['input_path'], job['output_path']))
+            orphan_ttl = self.ttls.get('done', 0)
+            for folder in (app.config['UPLOAD_FOLDER'], app.config['CONVERTED_FOLDER']):
+                for mtime, _, path in self._folder_files(folder):
+                    if path not in known and now - mtime > orphan_ttl:
+                        reclaimed += self._remove_file(path)
+
+            # 3. Cuota de resultados: descargados (LRU); sin descargar, solo por encima del límite duro
+            total = sum(size for _, size, _ in self._folder_files(app.config['CONVERTED_FOLDER']))
+            if total > self.outputs_quota:
+                candidates = sorted(
+                    (job['downloaded'] is None, job['downloaded'] or job['finished'] or job['created'], job['id'], job)
+                    for job in all_jobs if job['status'] == 'done'
+                )
+                for *_, job in candidates:
+                    limit = self.outputs_hard_quota if job['downloaded'] is None else self.outputs_quota
+                    if total <= limit:
+                        continue
+                    try:
+                        output_size = os.path.getsize(job['output_path'])
+                    except OSError:
+                        output_size = 0
+                    # Solo la salida cuenta para la cuota; la entrada que se borre con el job es aparte
+                    reclaimed += self._remove_job(job)
+                    total -= output_size
+
+            # 4. Cuota de subidas: solo entradas que no pertenecen a jobs activos
+            active = {job['input_path'] for job in all_jobs if job['status'] in ACTIVE_STATUSES}
+            uploads = self._folder_files(app.config['UPLOAD_FOLDER'])
+            total = sum(size for _, size, _ in uploads)
+            for _, size, path in sorted(uploads):
+                if total <= self.uploads_quota:
+                    break
+                if path not in active:
+                    freed = self._remove_file(path)
+                    total -= freed
+                    reclaimed += freed
+
+            self.sweeps += 1
+            self.last_sweep = now
+            return reclaimed
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                reclaimed = self.sweep()
+                if reclaimed:
+                    print(f"🧹 Retención: {reclaimed / (1024 * 1024):.1f}MB liberados")
+            except Exception as e:
+                print(f"⚠️  Error en la limpieza de retención: {e}")
+
+    def start(self):
+        """Arranca el barrido periódico en segundo plano (una sola vez)"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, daemon=True, name='retention')
+            self.thread.start()
+
+    def get_stats(self) -> dict:
+        usage = lambda folder: sum(size for _, size, _ in self._folder_files(folder))
+        return {
+            'jobs': job_store.count(),
+            'ttl_seconds': self.ttls,
+            'uploads_mb': round(usage(app.config['UPLOAD_FOLDER']) / (1024 * 1024), 1),
+            'uploads_quota_mb': self.uploads_quota // (1024 * 1024),
+            'outputs_mb': round(usage(app.config['CONVERTED_FOLDER']) / (1024 * 1024), 1),
+            'outputs_quota_mb': self.outputs_quota // (1024 * 1024),
+            'outputs_hard_quota_mb': self.outputs_hard_quota // (1024 * 1024),
+            'sweeps': self.sweeps,
+            'last_sweep': self.last_sweep,
+            'jobs_removed': self.jobs_removed,
+            'files_removed': self.files_removed,
+            'reclaimed_mb': round(self.bytes_reclaimed / (1024 * 1024), 1),
+        }
+
+retention = RetentionManager(JOB_TTL_SECONDS, UPLOADS_QUOTA_MB, OUTPUTS_QUOTA_MB, OUTPUTS_HARD_QUOTA_MB)
+
+SERVE_PROCESSES = int(os.environ.get('SERVE_PROCESSES', '2'))
+
+def serve(host: str = '0.0.0.0', port: int = 5000, processes: int = SERVE_PROCESSES, embedded_worker: bool = True):
+    """
+    Servidor de producción. gevent atiende cada conexión en un greenlet, así que miles de
+    clientes SSE inactivos casi no cuestan; varios procesos comparten el socket (fork) y el
+    estado de los jobs vive en JobStore, de modo que cualquiera responde por cualquier job.
+    Solo el proceso principal ejecuta jobs (worker embebido), salvo que se desactive para
+    dejar todo el trabajo a procesos `--worker`.
+    """
+    if not GEVENT_ACTIVE:
+        print("❌ El modo --serve requiere gevent. Instala: pip install gevent")
+        sys.exit(1)
+    import socket, signal
+    from gevent.pywsgi import WSGIServer
+
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['CONVERTED_FOLDER'], exist_ok=True)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(1024)
+
+    if processes > 1 and not hasattr(os, 'fork'):
+        print("⚠️  Este sistema no soporta fork; se usa un solo proceso")
+        processes = 1
+    children = []
+    for _ in range(processes - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = None  # proceso hijo: solo atiende peticiones
+            break
+        children.append(pid)
+
+    # Cada proceso publica sus propias métricas (después del fork: el hilo no se hereda)
+    metrics.share(job_store)
+    # Los slots (CPU, NVENC, Whisper, traducción) son del servidor, no de cada proceso
+    if hasattr(os, 'fork'):
+        scheduler.share(SharedSlots(os.path.join(CACHE_FOLDER, 'slots'), scheduler.slots))
+    if children is not None:
+        print(f"🚀 Servidor de producción en http://{host}:{port} ({processes} procesos, gevent)")
+        print_whisper_info()
+        retention.start()
+        if embedded_worker:
+            job_worker.start()
+        # Al detener el principal (Ctrl+C o SIGTERM) también se detienen los hijos
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        WSGIServer(listener, app).serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children or []:
+            try: os.kill(pid, signal.SIGTERM)
+            except OSError: pass
+
+# Modo lote (--batch): muchos archivos en un solo proceso, con N conversiones en paralelo
+BATCH_FORMATS = ['mp4', 'webm', 'avi', 'mkv', 'mp3', 'srt']
+BATCH_STATE_FILE = '.batch-state.json'
+
+def expand_batch_inputs(patterns: list, manifest: str = None, recursive: bool = False) -> list:
+    """
+    Resuelve carpetas, patrones glob y un manifiesto (una ruta por línea, '#' comenta) en una
+    lista de (archivo, raíz) sin repetidos. La raíz permite replicar la estructura de una
+    carpeta en la salida; para archivos sueltos y globs es su propia carpeta.
+    """
+    import glob
+    entries = list(patterns or [])
+    if manifest:
+        with open(manifest, encoding='utf-8') as f:
+            base = os.path.dirname(os.path.abspath(manifest))
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    entries.append(line if os.path.isabs(line) else os.path.join(base, line))
+
+    found = {}
+    for entry in entries:
+        if os.path.isdir(entry):
+            walker = Path(entry).rglob('*') if recursive else Path(entry).iterdir()
+            for path in sorted(walker):
+                if path.is_file() and allowed_file(path.name):
+                    found.setdefault(os.path.abspath(path), os.path.abspath(entry))
+        elif glob.has_magic(entry):
+            for path in sorted(glob.glob(entry, recursive=True)):
+                if os.path.isfile(path) and allowed_file(path):
+                    found.setdefault(os.path.abspath(path), os.path.dirname(os.path.abspath(path)))
+        elif os.path.isfile(entry):
+            found.setdefault(os.path.abspath(entry), os.path.dirname(os.path.abspath(entry)))
+        else:
+            print(f"⚠️  Se ignora '{entry}': no existe")
+    return list(found.items())
+
+def same_path(a: str, b: str) -> bool:
+    return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+def batch_output_path(input_path: str, root: str, target_format: str, output_dir: str = None) -> str:
+    """
+    Salida junto a la entrada o, con carpeta de salida, en la misma ruta relativa a su raíz.
+    Si eso cae sobre la propia entrada (ya tiene la extensión destino) se le añade '-convertido'.
+    """
+    rel = Path(os.path.relpath(input_path, root)).with_suffix(f'.{target_format}')
+    output_path = os.path.join(output_dir if output_dir else root, str(rel))
+    if same_path(output_path, input_path):
+        output_path = str(Path(output_path).with_name(f"{rel.stem}-convertido.{target_format}"))
+    return output_path
+
+class BatchState:
+    """
+    Estado reanudable de un lote: por archivo de entrada guarda resultado, salida, tamaño y mtime
+    de la entrada y tiempos. Se reescribe (de forma atómica) tras cada archivo, así que un lote
+    interrumpido retoma donde quedó y no repite lo que ya terminó bien.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, input_path: str) -> dict:
+        with self._lock:
+            return self.entries.get(input_path)
+
+    def record(self, input_path: str, **fields):
+        with self._lock:
+            self.entries[input_path] = {**fields, 'updated': time.time()}
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'files': self.entries}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+
+def batch_translated_path(output_path: str, language: str) -> str:
+    """SRT traducido que acompaña a la salida: video.srt -> video_es.srt"""
+    out = Path(output_path)
+    return str(out.with_name(f"{out.stem}_{language}{out.suffix}"))
+
+def batch_partial_path(output_path: str) -> str:
+    out = Path(output_path)
+    return str(out.with_name(f"{out.stem}.part{out.suffix}"))
+
+def batch_up_to_date(input_path: str, output_paths: list, entry: dict) -> bool:
+    """Ya convertido: existen todas las salidas y el estado lo da por hecho con esta misma entrada, o son más nuevas que ella"""
+    if not all(os.path.exists(path) for path in output_paths):
+        return False
+    st = os.stat(input_path)
+    if entry and entry.get('status') == 'done':
+        return entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime
+    return min(os.path.getmtime(path) for path in output_paths) >= st.st_mtime
+
+def batch_convert_one(input_path: str, output_path: str, target_format: str, use_gpu: bool = False,
+                      allow_copy: bool = True, model_size: str = 'base', translate_language: str = ''):
+    """
+    Convierte un archivo del lote sin imprimir progreso (varios corren a la vez). Escribe en un
+    archivo temporal y lo renombra al terminar, para que un lote cortado no deje salidas a medias
+    que luego parezcan al día. Usa los slots del planificador como los jobs web.
+    """
+    if same_path(output_path, input_path):
+        # Como ffmpeg: nunca se sobrescribe la entrada con su propia conversión
+        raise ValueError("La salida es el mismo archivo que la entrada")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    partial = batch_partial_path(output_path)
+    translated_path = None
+    if target_format == 'srt' and translate_language:
+        translated_path = batch_translated_path(output_path, translate_language)
+        translated_partial = batch_partial_path(translated_path)
+    info = probe_media(input_path)
+    try:
+        if target_format == 'srt':
+            audio = load_audio_pcm(input_path)
+            with scheduler.slot('whisper'):
+                result = transcribe_audio(audio, model_size, log=lambda msg: None, fp16=(DEVICE == "cuda"))
+            generate_srt_from_result(result, partial)
+            if translated_path:
+                with scheduler.slot('translate'):
+                    translate_and_generate_srt(result, translated_partial, translate_language)
+                os.replace(translated_partial, translated_path)
+        else:
+            codec_args, chosen_encoder = get_codec_args(target_format, use_gpu and target_format != 'mp3')
+            if allow_copy:
+                codec_args, _ = plan_stream_copy(input_path, target_format, codec_args)
+            cmd = ['ffmpeg', '-hide_banner', '-y', '-i', input_path, *codec_args, partial]
+            with scheduler.slot(job_resource(target_format, None if copies_video(codec_args) else chosen_encoder)):
+                run = FFmpegRun(cmd, info.duration)
+                ret = run.wait()
+            if ret != 0:
+                raise RuntimeError(f"ffmpeg salió con código {ret}: {run.last_line}" if run.last_line else f"ffmpeg salió con código {ret}")
+        os.replace(partial, output_path)
+    finally:
+        for path in (partial, translated_partial) if translated_path else (partial,):
+            if os.path.exists(path):
+                os.remove(path)
+    return info
+
+def batch_convert(inputs: list, target_format: str, output_dir: str = None, parallel: int = 2,
+                  state_path: str = None, force: bool = False, use_gpu: bool = False, allow_copy: bool = True,
+                  model_size: str = 'base', translate_language: str = '') -> dict:
+    """
+    Convierte una lista de (archivo, raíz) con hasta 'parallel' conversiones a la vez en este mismo
+    proceso: el modelo Whisper, las capacidades de ffmpeg y los sondeos se cargan una sola vez.
+    Salta las salidas al día y guarda el progreso en el archivo de estado. Retorna el resumen.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    state = BatchState(state_path or os.path.join(output_dir or os.getcwd(), BATCH_STATE_FILE))
+    summary = {'done': 0, 'skipped': 0, 'failed': 0, 'media_seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0,
+               'errors': []}
+    lock = threading.Lock()
+
+    # Las salidas de una corrida anterior junto a las entradas no son entradas nuevas
+    outputs = {os.path.normcase(batch_output_path(inp, root, target_format, output_dir)) for inp, root in inputs}
+    inputs = [(inp, root) for inp, root in inputs if os.path.normcase(inp) not in outputs]
+    pending = []
+    for input_path, root in inputs:
+        output_path = batch_output_path(input_path, root, target_format, output_dir)
+        expected = [output_path]
+        if target_format == 'srt' and translate_language:
+            expected.append(batch_translated_path(output_path, translate_language))
+        if not force and batch_up_to_date(input_path, expected, state.get(input_path)):
+            summary['skipped'] += 1
+        else:
+            pending.append((input_path, output_path))
+    total = len(pending)
+    print(f"📚 {len(inputs)} archivos: {total} por convertir, {summary['skipped']} ya al día "
+          f"| {parallel} en paralelo | estado: {state.path}")
+    print("-" * 50)
+
+    def work(input_path, output_path):
+        st = os.stat(input_path)
+        start = time.time()
+        try:
+            info = batch_convert_one(input_path, output_path, target_format, use_gpu, allow_copy,
+                                     model_size, translate_language)
+        except Exception as e:
+            state.record(input_path, status='error', output=output_path, size=st.st_size, mtime=st.st_mtime,
+                         seconds=round(time.time() - start, 3), error=str(e))
+            metrics.inc('converter_jobs_total', format=target_format, outcome='error')
+            raise
+        elapsed = time.time() - start
+        state.record(input_path, status='done', output=output_path, size=st.st_size, mtime=st.st_mtime,
+                     seconds=round(elapsed, 3), media_seconds=info.duration)
+        metrics.inc('converter_jobs_total', format=target_format, outcome='done')
+        with lock:
+            summary['media_seconds'] += info.duration
+            summary['bytes_in'] += st.st_size
+            summary['bytes_out'] += os.path.getsize(output_path)
+        return elapsed, info.duration
+
+    start_time = time.time()
+    # -j manda en el lote: los slots de CPU del planificador no deben limitarlo (NVENC y Whisper
+    # sí); el cupo original se restaura al terminar
+    cpu_slots = scheduler.slots['cpu']
+    scheduler.slots['cpu'] = max(cpu_slots, parallel)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+            futures = {pool.submit(work, inp, out): inp for inp, out in pending}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    name = os.path.basename(futures[future])
+                    try:
+                        elapsed, media_seconds = future.result()
+                        summary['done'] += 1
+                        speed = f", {media_seconds / elapsed:.1f}x" if media_seconds and elapsed > 0 else ""
+                        print(f"[{done}/{total}] ✓ {name} ({elapsed:.1f}s{speed})")
+                    except Exception as e:
+                        summary['failed'] += 1
+                        summary['errors'].append((futures[future], str(e)))
+                        print(f"[{done}/{total}] ✗ {name}: {e}")
+            except KeyboardInterrupt:
+                # Lo que ya terminó quedó en el estado; los encodes en curso se descartan
+                for future in futures:
+                    future.cancel()
+                print("\n⏹️  Lote interrumpido; vuelve a ejecutar el mismo comando para continuar")
+                raise
+    finally:
+        scheduler.slots['cpu'] = cpu_slots
+    summary['seconds'] = time.time() - start_time
+    return summary
+
+def print_batch_summary(summary: dict):
+    wall = summary['seconds']
+    print("-" * 50)
+    print(f"📊 Convertidos: {summary['done']} | Al día: {summary['skipped']} | Fallidos: {summary['failed']}")
+    print(f"⏱️  Tiempo total: {wall:.1f}s")
+    if summary['done'] and wall > 0:
+        print(f"🚀 Rendimiento: {summary['done'] / wall * 60:.1f} archivos/min"
+              f" | {summary['media_seconds'] / wall:.1f}x tiempo real"
+              f" | {summary['bytes_in'] / wall / (1024 * 1024):.1f} MB/s leídos"
+              f" | {summary['bytes_out'] / (1024 * 1024):.1f} MB escritos")
+    for path, error in summary['errors']:
+        print(f"   ✗ {path}: {error}")
+
 def main():
     parser = argparse.ArgumentParser(description='Conversor de videos - Modo web o línea de comandos')
     
@@ -786,21 +4567,189 @@ def main():
     parser.add_argument('--avi', metavar='INPUT', help='Convertir a AVI. Especifica la ruta del video de entrada.')
     parser.add_argument('--mkv', metavar='INPUT', help='Convertir a MKV. Especifica la ruta del video de entrada.')
     parser.add_argument('--mp3', metavar='INPUT', help='Extraer audio a MP3. Especifica la ruta del video de entrada.')
-    parser.add_argument('--srt', metavar='INPUT', help='Extraer audio a MP3 y generar subtítulos SRT con IA. Especifica la ruta del video de entrada.')
+    parser.add_argument('--srt', metavar='INPUT', help='Generar subtítulos SRT con IA (el audio se decodifica en memoria). Especifica la ruta del video de entrada.')
+    parser.add_argument('--hls', metavar='INPUT', help='Generar HLS con varias calidades en una sola pasada (la salida es una carpeta con master.m3u8)')
+    parser.add_argument('--ladder', metavar='LIST', default=HLS_LADDER,
+                        help=f'Escalera HLS alto:kbps separada por comas. Default: {HLS_LADDER} (env HLS_LADDER)')
+    parser.add_argument('--multi', metavar='INPUT', help='Convertir a varios formatos decodificando la entrada una sola vez (usar con --targets)')
+    parser.add_argument('--targets', metavar='LIST', help=f"Formatos para --multi separados por comas (ej: mp4,webm,mp3,srt). Opciones: {','.join(MULTI_FORMATS)}")
+    parser.add_argument('--batch', nargs='+', metavar='PATH',
+                        help='Modo lote: carpetas, archivos o patrones glob (ej: "videos/**/*.mov") a convertir al formato de --to')
+    parser.add_argument('--manifest', metavar='FILE', help='Modo lote: archivo con una ruta de entrada por línea (# comenta)')
+    parser.add_argument('--to', choices=BATCH_FORMATS, help='Formato de salida del modo lote')
+    parser.add_argument('-j', '--jobs', type=int, default=max(1, min(4, (os.cpu_count() or 1) // 2)), metavar='N',
+                        help='Modo lote: conversiones en paralelo dentro del mismo proceso')
+    parser.add_argument('--output-dir', metavar='DIR',
+                        help='Modo lote: carpeta de salida (replica las subcarpetas); por defecto junto a cada entrada')
+    parser.add_argument('--recursive', action='store_true', help='Modo lote: incluir subcarpetas de las carpetas indicadas')
+    parser.add_argument('--state', metavar='FILE',
+                        help=f'Modo lote: archivo de estado para reanudar (default: {BATCH_STATE_FILE} en la carpeta de salida o la actual)')
+    parser.add_argument('--force', action='store_true', help='Modo lote: convertir también lo que ya está al día')
     parser.add_argument('output', nargs='?', help='Ruta de salida (opcional, usa la misma carpeta del video de entrada por defecto)')
     parser.add_argument('--gpu', action='store_true', help='Usar aceleración GPU (NVENC) - no aplica para MP3/SRT')
     parser.add_argument('--model', default='base', choices=['tiny', 'base', 'small', 'medium', 'large'], 
                         help='Modelo Whisper para transcripción (tiny/base/small/medium/large). Default: base')
     parser.add_argument('--translate', metavar='LANGUAGE', 
                         help='Idioma para traducir subtítulos (ej: english, spanish, french, german, etc.). Genera SRT original + traducido')
+    parser.add_argument('--reencode', action='store_true',
+                        help='Recodificar siempre, aunque los códecs de entrada ya sirvan para el formato destino')
+    parser.add_argument('--segmented', action='store_true',
+                        help='Codificar videos largos por segmentos en paralelo (cortes en keyframes)')
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help='Procesos para transcribir audio largo en paralelo (por defecto según núcleos/GPU)')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='CLI: al terminar, escribir las métricas de la corrida (formato Prometheus) en FILE')
+    parser.add_argument('--trace', action='store_true',
+                        help='CLI: escribir junto a la salida una traza de las etapas (<salida>.trace.json, formato Chrome)')
+    parser.add_argument('--profile', action='store_true',
+                        help='CLI: incluir en la traza un perfil de cProfile de la parte Python (implica --trace)')
     parser.add_argument('--web', action='store_true', help='Iniciar servidor web (modo por defecto)')
+    parser.add_argument('--serve', action='store_true',
+                        help='Servidor de producción con gevent y varios procesos (requiere: pip install gevent)')
+    parser.add_argument('--host', default='0.0.0.0', help='Interfaz de escucha para --serve. Default: 0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000, help='Puerto para --serve. Default: 5000')
+    parser.add_argument('--worker', action='store_true',
+                        help='Ejecutar jobs de la cola compartida (sin servidor web); se pueden lanzar varios, en cualquier máquina')
+    parser.add_argument('--no-worker', action='store_true',
+                        help='En modo web/--serve, solo encolar: los jobs los ejecutan procesos --worker')
+    parser.add_argument('--processes', type=int, default=SERVE_PROCESSES, metavar='N',
+                        help=f'Procesos que atienden peticiones en --serve. Default: {SERVE_PROCESSES} (env SERVE_PROCESSES)')
     
     args = parser.parse_args()
     
+    # Sondear capacidades de ffmpeg una sola vez (o leerlas de la caché en disco)
+    ffmpeg_caps.load()
+    
+    if args.metrics:
+        # Se escribe también cuando el CLI termina con sys.exit
+        import atexit
+        atexit.register(metrics.dump, args.metrics)
+    
+    # Web y workers publican sus métricas en la base compartida para que /metrics vea todas
+    if args.serve:
+        serve(args.host, args.port, max(1, args.processes), embedded_worker=not args.no_worker)
+        return
+    
+    if args.worker:
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        os.makedirs(app.config['CONVERTED_FOLDER'], exist_ok=True)
+        print(f"🛠️  Worker {job_worker.name} esperando jobs en {job_store.db_path}")
+        print(f"   Slots: {', '.join(f'{r}={n}' for r, n in scheduler.slots.items())}")
+        print_whisper_info()
+        metrics.share(job_store)
+        try:
+            job_worker.run_forever()
+        except KeyboardInterrupt:
+            print("\n👋 Worker detenido; sus jobs en curso se reintentarán al vencer el lease")
+        return
+    
+    # Modo lote: todos los archivos en este proceso (torch, modelo y capacidades se cargan una vez)
+    if args.batch or args.manifest:
+        if not args.to:
+            print(f"Error: el modo lote requiere --to ({','.join(BATCH_FORMATS)})")
+            sys.exit(1)
+        if args.to == 'srt' and not WHISPER_AVAILABLE:
+            print("❌ ERROR: Whisper no está instalado. Instala con: pip install openai-whisper")
+            sys.exit(1)
+        try:
+            inputs = expand_batch_inputs(args.batch, args.manifest, args.recursive)
+        except OSError as e:
+            print(f"Error: no se pudo leer el manifiesto: {e}")
+            sys.exit(1)
+        if not inputs:
+            print("Error: no se encontraron videos para el lote")
+            sys.exit(1)
+        try:
+            summary = batch_convert(
+                inputs, args.to, args.output_dir, max(1, args.jobs), args.state, args.force,
+                use_gpu=args.gpu, allow_copy=not args.reencode, model_size=args.model,
+                translate_language=args.translate or '',
+            )
+        except KeyboardInterrupt:
+            sys.exit(130)
+        print_batch_summary(summary)
+        sys.exit(1 if summary['failed'] else 0)
+    
     # Determinar formato y archivo de entrada
     input_file = None
     target_format = None
     
+    # Varios formatos en un solo decode
+    if args.multi:
+        targets = [t.strip().lower() for t in (args.targets or '').split(',') if t.strip()]
+        invalid = [t for t in targets if t not in MULTI_FORMATS]
+        if not targets or invalid:
+            print(f"Error: --multi requiere --targets con formatos válidos ({','.join(MULTI_FORMATS)})")
+            sys.exit(1)
+        if not os.path.exists(args.multi):
+            print(f"Error: El archivo de entrada '{args.multi}' no existe.")
+            sys.exit(1)
+        # La salida opcional es una carpeta; por defecto la del archivo de entrada
+        input_path_obj = Path(args.multi)
+        output_dir = args.output or str(input_path_obj.parent)
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"🎬 Entrada: {args.multi}")
+        print(f"📦 Formatos: {', '.join(targets)}")
+        print("-" * 50)
+        if args.trace or args.profile:
+            start_cli_trace(os.path.join(output_dir, f"{input_path_obj.stem}.trace.json"), 'multi',
+                            args.profile, targets=','.join(targets))
+        start_time = time.time()
+        try:
+            with metrics.stage('encode', format='multi'):
+                produced = convert_multi(
+                    args.multi, os.path.join(output_dir, input_path_obj.stem), list(dict.fromkeys(targets)),
+                    args.gpu, not args.reencode, args.model, args.translate or '',
+                    on_progress=lambda pct: print(f"\rProgreso: {pct:.1f}%", end="", flush=True),
+                    log=lambda msg: print(f"\n{msg}"),
+                )
+        except Exception as e:
+            metrics.inc('converter_jobs_total', format='multi', outcome='error')
+            print(f"\n✗ Error en la conversión: {e}")
+            sys.exit(1)
+        metrics.inc('converter_jobs_total', format='multi', outcome='done')
+        print()
+        for path in produced:
+            print(f"✓ {path}")
+        print(f"⏱️  Tiempo transcurrido: {time.time() - start_time:.2f}s")
+        sys.exit(0)
+    
+    # HLS: escalera de calidades en una sola pasada
+    if args.hls:
+        try:
+            ladder = parse_ladder(args.ladder)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if not os.path.exists(args.hls):
+            print(f"Error: El archivo de entrada '{args.hls}' no existe.")
+            sys.exit(1)
+        # La salida opcional es una carpeta; por defecto <nombre>-hls junto a la entrada
+        input_path_obj = Path(args.hls)
+        output_dir = args.output or str(input_path_obj.parent / f"{input_path_obj.stem}-hls")
+        print(f"🎬 Entrada: {args.hls}")
+        print(f"📁 Salida: {output_dir}")
+        print("-" * 50)
+        if args.trace or args.profile:
+            start_cli_trace(f"{output_dir.rstrip(os.sep)}.trace.json", 'hls', args.profile, ladder=args.ladder)
+        start_time = time.time()
+        try:
+            with metrics.stage('encode', format='hls'):
+                produced = hls_encode(
+                    args.hls, output_dir, ladder, args.gpu,
+                    on_progress=lambda pct: print(f"\rProgreso: {pct:.1f}%", end="", flush=True),
+                    log=lambda msg: print(f"\n{msg}"),
+                )
+        except Exception as e:
+            metrics.inc('converter_jobs_total', format='hls', outcome='error')
+            print(f"\n✗ Error en la conversión: {e}")
+            sys.exit(1)
+        metrics.inc('converter_jobs_total', format='hls', outcome='done')
+        print()
+        print(f"✓ {os.path.join(output_dir, 'master.m3u8')} ({len(produced)} archivos)")
+        print(f"⏱️  Tiempo transcurrido: {time.time() - start_time:.2f}s")
+        sys.exit(0)
+    
     if args.mp4:
         input_file = args.mp4
         target_format = 'mp4'
@@ -834,13 +4783,17 @@ def main():
                 output_filename = f"{input_path_obj.stem}.{target_format}"
             output_path = input_path_obj.parent / output_filename
             output_path = str(output_path)  # Convertir a string para compatibilidad
+        if args.trace or args.profile:
+            start_cli_trace(f"{output_path}.trace.json", target_format, args.profile, input=input_file)
         
-        # Modo especial para SRT (extrae MP3 primero y luego transcribe)
+        # Modo especial para SRT (el audio se decodifica en memoria y se transcribe)
         if target_format == 'srt':
-            # Generar ruta temporal para MP3
-            input_path_obj = Path(input_file)
-            temp_mp3_path = input_path_obj.parent / f"{input_path_obj.stem}_temp.mp3"
-            temp_mp3_path = str(temp_mp3_path)
+            if not os.path.exists(input_file):
+                print(f"Error: El archivo de entrada '{input_file}' no existe.")
+                sys.exit(1)
+            if not allowed_file(input_file):
+                print(f"Error: Formato de archivo no soportado. Formatos permitidos: {', '.join(ALLOWED_EXTENSIONS)}")
+                sys.exit(1)
             
             print(f"🎬 Procesando video para subtítulos: {input_file}")
             print(f"📄 Archivo SRT de salida: {output_path}")
@@ -850,40 +4803,25 @@ def main():
                 print(f"📋 Se generarán 2 archivos: original + traducido")
             print("-" * 60)
             
-            # Paso 1: Extraer audio a MP3
-            print("📤 Paso 1/3: Extrayendo audio..." if args.translate else "📤 Paso 1/2: Extrayendo audio...")
-            use_gpu = args.gpu and False  # GPU no aplica para audio
-            success = convert_video_cli(input_file, temp_mp3_path, 'mp3', use_gpu)
-            
-            if not success:
-                print("❌ Error extrayendo audio")
-                sys.exit(1)
-            
-            # Paso 2: Transcribir con Whisper (y traducir si se especifica)
+            # Transcribir con Whisper (y traducir si se especifica)
             start_time = time.time()
             
             if args.translate:
-                print(f"\n🤖 Paso 2/3: Transcribiendo con IA...")
-                print(f"🌍 Paso 3/3: Traduciendo a {args.translate}...")
-                success = transcribe_and_translate_to_srt(temp_mp3_path, output_path, args.translate, args.model)
+                print(f"🤖 Paso 1/2: Transcribiendo con IA...")
+                print(f"🌍 Paso 2/2: Traduciendo a {args.translate}...")
+                success = transcribe_and_translate_to_srt(input_file, output_path, args.translate, args.model, args.workers)
             else:
-                print("\n🤖 Paso 2/2: Transcribiendo con IA...")
-                success = transcribe_audio_to_srt(temp_mp3_path, output_path, args.model)
+                print("🤖 Paso 1/1: Transcribiendo con IA...")
+                success = transcribe_audio_to_srt(input_file, output_path, args.model, args.workers)
                 
             end_time = time.time()
             
-            # Limpiar archivo temporal MP3
-            try:
-                os.remove(temp_mp3_path)
-                print(f"🗑️  Archivo temporal MP3 eliminado")
-            except Exception:
-                pass
-            
             # Mostrar tiempo total
             elapsed_time = end_time - start_time
             minutes = int(elapsed_time // 60)
             seconds = elapsed_time % 60
             time_str = f"{minutes:02d}:{seconds:05.2f}" if minutes > 0 else f"{seconds:.2f}s"
+            metrics.inc('converter_jobs_total', format='srt', outcome='done' if success else 'error')
             
             if success:
                 if args.translate:
@@ -905,7 +4843,7 @@ def main():
         else:
             # Para MP3, desactivar GPU ya que es solo audio
             use_gpu = args.gpu and target_format != 'mp3'
-            success = convert_video_cli(input_file, output_path, target_format, use_gpu)
+            success = convert_video_cli(input_file, output_path, target_format, use_gpu, args.segmented, not args.reencode)
             sys.exit(0 if success else 1)
     
     # Modo web (por defecto)
@@ -917,6 +4855,13 @@ def main():
         print("")
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         os.makedirs(app.config['CONVERTED_FOLDER'], exist_ok=True)
+        # Con debug, el reloader ejecuta main() también en el proceso vigilante; los hilos de
+        # fondo solo van en el proceso que atiende (WERKZEUG_RUN_MAIN)
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            metrics.share(job_store)
+            retention.start()
+            if not args.no_worker:
+                job_worker.start()
         app.run(host="0.0.0.0", port=5000, debug=True)
 
 if __name__ == "__main__":
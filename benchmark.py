@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Suite de benchmarks del motor de conversión con medios sintéticos
+
+Genera medios deterministas sin red (lavfi testsrc2/sine y voz sintetizada), mide cada
+formato destino en CPU y GPU (o su fallback), cada tamaño de Whisper en CPU, los writers
+de SRT y la etapa de traducción contra un traductor local, y guarda el resultado en JSON.
+Cada caso corre en su propio proceso para medir su pico de memoria (incluido ffmpeg).
+
+Uso:
+    python benchmark.py --quick                       # pasada corta
+    python benchmark.py --output base.json            # suite completa
+    python benchmark.py --baseline base.json          # correr y comparar contra base.json
+    python benchmark.py --compare base.json new.json  # solo comparar dos resultados
+"""
+
+import sys
+import os
+import json
+import time
+import shutil
+import platform
+import argparse
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_FPS = 30
+DEFAULT_DURATIONS = '10,60'
+DEFAULT_RESOLUTIONS = '640x360,1280x720,1920x1080'
+DEFAULT_WHISPER_SIZES = 'tiny,base,small,medium,large'
+SPEECH_TEXT = ("The quick brown fox jumps over the lazy dog. "
+               "Benchmarks should be reproducible, so this sentence never changes. "
+               "One two three four five six seven eight nine ten.")
+SRT_SEGMENTS = 20000
+TRANSLATE_SEGMENTS = 2000
+TRANSLATE_LATENCY = 0.02
+# Métrica -> qué dirección es mejor; la comparación marca las que empeoran más del umbral
+METRICS = {'wall_s': 'lower', 'peak_rss_mb': 'lower', 'fps': 'higher', 'realtime': 'higher'}
+
+
+# ---------------------------------------------------------------------------
+# Medios sintéticos
+# ---------------------------------------------------------------------------
+
+def run_ffmpeg(args: list):
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'error', '-y', *args]
+    subprocess.run(cmd, check=True)
+
+def generate_video(media_dir: str, duration: int, resolution: str) -> str:
+    """Video H.264/AAC con testsrc2 + tono de 440 Hz; bitexact para que sea idéntico entre corridas"""
+    path = os.path.join(media_dir, f"testsrc2-{resolution}-{duration}s.mp4")
+    if not os.path.exists(path):
+        run_ffmpeg([
+            '-f', 'lavfi', '-i', f"testsrc2=size={resolution}:rate={BENCH_FPS}:duration={duration}",
+            '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=48000:duration={duration}",
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '18', '-g', str(BENCH_FPS * 2), '-threads', '1',
+            '-c:a', 'aac', '-b:a', '128k', '-shortest',
+            '-map_metadata', '-1', '-fflags', '+bitexact', '-flags', '+bitexact', path + '.tmp.mp4',
+        ])
+        os.replace(path + '.tmp.mp4', path)
+    return path
+
+def generate_speech(media_dir: str, duration: int) -> tuple:
+    """
+    Clip de voz sintética (flite de ffmpeg o espeak-ng) repetida hasta la duración pedida.
+    Sin sintetizador disponible se usa un tono: el tiempo de Whisper sigue siendo medible,
+    aunque no representa voz real. Retorna (ruta, fuente).
+    """
+    from app import ffmpeg_caps
+    base = os.path.join(media_dir, 'speech-base.wav')
+    source_path = base + '.source'
+    if not os.path.exists(base):
+        if ffmpeg_caps.has('filters', 'flite'):
+            source = 'flite'
+            run_ffmpeg(['-f', 'lavfi', '-i', f"flite=text='{SPEECH_TEXT}':voice=kal", '-ar', '16000', '-ac', '1', base])
+        elif shutil.which('espeak-ng') or shutil.which('espeak'):
+            source = 'espeak'
+            raw = base + '.raw.wav'
+            subprocess.run([shutil.which('espeak-ng') or shutil.which('espeak'), '-w', raw, SPEECH_TEXT], check=True)
+            run_ffmpeg(['-i', raw, '-ar', '16000', '-ac', '1', base])
+            os.remove(raw)
+        else:
+            source = 'sine'
+            run_ffmpeg(['-f', 'lavfi', '-i', 'sine=frequency=220:sample_rate=16000:duration=10', '-ac', '1', base])
+        with open(source_path, 'w') as f:
+            f.write(source)
+    with open(source_path) as f:
+        source = f.read().strip()
+
+    path = os.path.join(media_dir, f"speech-{duration}s.wav")
+    if not os.path.exists(path):
+        run_ffmpeg(['-stream_loop', '-1', '-i', base, '-t', str(duration), '-map_metadata', '-1',
+                    '-fflags', '+bitexact', path + '.tmp.wav'])
+        os.replace(path + '.tmp.wav', path)
+    return path, source
+
+
+# ---------------------------------------------------------------------------
+# Casos (cada uno se ejecuta en un proceso aparte con --case)
+# ---------------------------------------------------------------------------
+
+class StubTranslator:
+    """Traductor local: latencia fija por llamada y texto marcado línea a línea, sin red"""
+
+    def __init__(self, latency: float = TRANSLATE_LATENCY):
+        self.latency = latency
+        self.calls = 0
+
+    def translate(self, text: str) -> str:
+        time.sleep(self.latency)
+        self.calls += 1
+        return '\n'.join(f"[es] {line}" for line in text.split('\n'))
+
+def video_encoder(codec_args: list) -> str:
+    for flag in ('-c:v', '-vcodec'):
+        if flag in codec_args:
+            return codec_args[codec_args.index(flag) + 1]
+    return 'none'
+
+def case_encode(case: dict) -> dict:
+    from app import get_codec_args, hls_encode, hls_encoder, parse_ladder, HLS_LADDER, FFmpegRun
+    target, media, duration = case['target'], case['media'], case['duration']
+    out_dir = tempfile.mkdtemp(prefix='bench-', dir=case['work_dir'])
+    try:
+        start = time.perf_counter()
+        if target == 'hls':
+            encoder = hls_encoder(case['gpu'])
+            hls_encode(media, out_dir, parse_ladder(HLS_LADDER), case['gpu'], log=lambda msg: None)
+        else:
+            codec_args, _ = get_codec_args(target, case['gpu'])
+            encoder = video_encoder(codec_args) if target != 'mp3' else 'libmp3lame'
+            run = FFmpegRun(['ffmpeg', '-hide_banner', '-y', '-i', media, *codec_args,
+                             os.path.join(out_dir, f"out.{target}")], duration)
+            ret = run.wait()
+            if ret != 0:
+                raise RuntimeError(f"ffmpeg salió con código {ret}: {run.last_line}")
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return {
+        'wall_s': wall,
+        'fps': duration * BENCH_FPS / wall if target != 'mp3' else None,
+        'realtime': duration / wall,
+        'encoder': encoder,
+        # GPU pedida pero el encoder resultante es de CPU: se midió el fallback
+        'gpu_fallback': case['gpu'] and not encoder.endswith('_nvenc'),
+    }
+
+def case_whisper(case: dict) -> dict:
+    from app import load_audio_pcm, load_whisper_model, transcribe_audio, WHISPER_AVAILABLE, WHISPER_SAMPLE_RATE
+    if not WHISPER_AVAILABLE:
+        raise RuntimeError("Whisper no está disponible (pip install openai-whisper)")
+    start = time.perf_counter()
+    audio = load_audio_pcm(case['media'])
+    decode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    load_whisper_model(case['model'])
+    load_s = time.perf_counter() - start
+    # El modelo ya está en memoria: esto mide solo la transcripción (caché de resultados desactivada)
+    start = time.perf_counter()
+    result = transcribe_audio(audio, case['model'], log=lambda msg: None, fp16=False, language='en', temperature=0.0)
+    wall = time.perf_counter() - start
+    return {
+        'wall_s': wall,
+        'realtime': len(audio) / WHISPER_SAMPLE_RATE / wall,
+        'decode_s': decode_s,
+        'model_load_s': load_s,
+        'segments': len(result.get('segments', [])),
+    }
+
+def synthetic_segments(count: int) -> list:
+    words = SPEECH_TEXT.split()
+    return [{'start': i * 2.5, 'end': i * 2.5 + 2.0, 'text': ' ' + ' '.join(words[i % 7:i % 7 + 6])}
+            for i in range(count)]
+
+def case_srt(case: dict) -> dict:
+    from app import generate_srt_from_result
+    result = {'segments': synthetic_segments(case['segments'])}
+    path = os.path.join(case['work_dir'], f"bench-{os.getpid()}.srt")
+    try:
+        start = time.perf_counter()
+        generate_srt_from_result(result, path)
+        wall = time.perf_counter() - start
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return {'wall_s': wall, 'segments_per_s': case['segments'] / wall}
+
+def case_translate(case: dict) -> dict:
+    from app import translate_segments
+    # Un tercio de líneas repetidas, como en subtítulos reales (la deduplicación cuenta)
+    texts = [seg['text'] for seg in synthetic_segments(case['segments'])]
+    texts = [texts[i % (len(texts) * 2 // 3)] for i in range(len(texts))]
+    translator = StubTranslator(case['latency'])
+    start = time.perf_counter()
+    translated = translate_segments(texts, 'spanish', source_language='english', translator=translator)
+    wall = time.perf_counter() - start
+    if len(translated) != len(texts):
+        raise RuntimeError("La traducción devolvió otro número de segmentos")
+    return {'wall_s': wall, 'segments_per_s': len(texts) / wall, 'translator_calls': translator.calls}
+
+CASE_RUNNERS = {'encode': case_encode, 'whisper': case_whisper, 'srt': case_srt, 'translate': case_translate}
+
+def run_case_inline(case: dict):
+    """Punto de entrada del proceso hijo: ejecuta un caso y escribe su resultado en result_path"""
+    try:
+        result = {'ok': True, **CASE_RUNNERS[case['kind']](case)}
+    except Exception as e:
+        result = {'ok': False, 'error': str(e)}
+    with open(case['result_path'], 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+def run_case(case: dict, work_dir: str) -> dict:
+    """Lanza el caso en un proceso nuevo y añade su pico de memoria (RSS) con wait4"""
+    fd, result_path = tempfile.mkstemp(suffix='.json', dir=work_dir)
+    os.close(fd)
+    env = dict(os.environ, TRANSCRIPTION_CACHE_MB='0')
+    if case['kind'] == 'whisper':
+        env['CUDA_VISIBLE_DEVICES'] = ''  # Whisper en CPU
+    child_case = dict(case, result_path=result_path, work_dir=work_dir)
+    with open(os.path.join(work_dir, 'cases.log'), 'a', encoding='utf-8') as log:
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--case', json.dumps(child_case)],
+                                stdout=log, stderr=log, env=env, cwd=work_dir)
+        peak_rss_mb = None
+        if hasattr(os, 'wait4'):
+            # ru_maxrss del hijo incluye a sus descendientes ya terminados (ffmpeg)
+            _, _, usage = os.wait4(proc.pid, 0)
+            proc.returncode = 0
+            divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024  # bytes en macOS, KiB en Linux
+            peak_rss_mb = usage.ru_maxrss / divisor
+        else:
+            proc.wait()
+    try:
+        with open(result_path, encoding='utf-8') as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        result = {'ok': False, 'error': 'El proceso del caso terminó sin resultado (ver cases.log)'}
+    finally:
+        os.remove(result_path)
+    result['peak_rss_mb'] = peak_rss_mb
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Suite
+# ---------------------------------------------------------------------------
+
+def build_cases(args, media_dir: str) -> list:
+    cases = []
+    kinds = set(args.only.split(','))
+    durations = [int(d) for d in args.durations.split(',') if d]
+    if 'encode' in kinds:
+        for duration in durations:
+            for resolution in args.resolutions.split(','):
+                media = generate_video(media_dir, duration, resolution)
+                for target in args.formats.split(','):
+                    # AVI y MP3 no tienen camino GPU: solo CPU
+                    modes = [False] if target in ('avi', 'mp3') or args.no_gpu else [False, True]
+                    for gpu in modes:
+                        cases.append({
+                            'id': f"encode/{target}/{'gpu' if gpu else 'cpu'}/{resolution}/{duration}s",
+                            'kind': 'encode', 'target': target, 'gpu': gpu,
+                            'media': media, 'duration': duration, 'resolution': resolution,
+                        })
+    if 'whisper' in kinds:
+        from app import WHISPER_AVAILABLE
+        if not WHISPER_AVAILABLE:
+            print("⚠️  Whisper no está disponible: se omiten los casos de transcripción")
+            durations = []
+        for duration in durations:
+            media, source = generate_speech(media_dir, duration)
+            for model in args.whisper_sizes.split(','):
+                cases.append({'id': f"whisper/{model}/cpu/{duration}s", 'kind': 'whisper', 'model': model,
+                              'media': media, 'duration': duration, 'speech_source': source})
+    if 'srt' in kinds:
+        cases.append({'id': f"srt/write/{SRT_SEGMENTS}", 'kind': 'srt', 'segments': SRT_SEGMENTS})
+    if 'translate' in kinds:
+        cases.append({'id': f"translate/stub/{TRANSLATE_SEGMENTS}", 'kind': 'translate',
+                      'segments': TRANSLATE_SEGMENTS, 'latency': TRANSLATE_LATENCY})
+    return cases
+
+def environment_info() -> dict:
+    from app import ffmpeg_caps, WHISPER_AVAILABLE
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                         stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        commit = None
+    binary = ffmpeg_caps.load().get('binary') or {}
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': binary.get('version'),
+        'nvenc': sorted(e for e in ('h264_nvenc', 'hevc_nvenc', 'av1_nvenc') if ffmpeg_caps.has('encoders', e)),
+        'whisper': WHISPER_AVAILABLE,
+    }
+
+def pick_median(runs: list) -> dict:
+    """Con --repeat, se reporta la corrida de tiempo mediano (y los tiempos de todas)"""
+    ok = [r for r in runs if r.get('ok')]
+    if not ok:
+        return runs[-1]
+    ok.sort(key=lambda r: r['wall_s'])
+    result = dict(ok[len(ok) // 2])
+    if len(runs) > 1:
+        result['wall_s_runs'] = [round(r['wall_s'], 4) for r in ok]
+        result['wall_s_stdev'] = statistics.pstdev(r['wall_s'] for r in ok)
+    return result
+
+def format_metric(value) -> str:
+    return '-' if value is None else f"{value:.2f}"
+
+def run_suite(args) -> dict:
+    work_dir = os.path.abspath(args.work_dir)
+    media_dir = os.path.join(work_dir, 'media')
+    os.makedirs(media_dir, exist_ok=True)
+    print("🧪 BENCHMARK DEL MOTOR")
+    print("=" * 60)
+    # Las capacidades de ffmpeg se sondean una vez aquí; los casos las leen de la caché en disco
+    from app import ffmpeg_caps
+    ffmpeg_caps.load()
+    print("🎞️  Generando medios sintéticos...")
+    cases = build_cases(args, media_dir)
+    print(f"📋 {len(cases)} casos, {args.repeat} repetición(es) cada uno")
+    print("-" * 60)
+
+    results = []
+    for n, case in enumerate(cases, 1):
+        runs = [run_case(case, work_dir) for _ in range(args.repeat)]
+        result = {**case, **pick_median(runs)}
+        result.pop('media', None)
+        results.append(result)
+        if result['ok']:
+            extra = f"  [{result['encoder']}{' fallback' if result.get('gpu_fallback') else ''}]" if 'encoder' in result else ''
+            print(f"[{n}/{len(cases)}] {case['id']:<42} {result['wall_s']:8.2f}s  "
+                  f"x{format_metric(result.get('realtime'))}  fps {format_metric(result.get('fps'))}  "
+                  f"RSS {format_metric(result['peak_rss_mb'])} MB{extra}")
+        else:
+            print(f"[{n}/{len(cases)}] {case['id']:<42} ❌ {result['error']}")
+    return {'environment': environment_info(), 'results': results}
+
+
+# ---------------------------------------------------------------------------
+# Comparación
+# ---------------------------------------------------------------------------
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Compara dos corridas caso por caso y retorna las regresiones: métricas que empeoran más
+    de threshold % en la dirección mala, o casos que pasaban y ahora fallan
+    """
+    base = {r['id']: r for r in baseline['results']}
+    regressions = []
+    print(f"📊 Comparación (umbral {threshold:.0f}%)")
+    print("-" * 60)
+    for result in current['results']:
+        before = base.get(result['id'])
+        if before is None:
+            continue
+        if before.get('ok') and not result.get('ok'):
+            regressions.append({'id': result['id'], 'metric': 'ok', 'before': True, 'after': False})
+            print(f"❌ {result['id']}: ahora falla ({result.get('error')})")
+            continue
+        for metric, better in METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100.0
+            worse = change > threshold if better == 'lower' else change < -threshold
+            if worse:
+                regressions.append({'id': result['id'], 'metric': metric, 'before': old, 'after': new,
+                                    'change_pct': round(change, 1)})
+            if worse or abs(change) > threshold:
+                mark = '🔴' if worse else '🟢'
+                print(f"{mark} {result['id']:<42} {metric:<12} {old:10.2f} → {new:10.2f} ({change:+.1f}%)")
+    missing = set(base) - {r['id'] for r in current['results']}
+    if missing:
+        print(f"ℹ️  {len(missing)} caso(s) de la base no se ejecutaron ahora")
+    print("-" * 60)
+    print(f"{'❌' if regressions else '✅'} {len(regressions)} regresión(es)")
+    return regressions
+
+def load_results(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del conversor con medios sintéticos')
+    parser.add_argument('--quick', action='store_true', help='Pasada corta: 5s a 640x360, Whisper tiny')
+    parser.add_argument('--only', default='encode,whisper,srt,translate',
+                        help='Tipos de caso separados por comas (encode,whisper,srt,translate)')
+    parser.add_argument('--formats', default=None, help='Formatos destino a medir. Default: todos menos srt')
+    parser.add_argument('--durations', default=DEFAULT_DURATIONS, help=f'Duraciones en segundos. Default: {DEFAULT_DURATIONS}')
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS, help=f'Resoluciones. Default: {DEFAULT_RESOLUTIONS}')
+    parser.add_argument('--whisper-sizes', default=DEFAULT_WHISPER_SIZES, help=f'Modelos Whisper. Default: {DEFAULT_WHISPER_SIZES}')
+    parser.add_argument('--no-gpu', action='store_true', help='No medir el camino GPU (ni su fallback)')
+    parser.add_argument('--repeat', type=int, default=1, metavar='N', help='Repeticiones por caso (se reporta la mediana)')
+    parser.add_argument('--work-dir', default=os.path.join('cache', 'benchmark'), help='Carpeta para medios y temporales')
+    parser.add_argument('--output', default='benchmark-results.json', help='Archivo JSON de resultados')
+    parser.add_argument('--baseline', metavar='FILE', help='Comparar la corrida contra un resultado anterior')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='Solo comparar dos archivos de resultados')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Porcentaje que cuenta como regresión. Default: 10')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case_inline(json.loads(args.case))
+        return
+    # Caché propia (capacidades de ffmpeg, sin resultados de corridas reales); la heredan los casos
+    os.environ.setdefault('CONVERTER_CACHE_DIR', os.path.join(os.path.abspath(args.work_dir), 'cache'))
+
+    if args.compare:
+        regressions = compare(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    if not shutil.which('ffmpeg'):
+        print("❌ ffmpeg no encontrado en el PATH")
+        sys.exit(1)
+    if args.formats is None:
+        from app import TARGET_FORMATS
+        args.formats = ','.join(t for t in TARGET_FORMATS if t != 'srt')
+    if args.quick:
+        args.durations, args.resolutions, args.whisper_sizes = '5', '640x360', 'tiny'
+    args.repeat = max(1, args.repeat)
+
+    start = time.time()
+    report = run_suite(args)
+    report['environment']['suite_wall_s'] = time.time() - start
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print("-" * 60)
+    print(f"💾 Resultados: {args.output}  ({time.time() - start:.1f}s)")
+
+    if args.baseline:
+        regressions = compare(load_results(args.baseline), report, args.threshold)
+        sys.exit(1 if regressions else 0)
+    sys.exit(0 if all(r['ok'] for r in report['results']) else 1)
+
+if __name__ == "__main__":
+    main()
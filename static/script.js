@@ -12,12 +12,14 @@ const bar = document.getElementById('bar');
 const barPct = document.getElementById('bar-pct');
 const logsEl = document.getElementById('logs');
 const downloadLink = document.getElementById('download-link');
+const traceLink = document.getElementById('trace-link');
 
 // Manejar cambio de formato para deshabilitar GPU en MP3 y mostrar opciones SRT
 formatSelect.addEventListener('change', () => {
   const isAudioOnly = formatSelect.value === 'mp3';
   const isSrt = formatSelect.value === 'srt';
   const srtOptions = document.getElementById('srt-options');
+  document.getElementById('hls-options').classList.toggle('hidden', formatSelect.value !== 'hls');
 
   if (isAudioOnly) {
     gpuCheckbox.checked = false;
@@ -74,6 +76,7 @@ function resetProgress() {
   setProgress(0);
   progressArea.classList.add('hidden');
   downloadLink.classList.add('hidden');
+  traceLink.classList.add('hidden');
 }
 
 fileInput.addEventListener('change', () => {
@@ -95,6 +98,34 @@ form.addEventListener('submit', async (e) => {
   progressArea.classList.remove('hidden');
 
   const data = new FormData(form);
+  const file = fileInput.files[0];
+
+  // Para video/audio, el archivo se envía en streaming y ffmpeg convierte mientras se sube
+  // (la codificación segmentada y HLS necesitan el archivo completo en disco)
+  const segmented = document.getElementById('segmented').checked;
+  const multi = form.querySelectorAll('input[name="formats"]:checked').length > 0;
+  if (!['srt', 'hls'].includes(formatSelect.value) && !segmented && !multi && file) {
+    data.delete('file');
+    data.append('filename', file.name);
+    const resp = await fetch('/jobs', { method: 'POST', body: data });
+    if (!resp.ok) {
+      const txt = await resp.text();
+      logsEl.textContent = 'Error al iniciar conversión: ' + txt;
+      return;
+    }
+    const { job_id, upload_url } = await resp.json();
+    watchJob(job_id);
+    const up = await fetch(upload_url, {
+      method: 'PUT',
+      body: file,
+      headers: { 'Content-Type': 'application/octet-stream' },
+    });
+    if (!up.ok) {
+      logsEl.textContent += '\nError al subir el archivo: ' + (await up.text());
+    }
+    return;
+  }
+
   const resp = await fetch('/convert', { method: 'POST', body: data });
   if (!resp.ok) {
     const txt = await resp.text();
@@ -102,25 +133,68 @@ form.addEventListener('submit', async (e) => {
     return;
   }
   const { job_id, download_url } = await resp.json();
+  watchJob(job_id);
+});
+
+function formatEta(seconds) {
+  const s = Math.max(0, Math.round(seconds));
+  const mm = String(Math.floor(s / 60) % 60).padStart(2, '0');
+  const ss = String(s % 60).padStart(2, '0');
+  return s >= 3600 ? `${Math.floor(s / 3600)}:${mm}:${ss}` : `${mm}:${ss}`;
+}
+
+function appendLog(text) {
+  logsEl.textContent += text + '\n';
+  logsEl.scrollTop = logsEl.scrollHeight;
+}
 
-  const es = new EventSource(`/progress/${job_id}`);
-  es.addEventListener('log', (ev) => {
-    logsEl.textContent += ev.data + '\n';
-    logsEl.scrollTop = logsEl.scrollHeight;
+function watchJob(job_id) {
+  // El log completo de ffmpeg solo se pide si el usuario lo activa
+  const raw = document.getElementById('raw-logs').checked;
+  const progressive = document.getElementById('progressive').checked &&
+    ['mp4', 'mkv'].includes(formatSelect.value);
+  const es = new EventSource(`/progress/${job_id}${raw ? '?raw=1' : ''}`);
+  es.addEventListener('log', (ev) => appendLog(ev.data));
+  es.addEventListener('ffmpeg', (ev) => appendLog(ev.data));
+  es.addEventListener('queue', (ev) => {
+    const data = JSON.parse(ev.data);
+    if (data.position > 0) {
+      barPct.textContent = `En cola (posición ${data.position})`;
+    }
   });
   es.addEventListener('progress', (ev) => {
-    setProgress(parseFloat(ev.data));
+    const data = JSON.parse(ev.data);
+    setProgress(data.progress);
+    const details = [];
+    if (data.fps) details.push(`${data.fps.toFixed(0)} fps`);
+    if (data.speed) details.push(`${data.speed.toFixed(2)}x`);
+    if (data.eta != null) details.push(`ETA ${formatEta(data.eta)}`);
+    if (details.length) barPct.textContent += ' · ' + details.join(' · ');
   });
   es.addEventListener('status', (ev) => {
     const data = JSON.parse(ev.data);
-    if (data.status === 'done') {
+    if (data.status === 'running' && progressive) {
+      // La salida fragmentada se puede descargar mientras crece
+      downloadLink.href = `/download/${job_id}`;
+      downloadLink.textContent = 'Descargar (en progreso)';
+      downloadLink.classList.remove('hidden');
+    } else if (data.status === 'done') {
       setProgress(100);
       downloadLink.href = `/download/${job_id}`;
+      downloadLink.textContent = 'Descargar convertido';
       downloadLink.classList.remove('hidden');
+      showTrace(job_id);
       es.close();
     } else if (data.status === 'error') {
       logsEl.textContent += '\nERROR: ' + (data.error || 'fallo desconocido');
+      showTrace(job_id);
       es.close();
     }
   });
-});
+}
+
+function showTrace(job_id) {
+  // Etapas del job (y perfil si se pidió) en formato de trace events de Chrome
+  traceLink.href = `/jobs/${job_id}/trace`;
+  traceLink.classList.remove('hidden');
+}